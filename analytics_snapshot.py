@@ -0,0 +1,322 @@
+"""Incremental columnar snapshot of chat_history for the admin analytics.
+
+Chats are exported to date-partitioned Parquet files
+(analytics/chat_history/date=YYYY-MM-DD/part-*.parquet). Each run only
+appends chats inserted since the stored watermark, so the admin pages can
+scan months of history without touching MongoDB.
+
+The watermark follows inserted_at, the time a chat reached the database
+(chats replayed from the write spool get the replay time), not the time
+it was asked. Chats do not become visible in inserted_at order: writers
+commit out of order and the export reads from a secondary that lags the
+primary. So each run re-scans the EXPORT_LOOKBACK before the watermark
+and skips the chats it already exported there (recent_ids).
+
+Run standalone with `python analytics_snapshot.py`, or let the admin page
+start it as a background thread via start_snapshot_job().
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytz
+from bson import ObjectId
+from database import analytics_chat_collection
+
+SNAPSHOT_ROOT = "./analytics"
+SNAPSHOT_DIR = os.path.join(SNAPSHOT_ROOT, "chat_history")
+WATERMARK_FILE = os.path.join(SNAPSHOT_ROOT, "watermark.json")
+LOCK_FILE = os.path.join(SNAPSHOT_ROOT, ".lock")
+
+EXPORT_BATCH_SIZE = 10000
+EXPORT_INTERVAL = 300  # seconds between background exports
+# How late a chat may become visible to the export and still be exported
+EXPORT_LOOKBACK = timedelta(minutes=10)
+
+SNAPSHOT_SCHEMA = pa.schema([
+    ("chat_id", pa.string()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("user_id", pa.string()),
+    ("course_inquiry", pa.string()),
+    ("user_message", pa.string()),
+    ("bot_response", pa.string()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def read_watermark():
+    """Get the export position as {"inserted_at", "recent_ids", "exported_at"}, or None.
+
+    inserted_at is the latest insert time exported, and recent_ids maps
+    the chats exported within EXPORT_LOOKBACK of it to their insert time.
+    A watermark written before chats had inserted_at holds the
+    (timestamp, chat_id) of the last exported chat instead; the next
+    export finishes the chats after it first.
+    """
+    if not os.path.exists(WATERMARK_FILE):
+        return None
+    with open(WATERMARK_FILE) as f:
+        watermark = json.load(f)
+    watermark["exported_at"] = datetime.fromisoformat(watermark["exported_at"])
+    if "recent_ids" not in watermark:
+        watermark["timestamp"] = datetime.fromisoformat(watermark["timestamp"])
+        watermark["inserted_at"] = watermark["timestamp"]
+        return watermark
+    watermark["inserted_at"] = datetime.fromisoformat(watermark["inserted_at"])
+    watermark["recent_ids"] = {
+        chat_id: datetime.fromisoformat(inserted_at) for chat_id, inserted_at in watermark["recent_ids"].items()
+    }
+    return watermark
+
+
+def _write_watermark(position):
+    tmp_path = WATERMARK_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({**position, "exported_at": datetime.now(timezone.utc).isoformat()}, f)
+    os.replace(tmp_path, WATERMARK_FILE)
+
+
+def _utc(value):
+    # pymongo returns naive UTC datetimes
+    return value.replace(tzinfo=timezone.utc)
+
+
+def _to_table(chats):
+    """Convert a batch of chat documents to an Arrow table plus IST dates"""
+    frame = pd.DataFrame({
+        "chat_id": [str(chat["_id"]) for chat in chats],
+        # pymongo returns naive UTC datetimes
+        "timestamp": pd.to_datetime([chat["timestamp"] for chat in chats], utc=True),
+        "user_id": [chat.get("user_id") for chat in chats],
+        "course_inquiry": [chat.get("course_inquiry") for chat in chats],
+        "user_message": [chat.get("user_message") for chat in chats],
+        "bot_response": [chat.get("bot_response") for chat in chats],
+    })
+    dates = frame["timestamp"].dt.tz_convert("Asia/Kolkata").dt.strftime("%Y-%m-%d")
+    return pa.Table.from_pandas(frame, schema=SNAPSHOT_SCHEMA, preserve_index=False), dates
+
+
+def _write_batch(chats):
+    table, dates = _to_table(chats)
+    batch_id = uuid.uuid4().hex
+    for date in dates.unique():
+        partition_dir = os.path.join(SNAPSHOT_DIR, f"date={date}")
+        os.makedirs(partition_dir, exist_ok=True)
+        rows = pa.array((dates == date).to_numpy())
+        pq.write_table(table.filter(rows), os.path.join(partition_dir, f"part-{batch_id}.parquet"))
+
+
+def _save_position(newest, recent_ids):
+    """Write the watermark with the recent_ids within EXPORT_LOOKBACK of `newest`, and return those"""
+    recent_ids = {
+        chat_id: inserted_at for chat_id, inserted_at in recent_ids.items()
+        if inserted_at >= newest - EXPORT_LOOKBACK
+    }
+    _write_watermark({
+        "inserted_at": newest.isoformat(),
+        "recent_ids": {chat_id: inserted_at.isoformat() for chat_id, inserted_at in recent_ids.items()}
+    })
+    return recent_ids
+
+
+def _exported_since(since):
+    """{chat_id: timestamp} of snapshot chats asked at or after `since` (the caller holds the lock)"""
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return {}
+    dataset = ds.dataset(
+        SNAPSHOT_DIR,
+        format="parquet",
+        schema=SNAPSHOT_SCHEMA.append(pa.field("date", pa.string())),
+        partitioning=PARTITIONING
+    )
+    condition = (
+        (ds.field("date") >= since.astimezone(pytz.timezone('Asia/Kolkata')).strftime("%Y-%m-%d"))
+        & (ds.field("timestamp") >= pa.scalar(since, type=pa.timestamp("us", tz="UTC")))
+    )
+    table = dataset.to_table(columns=["chat_id", "timestamp"], filter=condition)
+    return dict(zip(table.column("chat_id").to_pylist(), table.column("timestamp").to_pylist()))
+
+
+def _export_legacy_chats(watermark):
+    """Export chats saved without inserted_at after a (timestamp, chat_id) watermark, as earlier versions did.
+
+    Returns (count exported, timestamp of the last chat exported, {chat_id:
+    timestamp} of the snapshot's chats within EXPORT_LOOKBACK of it).
+    """
+    exported = 0
+    timestamp = watermark["timestamp"] if watermark else None
+    chat_id = ObjectId(watermark["chat_id"]) if watermark else None
+    recent_ids = _exported_since(timestamp - EXPORT_LOOKBACK) if timestamp else {}
+    while True:
+        query = {"inserted_at": {"$exists": False}}
+        if timestamp:
+            # Stored as UTC; pymongo compares naive datetimes as UTC
+            query["$or"] = [
+                {"timestamp": {"$gt": timestamp.replace(tzinfo=None)}},
+                {"timestamp": timestamp.replace(tzinfo=None), "_id": {"$gt": chat_id}}
+            ]
+        chats = list(
+            analytics_chat_collection.find(query)
+            .sort([("timestamp", 1), ("_id", 1)])
+            .limit(EXPORT_BATCH_SIZE)
+        )
+        if not chats:
+            return exported, timestamp, recent_ids
+        _write_batch(chats)
+        timestamp, chat_id = _utc(chats[-1]["timestamp"]), chats[-1]["_id"]
+        _write_watermark({"timestamp": timestamp.isoformat(), "chat_id": str(chat_id)})
+        recent_ids = {i: t for i, t in recent_ids.items() if t >= timestamp - EXPORT_LOOKBACK}
+        recent_ids.update((str(chat["_id"]), _utc(chat["timestamp"])) for chat in chats)
+        exported += len(chats)
+
+
+def _export_stragglers(newest, recent_ids):
+    """Export chats saved without inserted_at, by a server still running an earlier version,
+    within EXPORT_LOOKBACK of `newest`; adds them to recent_ids. Returns the count exported."""
+    chats = [
+        chat for chat in analytics_chat_collection.find({
+            "inserted_at": {"$exists": False},
+            "timestamp": {"$gte": (newest - EXPORT_LOOKBACK).replace(tzinfo=None)}
+        })
+        if str(chat["_id"]) not in recent_ids
+    ]
+    if chats:
+        _write_batch(chats)
+    for chat in chats:
+        recent_ids[str(chat["_id"])] = _utc(chat["timestamp"])
+    return len(chats)
+
+
+def export_new_chats():
+    """Append chats inserted since the watermark to the snapshot. Returns the count exported."""
+    os.makedirs(SNAPSHOT_ROOT, exist_ok=True)
+    with open(LOCK_FILE, "w") as lock:
+        # Only one exporter at a time, even across Streamlit processes
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        watermark = read_watermark()
+        if watermark is None or "recent_ids" not in watermark:
+            exported, newest, recent_ids = _export_legacy_chats(watermark)
+        else:
+            exported, newest, recent_ids = 0, watermark["inserted_at"], watermark["recent_ids"]
+        if newest:
+            exported += _export_stragglers(newest, recent_ids)
+            recent_ids = _save_position(newest, recent_ids)
+
+        # Keyset over this run's scan: (inserted_at, _id) of the last chat read
+        after = None
+        while True:
+            conditions = [{"inserted_at": {"$gte": newest - EXPORT_LOOKBACK} if newest else {"$exists": True}}]
+            if after:
+                conditions.append({"$or": [
+                    {"inserted_at": {"$gt": after[0]}},
+                    {"inserted_at": after[0], "_id": {"$gt": after[1]}}
+                ]})
+            batch = list(
+                analytics_chat_collection.find({"$and": conditions})
+                .sort([("inserted_at", 1), ("_id", 1)])
+                .limit(EXPORT_BATCH_SIZE)
+            )
+            if not batch:
+                return exported
+            after = (batch[-1]["inserted_at"], batch[-1]["_id"])
+            chats = [chat for chat in batch if str(chat["_id"]) not in recent_ids]
+            if chats:
+                _write_batch(chats)
+            recent_ids.update((str(chat["_id"]), _utc(chat["inserted_at"])) for chat in chats)
+            newest = max(filter(None, [newest, _utc(after[0])]))
+            recent_ids = _save_position(newest, recent_ids)
+            exported += len(chats)
+
+
+def compact_partitions():
+    """Merge the small append files of past days into one file per day.
+
+    The merged file is in place before its sources are removed, so a crash
+    in between leaves the day's chats twice rather than losing them; the
+    next compaction of that day drops the copies.
+    """
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+    today = datetime.now(pytz.timezone('Asia/Kolkata')).strftime("%Y-%m-%d")
+    with open(LOCK_FILE, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        for partition in sorted(os.listdir(SNAPSHOT_DIR)):
+            partition_dir = os.path.join(SNAPSHOT_DIR, partition)
+            files = sorted(f for f in os.listdir(partition_dir) if f.endswith(".parquet"))
+            if partition >= f"date={today}" or len(files) < 2:
+                continue
+            paths = [os.path.join(partition_dir, f) for f in files]
+            table = pa.concat_tables([pq.read_table(path, schema=SNAPSHOT_SCHEMA) for path in paths])
+            table = table.filter(pa.array(~table.column("chat_id").to_pandas().duplicated()))
+            # Files starting with "_" are skipped by dataset readers
+            tmp_path = os.path.join(partition_dir, "_compacting.parquet")
+            pq.write_table(table.sort_by("timestamp"), tmp_path)
+            os.replace(tmp_path, os.path.join(partition_dir, f"part-compacted-{uuid.uuid4().hex}.parquet"))
+            for path in paths:
+                os.remove(path)
+
+
+def load_chats(start_date=None, end_date=None, columns=None, user_id=None, course_inquiry=None):
+    """Query the snapshot as a DataFrame.
+
+    start_date and end_date are inclusive IST dates and prune whole
+    partitions; the other filters are evaluated column-wise by Arrow.
+    A `date` column (IST calendar date) is always included.
+    """
+    columns = list(dict.fromkeys((columns or SNAPSHOT_SCHEMA.names) + ["date"]))
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return pd.DataFrame(columns=columns)
+    filters = []
+    if start_date:
+        filters.append(ds.field("date") >= start_date.strftime("%Y-%m-%d"))
+    if end_date:
+        filters.append(ds.field("date") <= end_date.strftime("%Y-%m-%d"))
+    if user_id:
+        filters.append(ds.field("user_id") == user_id)
+    if course_inquiry:
+        filters.append(ds.field("course_inquiry") == course_inquiry)
+    condition = None
+    for f in filters:
+        condition = f if condition is None else condition & f
+    with open(LOCK_FILE, "w") as lock:
+        # Shared lock so compaction never removes files mid-scan
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        dataset = ds.dataset(
+            SNAPSHOT_DIR,
+            format="parquet",
+            schema=SNAPSHOT_SCHEMA.append(pa.field("date", pa.string())),
+            partitioning=PARTITIONING
+        )
+        df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df
+
+
+def run_snapshot_job(interval=EXPORT_INTERVAL):
+    """Export new chats every `interval` seconds, compacting closed days as we go"""
+    while True:
+        try:
+            exported = export_new_chats()
+            if exported:
+                compact_partitions()
+        except Exception as e:
+            print(f"Error exporting analytics snapshot: {str(e)}")
+        time.sleep(interval)
+
+
+def start_snapshot_job():
+    """Start run_snapshot_job() in a daemon thread"""
+    thread = threading.Thread(target=run_snapshot_job, daemon=True, name="analytics-snapshot")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    run_snapshot_job()
@@ -1,16 +1,40 @@
 import streamlit as st
 import google.generativeai as genai
-import json
+import math
 from datetime import datetime
 import pytz
 import speech_recognition as sr
 import pyttsx3
-from database import init_database, get_course_data, save_chat, get_or_create_user_session
+from database import (
+    init_database,
+    save_chat,
+    get_or_create_user_session,
+    get_browser_fingerprint,
+    write_spool
+)
+from conversation import (
+    init_conversation,
+    add_turn,
+    context_turns,
+    has_earlier_turns,
+    load_earlier_turns,
+    hide_earlier_turns,
+    track_memory
+)
+from assets import get_image
 import edge_tts
 import asyncio
 import os
 import threading
+import time
 import uuid
+from metrics import is_fragment_rerun, record_rerun
+from tracing import trace_request, start_metrics_server
+from rate_limit import check_rate_limit
+from cache import get_cached_course_data, answer_cache, answer_key
+from assistant import GEMINI_MODEL, build_request, example_questions
+from warmup import start_warmup
+from retrieval import retrieve
 
 # Must be the first Streamlit command
 st.set_page_config(
@@ -26,53 +50,65 @@ st.set_page_config(
 if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = False
 
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []  # (user_msg, bot_msg, timestamp)
+init_conversation()
 
 if 'current_question' not in st.session_state:
     st.session_state.current_question = ""
 
-if 'chat' not in st.session_state:
-    st.session_state.chat = None  # will initialize after model
+# Everything outside the fragments below only runs on full reruns
+record_rerun()
+
+
+@st.cache_resource(show_spinner=False)
+def setup_database():
+    """Seed the database once per server process instead of on every rerun"""
+    init_database()
+    # Replay chats spooled by processes that stopped before the database came back
+    write_spool.start_replayer()
+
 
-# Initialize database and get user session
-init_database()
+# Initialize database and get user session; seeding is retried on the next
+# rerun if the database is unavailable
+try:
+    setup_database()
+except Exception as e:
+    print(f"Error initializing database: {str(e)}")
 user_id = get_or_create_user_session()
+if 'fingerprint' not in st.session_state:
+    st.session_state.fingerprint = get_browser_fingerprint()
 
 # Configure Gemini AI
 GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
 genai.configure(api_key=GOOGLE_API_KEY)
 
-# Initialize Gemini model & chat
-model = genai.GenerativeModel('gemini-2.0-flash')
-if st.session_state.chat is None:
-    st.session_state.chat = model.start_chat(history=[])
-
-# Get course data from database
-data = {"courses": get_course_data()}
-
-# AI Context
-context = f"""
-You are a helpful university admission counselor chatbot. You have information about the following courses:
-
-{json.dumps(data, indent=2)}
-
-Key points to remember:
-1. Always be polite and professional
-2. Provide accurate information about courses based on the data provided
-3. Handle general queries and greetings naturally
-4. If asked about information not in the data, politely say you can only provide information about the listed courses
-5. Keep responses concise but informative
-6. Use appropriate emojis to make responses engaging
-7. Format responses using markdown for better readability
-
-Example interactions:
-- Greet users warmly
-- Answer questions about course duration, fees, and subjects
-- Provide guidance on admission process
-- Handle small talk naturally
-- Stay focused on academic and admission related queries
-"""
+
+@st.cache_resource(show_spinner=False)
+def llm_slots():
+    """Cap concurrent Gemini calls per process; time spent waiting is traced as queue_wait"""
+    return threading.BoundedSemaphore(int(st.secrets.get("MAX_CONCURRENT_LLM_CALLS", 8)))
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_endpoint():
+    """Serve Prometheus stage latencies on METRICS_HOST:METRICS_PORT, once per process"""
+    return start_metrics_server(
+        int(st.secrets.get("METRICS_PORT", 9464)),
+        st.secrets.get("METRICS_HOST", "127.0.0.1")
+    )
+
+
+metrics_endpoint()
+
+
+@st.cache_resource(show_spinner=False)
+def answer_warmup():
+    """Precompute example answers for the current catalog once per process"""
+    if st.secrets.get("WARMUP_ON_START", True):
+        start_warmup()
+
+
+answer_warmup()
+
 
 # -------------------------------
 # TTS Initialization
@@ -85,15 +121,62 @@ if len(voices) > 1:
     engine.setProperty('voice', voices[1].id)
 
 
-def get_ai_response(user_input):
-    try:
-        prompt = f"Context: {context}\n\nUser: {user_input}\n\nResponse:"
-        response = st.session_state.chat.send_message(prompt)
-        save_chat(user_input, response.text)
-        return response.text
-    except Exception as e:
-        st.error("An error occurred while getting a response from the AI. Please try again.")
-        return f"I apologize, but I encountered an error: {str(e)}"
+def get_ai_response(user_input, cached_only=False):
+    """Answer `user_input`. With cached_only, only a stored answer is used
+    (whatever the conversation so far) and None is returned without one."""
+    with trace_request("chat", user_id=user_id) as trace:
+        try:
+            with trace.span("retrieval"):
+                courses, catalog_version = get_cached_course_data()
+                history = [] if cached_only else context_turns(user_id)
+                # An opening question's answer depends only on the catalog, so
+                # every replica can reuse it
+                cache_key = None if history else answer_key(user_input, catalog_version)
+                response_text = answer_cache.get(cache_key) if cache_key else None
+                # Searched before taking a Gemini slot, so the search does not hold one
+                passages = retrieve(user_input) if response_text is None and not cached_only else None
+            trace.attributes["answer_cache"] = "hit" if response_text else ("miss" if cache_key else "skip")
+            if response_text is None and cached_only:
+                return None
+            # Stored with the chat for the Cost & Latency dashboard
+            usage = {"model": None, "cached": True, "input_tokens": 0, "output_tokens": 0}
+            if response_text is None:
+                trace.attributes["passages"] = len(passages)
+                with trace.span("queue_wait"):
+                    llm_slots().acquire()
+                try:
+                    with trace.span("prompt"):
+                        model, contents = build_request(courses, history, user_input, passages)
+                    with trace.span("model"):
+                        # Stream so the time to the first token can be measured
+                        start = time.perf_counter()
+                        chunks = []
+                        response = model.generate_content(contents, stream=True)
+                        for chunk in response:
+                            if not chunks:
+                                first_token = time.perf_counter() - start
+                                trace.record("first_token", first_token, start)
+                            chunks.append(chunk.text)
+                        response_text = "".join(chunks)
+                        usage = {
+                            "model": GEMINI_MODEL,
+                            "cached": False,
+                            "input_tokens": getattr(response.usage_metadata, "prompt_token_count", 0) or 0,
+                            "output_tokens": getattr(response.usage_metadata, "candidates_token_count", 0) or 0,
+                            "first_token_ms": round(first_token * 1000, 1) if chunks else None,
+                        }
+                finally:
+                    llm_slots().release()
+                if cache_key and response_text:
+                    answer_cache.set(cache_key, response_text)
+            usage["latency_ms"] = trace.elapsed_ms()
+            with trace.span("persistence"):
+                save_chat(user_input, response_text, usage, catalog_version)
+            return response_text
+        except Exception as e:
+            trace.status = "error"
+            st.error("An error occurred while getting a response from the AI. Please try again.")
+            return f"I apologize, but I encountered an error: {str(e)}"
 
 
 # Speech-to-Text Function
@@ -133,23 +216,23 @@ def stop_text_to_speech():
         engine.stop()
 
 
-# Example questions
-example_questions = [
-    "Hi! Can you help me with course information?",
-    "What courses do you offer?",
-    "Tell me about B.Tech program",
-    "What is the fee structure for BCA?",
-    "What subjects are taught in B.Sc first semester?",
-    "How long is the B.Tech program?",
-    "What are the subjects in BCA?",
-    "Tell me about admission process",
-    "What is the duration of B.Sc?",
-    "Can you compare B.Tech and BCA programs?"
-]
 
 
 def set_question(question):
-    st.session_state.current_question = question
+    # Examples usually have a precomputed answer, which is shown right away;
+    # otherwise the question is put in the input bar as before
+    ai_response = get_ai_response(question, cached_only=True)
+    if ai_response is None:
+        st.session_state.current_question = question
+    else:
+        add_turn(user_id, question, ai_response, chat_timestamp())
+        st.session_state.current_question = ""
+    # Only the chat panel shows the question, so skip the full-app rerun
+    st.rerun("chat_panel")
+
+
+def chat_timestamp():
+    return datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%H:%M:%S.%f')
 
 
 # -------------------------------
@@ -466,7 +549,7 @@ if st.session_state.dark_mode:
 # Layout: Sidebar
 # -------------------------------
 with st.sidebar:
-    st.image("./Resources/rbu.jpeg", use_container_width=True)
+    st.image(get_image("rbu.jpeg"), use_container_width=True)
 
     st.markdown("""
         <div class="sidebar-section">
@@ -484,9 +567,13 @@ with st.sidebar:
         # Wrap with class for styling
         with st.container():
             st.markdown("<div class='example-question-btn'>", unsafe_allow_html=True)
-            if st.button(f"{question}", key=f"btn_{question}", use_container_width=True):
-                set_question(question)
-                st.rerun()
+            st.button(
+                f"{question}",
+                key=f"btn_{question}",
+                use_container_width=True,
+                on_click=set_question,
+                args=(question,)
+            )
             st.markdown("</div>", unsafe_allow_html=True)
 
     st.markdown("</div>", unsafe_allow_html=True)
@@ -531,18 +618,38 @@ st.markdown(
 )
 st.markdown("---")
 
+
 # -------------------------------
-# Chat Display
+# Chat Panel (fragment)
 # -------------------------------
-chat_container = st.container()
-
-with chat_container:
-    st.markdown("<div class='chat-wrapper'>", unsafe_allow_html=True)
-
-    if not st.session_state.chat_history:
-        # Friendly starter message
-        st.markdown(
-            """
+# The chat area and input bar rerun on their own, so a message round trip
+# does not re-inject the CSS or rebuild the sidebar.
+@st.fragment(key="chat_panel")
+def chat_panel():
+    if is_fragment_rerun():
+        record_rerun()
+    track_memory()
+
+    # Chat Display
+    chat_container = st.container()
+
+    with chat_container:
+        st.markdown("<div class='chat-wrapper'>", unsafe_allow_html=True)
+
+        # Older turns stay in MongoDB until asked for
+        if has_earlier_turns():
+            if st.button("⬆️ Load earlier messages", key="load_earlier"):
+                load_earlier_turns(user_id)
+                rerun_chat_panel()
+        if st.session_state.earlier_turns:
+            if st.button("⬇️ Hide earlier messages", key="hide_earlier"):
+                hide_earlier_turns()
+                rerun_chat_panel()
+
+        if not st.session_state.chat_history:
+            # Friendly starter message
+            st.markdown(
+                """
             <div class="chat-message bot-message">
                 <div class="chat-row">
                     <div class="chat-avatar">🤖</div>
@@ -560,19 +667,19 @@ with chat_container:
                 </div>
             </div>
             """,
-            unsafe_allow_html=True
-        )
-
-    for message_data in st.session_state.chat_history:
-        if len(message_data) == 3:
-            user, bot, timestamp = message_data
-        else:
-            user, bot = message_data
-            timestamp = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%H:%M')
-
-        # User message bubble
-        st.markdown(
-            f"""
+                unsafe_allow_html=True
+            )
+
+        for message_data in st.session_state.earlier_turns + st.session_state.chat_history:
+            if len(message_data) == 3:
+                user, bot, timestamp = message_data
+            else:
+                user, bot = message_data
+                timestamp = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%H:%M')
+
+            # User message bubble
+            st.markdown(
+                f"""
             <div class="chat-message user-message">
                 <div class="chat-row">
                     <div class="chat-bubble">
@@ -583,11 +690,11 @@ with chat_container:
                 <div class="timestamp" style="text-align:right;">{timestamp}</div>
             </div>
             """,
-            unsafe_allow_html=True
-        )
+                unsafe_allow_html=True
+            )
 
-        # Bot message bubble
-        st.markdown(f"""
+            # Bot message bubble
+            st.markdown(f"""
 <div class="chat-message bot-message">
     <strong>Assistant:</strong><br>
     {bot}
@@ -596,49 +703,61 @@ with chat_container:
 """, unsafe_allow_html=True)
 
 
-        # Play AI response button
-        #play_key = f"play_{uuid.uuid4()}"
-        if st.button("🔊 Play Response", key=f"play_{timestamp}"):
-            text_to_speech(bot)
+            # Play AI response button
+            #play_key = f"play_{uuid.uuid4()}"
+            if st.button("🔊 Play Response", key=f"play_{timestamp}"):
+                text_to_speech(bot)
 
-    st.markdown("</div></div>", unsafe_allow_html=True)
+        st.markdown("</div></div>", unsafe_allow_html=True)
 
-# -------------------------------
-# Input Bar
-# -------------------------------
-st.markdown("---")
+    # Input Bar
+    st.markdown("---")
 
-with st.container():
-    input_col1, input_col2, input_col3 = st.columns([6, 1, 1])
-
-    with input_col1:
-        user_input = st.text_input(
-            "Ask your question here...",
-            value=st.session_state.current_question,
-            key="input",
-            placeholder="e.g., What courses do you offer?",
-            label_visibility="collapsed"
-        )
-    with input_col2:
-        send_button = st.button("Send 📤", use_container_width=True)
-    with input_col3:
-        voice_button = st.button("🎤 Speak", use_container_width=True)
+    with st.container():
+        input_col1, input_col2, input_col3 = st.columns([6, 1, 1])
+
+        with input_col1:
+            user_input = st.text_input(
+                "Ask your question here...",
+                value=st.session_state.current_question,
+                key="input",
+                placeholder="e.g., What courses do you offer?",
+                label_visibility="collapsed"
+            )
+        with input_col2:
+            send_button = st.button("Send 📤", use_container_width=True)
+        with input_col3:
+            voice_button = st.button("🎤 Speak", use_container_width=True)
+
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    # Voice input
+    if voice_button:
+        user_input = speech_to_text()
+        st.session_state.current_question = user_input
+        rerun_chat_panel()
+
+    # Send text input
+    if send_button and user_input:
+        allowed, retry_after = check_rate_limit(user_id, st.session_state.fingerprint)
+        if not allowed:
+            st.warning(f"⏳ You're sending questions faster than we can answer them. Please wait {math.ceil(retry_after)} seconds and try again.")
+        else:
+            ai_response = get_ai_response(user_input)
+            add_turn(user_id, user_input, ai_response, chat_timestamp())
+            st.session_state.current_question = ""
+            rerun_chat_panel()
 
-    st.markdown("</div>", unsafe_allow_html=True)
 
-# Voice input
-if voice_button:
-    user_input = speech_to_text()
-    st.session_state.current_question = user_input
+def rerun_chat_panel():
+    """Rerun just the chat panel, falling back to a full rerun when the
+    panel is being drawn as part of one"""
+    if is_fragment_rerun():
+        st.rerun(scope="fragment")
     st.rerun()
 
-# Send text input
-if send_button and user_input:
-    ai_response = get_ai_response(user_input)
-    current_time = datetime.now(pytz.timezone('Asia/Kolkata')).strftime('%H:%M:%S.%f')
-    st.session_state.chat_history.append((user_input, ai_response, current_time))
-    st.session_state.current_question = ""
-    st.rerun()
+
+chat_panel()
 
 # -------------------------------
 # Footer
@@ -0,0 +1,56 @@
+import os
+from io import BytesIO
+import streamlit as st
+from PIL import Image
+
+RESOURCE_DIR = "./Resources"
+BUILD_DIR = os.path.join(RESOURCE_DIR, "build")
+
+# Widths (in px) each image is actually displayed at. The sidebar is ~300px
+# wide, so we keep a 1x and a 2x (high-DPI) variant.
+IMAGE_WIDTHS = {
+    "rbu.jpeg": [300, 600],
+}
+
+IMAGE_FORMATS = {
+    "webp": {"quality": 80, "method": 6},
+    "avif": {"quality": 60},
+}
+
+# Format handed to st.image; every browser we support decodes WebP
+SERVE_FORMAT = "webp"
+
+
+def variant_path(name, width, fmt):
+    """Path of a prebuilt variant, e.g. Resources/build/rbu-600.webp"""
+    stem = os.path.splitext(name)[0]
+    return os.path.join(BUILD_DIR, f"{stem}-{width}.{fmt}")
+
+
+def render_variant(name, width, fmt):
+    """Decode the source image, resize it to `width` and encode it as `fmt`"""
+    with Image.open(os.path.join(RESOURCE_DIR, name)) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            image = image.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format=fmt.upper(), **IMAGE_FORMATS[fmt])
+    return buffer.getvalue()
+
+
+@st.cache_resource(show_spinner=False)
+def get_image(name, width=None, fmt=SERVE_FORMAT):
+    """Get the encoded bytes of an image variant.
+
+    Prebuilt files from build_assets.py are used when present; otherwise the
+    variant is rendered here. Either way this happens once per process and
+    every session reuses the same bytes, so Streamlit serves them from one
+    content-hashed media URL the browser can keep cached.
+    """
+    width = width or max(IMAGE_WIDTHS[name])
+    path = variant_path(name, width, fmt)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    return render_variant(name, width, fmt)
@@ -0,0 +1,68 @@
+"""Prompt, model and example questions shared by the chat page and the answer warm-up job."""
+import json
+import google.generativeai as genai
+
+GEMINI_MODEL = 'gemini-2.0-flash'
+
+
+# AI Context
+def build_context(courses):
+    data = {"courses": courses}
+    return f"""
+You are a helpful university admission counselor chatbot. You have information about the following courses:
+
+{json.dumps(data, indent=2)}
+
+Key points to remember:
+1. Always be polite and professional
+2. Provide accurate information about courses based on the data provided
+3. Handle general queries and greetings naturally
+4. If asked about information not in the data, politely say you can only provide information about the listed courses
+5. Keep responses concise but informative
+6. Use appropriate emojis to make responses engaging
+7. Format responses using markdown for better readability
+
+Example interactions:
+- Greet users warmly
+- Answer questions about course duration, fees, and subjects
+- Provide guidance on admission process
+- Handle small talk naturally
+- Stay focused on academic and admission related queries
+"""
+
+
+def build_request(courses, history, question, passages=()):
+    """Model and contents for `question` after the (user, bot, timestamp) turns in `history`.
+
+    The course context goes in once as the system instruction instead of
+    being repeated in every turn of the history. Retrieved `passages` are
+    attached to the question they were found for.
+    """
+    model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=build_context(courses))
+    contents = []
+    for user, bot, _ in history:
+        contents.append({"role": "user", "parts": [user]})
+        contents.append({"role": "model", "parts": [bot]})
+    if passages:
+        reference = "\n\n".join(f"[{p['title']}]\n{p['text']}" for p in passages)
+        question = (
+            "Relevant information from the university website and previously approved answers:\n"
+            f"{reference}\n\nQuestion: {question}"
+        )
+    contents.append({"role": "user", "parts": [question]})
+    return model, contents
+
+
+# Example questions
+example_questions = [
+    "Hi! Can you help me with course information?",
+    "What courses do you offer?",
+    "Tell me about B.Tech program",
+    "What is the fee structure for BCA?",
+    "What subjects are taught in B.Sc first semester?",
+    "How long is the B.Tech program?",
+    "What are the subjects in BCA?",
+    "Tell me about admission process",
+    "What is the duration of B.Sc?",
+    "Can you compare B.Tech and BCA programs?"
+]
@@ -0,0 +1,84 @@
+"""Async counterpart of the dashboard queries in database.py.
+
+Uses PyMongo's asyncio client, configured like database.analytics_client
+(secondary reads), on one background event loop per process, so
+Streamlit's synchronous script can fan several independent queries out
+at once with gather() and wait for the slowest instead of their sum.
+Queries and result shapes come from the builders in database.py, so the
+sync and async paths always agree.
+"""
+import asyncio
+import threading
+from pymongo import AsyncMongoClient
+import database
+from metrics import db_command_listener
+
+_lock = threading.Lock()
+_loop = None
+_db = None
+
+
+def _get_loop():
+    """Start the event loop thread and its client on first use"""
+    global _loop, _db
+    with _lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True, name="async-database").start()
+            client = AsyncMongoClient(
+                database.MONGO_URI,
+                event_listeners=[db_command_listener],
+                **database.ANALYTICS_CLIENT_OPTIONS
+            )
+            _db = client[database.DATABASE_NAME]
+            _loop = loop
+    return _loop
+
+
+def run(coroutine):
+    """Run a coroutine on the database event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_loop()).result()
+
+
+async def gather(**coroutines):
+    """Await keyword coroutines concurrently; returns {keyword: result}"""
+    results = await asyncio.gather(*coroutines.values())
+    return dict(zip(coroutines, results))
+
+
+async def get_user_stats():
+    """Async get_user_stats(): the six counts and the daily-active aggregation run at once"""
+    try:
+        users = _db[database.user_collection.name]
+        today_start, queries, pipeline = database._user_stats_queries()
+
+        async def daily_active():
+            return await (await users.aggregate(pipeline)).to_list(None)
+
+        results = await gather(
+            daily_active=daily_active(),
+            **{name: users.count_documents(query) for name, query in queries.items()}
+        )
+        daily = results.pop("daily_active")
+        return database._user_stats_result(today_start, results, daily)
+    except Exception as e:
+        print(f"Error fetching user stats: {str(e)}")
+        return {}
+
+
+async def get_course_inquiry_stats():
+    chats = _db[database.chat_collection.name]
+    course_stats = await (await chats.aggregate(database._course_inquiry_pipeline())).to_list(None)
+    return database._course_inquiry_result(course_stats)
+
+
+async def get_chat_history(user_id=None, course_inquiry=None, start_date=None, end_date=None):
+    query = database._chat_filter(user_id, course_inquiry, start_date, end_date)
+    return await _db[database.chat_collection.name].find(query).sort("timestamp", -1).to_list(None)
+
+
+async def get_session_stats(start_date=None, end_date=None, gap_minutes=database.SESSION_GAP_MINUTES):
+    chats = _db[database.chat_collection.name]
+    pipeline = database._session_stats_pipeline(start_date, end_date, gap_minutes)
+    rows = await (await chats.aggregate(pipeline, allowDiskUse=True)).to_list(1)
+    return database._session_stats_result(rows[0] if rows else None)
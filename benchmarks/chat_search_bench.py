@@ -0,0 +1,142 @@
+"""Chat search (database.search_chats) over millions of chats.
+
+Needs a local mongod, since the in-memory database has no $text:
+
+    python benchmarks/chat_search_bench.py --mongo-uri mongodb://localhost:27017
+    python benchmarks/chat_search_bench.py --mongo-uri mongodb://localhost:27017 --chats 3000000 --keep
+
+Fills a scratch database (uniassist_search_bench, dropped afterwards
+unless --keep; an existing one of the right size is reused) with
+synthetic chats spread over CHAT_RETENTION_DAYS, in which topic words
+appear at known rates from 30% of chats down to 0.01%. Builds the
+chat_text index as ensure_indexes() does, then times search_chats() for
+each kind of query: rare and common words, a phrase, date and course
+filters, and a deep page. Reports matches, p50/p95 latency and searches
+stopped by SEARCH_TIMEOUT_MS.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytz
+from pymongo.errors import ExecutionTimeout
+
+import harness
+
+BENCH_DATABASE = "uniassist_search_bench"
+INSERT_BATCH = 10000
+
+# Topic words and the share of chats that mention each
+TOPICS = {"fees": 0.30, "admission": 0.10, "hostel": 0.05, "scholarship": 0.01, "ragging": 0.001, "convocation": 0.0001}
+COURSES = ["B.Tech", "B.Sc", "BCA", None]
+FILLER = (
+    "what is the for at in university student semester course please tell me about details "
+    "process last date required documents eligibility campus facilities library timing exam result"
+).split()
+ANSWER = "Here is what I found about {topic}: the university publishes the {topic} details on its website every semester."
+
+QUERIES = {
+    "common word": {"text": "fees"},
+    "medium word": {"text": "hostel"},
+    "rare word": {"text": "convocation"},
+    "two words": {"text": "scholarship admission"},
+    "phrase": {"text": '"hostel fees"'},
+    "common word, one course": {"text": "fees", "course_inquiry": "BCA"},
+    "common word, last 7 days": {"text": "fees", "days": 7},
+    "medium word, page 10": {"text": "hostel", "page": 9},
+}
+
+
+def synthetic_chats(count, days, seed=0):
+    """`count` chats over the last `days` days"""
+    rng = random.Random(seed)
+    now = datetime.now(pytz.timezone('Asia/Kolkata'))
+    span = days * 24 * 3600
+    for i in range(count):
+        topics = [t for t, share in TOPICS.items() if rng.random() < share] or ["campus"]
+        words = rng.sample(FILLER, 6) + topics
+        rng.shuffle(words)
+        yield {
+            "timestamp": now - timedelta(seconds=rng.random() * span),
+            "user_id": f"bench-{i // 5}",
+            "user_message": " ".join(words) + "?",
+            "bot_response": ANSWER.format(topic=topics[0]),
+            "course_inquiry": rng.choice(COURSES),
+        }
+
+
+def fill(collection, count, days):
+    batch = []
+    for chat in synthetic_chats(count, days):
+        batch.append(chat)
+        if len(batch) == INSERT_BATCH:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mongo-uri", required=True, help="local mongod")
+    parser.add_argument("--chats", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=20, help="runs of each query")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch database for the next run")
+    args = parser.parse_args()
+
+    harness.install_database(args.mongo_uri)
+    import database
+
+    collection = database.client[BENCH_DATABASE]["chat_history"]
+    report = {"chats": args.chats}
+    if collection.estimated_document_count() != args.chats:
+        collection.drop()
+        start = time.perf_counter()
+        fill(collection, args.chats, database.CHAT_RETENTION_DAYS)
+        report["fill_s"] = round(time.perf_counter() - start, 1)
+    start = time.perf_counter()
+    # The same index ensure_indexes() creates on chat_history
+    collection.create_index(
+        database.CHAT_TEXT_INDEX,
+        name="chat_text",
+        weights=database.CHAT_TEXT_WEIGHTS,
+        default_language="english"
+    )
+    report["index_s"] = round(time.perf_counter() - start, 1)
+    report["index_mb"] = round(database.client[BENCH_DATABASE].command("collStats", "chat_history")["indexSizes"]["chat_text"] / 1e6, 1)
+
+    # search_chats reads through the analytics client; point it at the scratch collection
+    database.analytics_chat_collection = database.analytics_client[BENCH_DATABASE]["chat_history"]
+    today = datetime.now(pytz.timezone('Asia/Kolkata')).date()
+    report["queries"] = {}
+    try:
+        for name, spec in QUERIES.items():
+            kwargs = {"text": spec["text"], "course_inquiry": spec.get("course_inquiry"), "page": spec.get("page", 0)}
+            if "days" in spec:
+                kwargs["start_date"] = today - timedelta(days=spec["days"])
+            times, timeouts, results = [], 0, []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                try:
+                    results, _ = database.search_chats(**kwargs)
+                except ExecutionTimeout:
+                    timeouts += 1
+                times.append((time.perf_counter() - start) * 1000)
+            query = database._chat_filter(None, kwargs["course_inquiry"], kwargs.get("start_date"), None)
+            query["$text"] = {"$search": spec["text"]}
+            report["queries"][name] = {
+                "matches": collection.count_documents(query),
+                "results": len(results),
+                "ms": {k: round(v, 1) for k, v in harness.percentiles(times, (50, 95)).items()},
+                "timeouts": timeouts,
+            }
+    finally:
+        if not args.keep:
+            database.client.drop_database(BENCH_DATABASE)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
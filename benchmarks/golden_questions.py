@@ -0,0 +1,241 @@
+"""Golden questions: does the assistant still answer correctly, and how fast.
+
+Asks every labelled question in golden_questions.json (course facts from
+the default catalog, website facts, timetable lookups) as the opening
+message of a fresh session, in two passes: cold, then again so opening
+questions can be served from the answer cache. An answer is correct when
+it contains every expected string.
+
+The model is one of:
+- a deterministic fake (default) that answers with the two facts of its
+  prompt closest to the question, so accuracy measures whether the right
+  facts reach the prompt (course catalog and retrieved passages);
+- recorded answers (--replay FILE) from an earlier run against Gemini with
+  --record FILE, which needs GOOGLE_API_KEY.
+
+Reports accuracy per category, latency per answer path and per stage, and
+model calls per question; --output writes every question's result.
+
+    python benchmarks/golden_questions.py
+    python benchmarks/golden_questions.py --record golden_answers.jsonl
+    python benchmarks/golden_questions.py --replay golden_answers.jsonl
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+from collections import defaultdict
+
+import harness
+
+GOLDEN_PATH = os.path.join(harness.ROOT, "benchmarks", "golden_questions.json")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "has",
+    "have", "how", "i", "in", "is", "it", "many", "me", "much", "of", "on", "or", "the", "there",
+    "this", "to", "what", "when", "which", "who", "with", "you", "your",
+}
+# Question words the fake model should read as catalog keys
+SYNONYMS = {"first": "1", "long": "duration", "fee": "fees", "cost": "fees", "semester": "semesters", "subject": "subjects"}
+
+
+# -------------------------------
+# Deterministic fake model
+# -------------------------------
+def _terms(text):
+    words = re.findall(r"[\w+-]+", text.lower())
+    return {SYNONYMS.get(w, w) for w in words if w not in STOPWORDS}
+
+
+def _course_facts(courses):
+    facts = []
+    for course, info in courses.items():
+        for key, value in info.items():
+            if isinstance(value, dict):
+                facts.extend(f"{course} {key} {k}: {', '.join(map(str, v)) if isinstance(v, list) else v}" for k, v in value.items())
+            else:
+                facts.append(f"{course} {key}: {value}")
+    return facts
+
+
+def grounded_answer(prompt):
+    """The two facts of `prompt` sharing the most terms with its question"""
+    question = prompt.rsplit("Question: ", 1)[-1] if "Question: " in prompt else prompt.rstrip().rsplit("\n", 1)[-1]
+    facts = []
+    start = prompt.find("{")
+    if start != -1:
+        data, end = json.JSONDecoder().raw_decode(prompt, start)
+        facts.extend(_course_facts(data.get("courses", {})))
+        prompt = prompt[end:]
+    for line in prompt.split("\n"):
+        line = line.strip()
+        # Skip the instructions' numbered and bulleted lists and the question itself
+        if line and not re.match(r"^(\d+\.|-) ", line) and question.strip() not in line:
+            facts.append(line)
+    question_terms = _terms(question)
+    ranked = sorted(facts, key=lambda fact: -len(question_terms & _terms(fact)))
+    return "\n".join(ranked[:2])
+
+
+def replayed_answers(path):
+    """respond() serving answers recorded with --record"""
+    with open(path, encoding="utf-8") as f:
+        recorded = {r["question"]: r for r in map(json.loads, f)}
+
+    def respond(prompt):
+        question = prompt.rsplit("Question: ", 1)[-1] if "Question: " in prompt else prompt.rstrip().rsplit("\n", 1)[-1]
+        record = recorded.get(question.strip())
+        if record is None:
+            print(f"No recorded answer for {question!r}", file=sys.stderr)
+            return ""
+        return record["answer"]
+    return respond, recorded
+
+
+# -------------------------------
+# Runner
+# -------------------------------
+class TraceCollector(logging.Handler):
+    """Keeps the request traces tracing.py logs"""
+
+    def __init__(self):
+        super().__init__()
+        self.traces = []
+
+    def emit(self, record):
+        self.traces.append(json.loads(record.getMessage()))
+
+
+def ask(question, args, fake, collector, api_key):
+    """Ask `question` as the first message of a new session; returns (answer, trace, model calls)"""
+    at = harness.new_session(args.mongo_uri)
+    if api_key:
+        at.secrets["GOOGLE_API_KEY"] = api_key
+    at.run()
+    seen, calls = len(collector.traces), fake.calls if fake else 0
+    harness.send_message(at, question)
+    trace = next((t for t in collector.traces[seen:] if t["name"] == "chat"), {"attributes": {}, "spans": []})
+    answer = at.session_state["chat_history"][-1][1]
+    return answer, trace, (fake.calls if fake else 0) - calls
+
+
+def answer_path(trace):
+    attributes = trace["attributes"]
+    if attributes.get("answer_cache") == "hit":
+        return "cache"
+    return "retrieval+llm" if attributes.get("passages") else "llm"
+
+
+def run(args):
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        golden = json.load(f)
+
+    fake, api_key, recorded = None, None, {}
+    if args.record:
+        api_key = os.environ["GOOGLE_API_KEY"]
+    else:
+        respond = grounded_answer
+        if args.replay:
+            respond, recorded = replayed_answers(args.replay)
+        fake = harness.FakeGemini(latency_ms=args.latency_ms, jitter_ms=0, respond=respond)
+        harness.install_fake_gemini(fake)
+    harness.install_fake_audio()
+    harness.install_database(args.mongo_uri)
+    harness.install_shared_runtime()
+    import database
+    import retrieval
+    import tracing
+    from corpus import build_passages, load_website
+    database.init_database()
+
+    # A fresh index of the current corpus, so results do not depend on local approvals
+    index_dir = tempfile.mkdtemp(prefix="golden-index-")
+    harness.use_retrieval_index(index_dir)
+    passages, _ = build_passages(load_website())
+    retrieval.build_index([retrieval.passage_document(p) for p in passages])
+
+    collector = TraceCollector()
+    tracing._get_trace_logger().addHandler(collector)
+    results, recording = [], []
+    try:
+        for run_pass in ("cold", "warm"):
+            for item in golden:
+                if fake and item["question"] in recorded:
+                    fake.latency_ms = recorded[item["question"]].get("model_ms", args.latency_ms)
+                answer, trace, calls = ask(item["question"], args, fake, collector, api_key)
+                stages = {span["stage"]: span["ms"] for span in trace["spans"]}
+                results.append({
+                    "id": item["id"],
+                    "category": item["category"],
+                    "pass": run_pass,
+                    "correct": all(e.lower() in answer.lower() for e in item["expected"]),
+                    "path": answer_path(trace),
+                    "total_ms": trace.get("total_ms", 0),
+                    "stages_ms": stages,
+                    "llm_calls": calls,
+                    "answer": answer,
+                })
+                if args.record and run_pass == "cold":
+                    recording.append({"question": item["question"], "answer": answer, "model_ms": stages.get("model", 0)})
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    if args.record:
+        with open(args.record, "w", encoding="utf-8") as f:
+            for record in recording:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return results
+
+
+def summarise(results, measured_calls):
+    def accuracy(rows):
+        return round(sum(r["correct"] for r in rows) / len(rows), 3) if rows else 0
+
+    def latency(values):
+        return {k: round(v, 1) for k, v in harness.percentiles(values, (50, 95)).items()}
+
+    by_category, by_path, by_stage = defaultdict(list), defaultdict(list), defaultdict(list)
+    for r in results:
+        by_category[r["category"]].append(r)
+        by_path[r["path"]].append(r["total_ms"])
+        for stage, ms in r["stages_ms"].items():
+            by_stage[stage].append(ms)
+    cold = [r for r in results if r["pass"] == "cold"]
+    return {
+        "questions": len(cold),
+        "accuracy": accuracy(cold),
+        "accuracy_by_category": {c: accuracy([r for r in rows if r["pass"] == "cold"]) for c, rows in by_category.items()},
+        "accuracy_warm": accuracy([r for r in results if r["pass"] == "warm"]),
+        "answers_by_path": {path: len(values) for path, values in by_path.items()},
+        "latency_ms_by_path": {path: latency(values) for path, values in by_path.items()},
+        "latency_ms_by_stage": {stage: latency(values) for stage, values in by_stage.items()},
+        "llm_calls_per_question": {
+            p: round(sum(r["llm_calls"] for r in results if r["pass"] == p) / len(cold), 2) for p in ("cold", "warm")
+        } if measured_calls else "not measured (recording against Gemini)",
+        "wrong": [r["id"] for r in cold if not r["correct"]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--record", metavar="FILE", help="answer with Gemini (GOOGLE_API_KEY) and save the answers")
+    mode.add_argument("--replay", metavar="FILE", help="answer with answers saved by --record")
+    parser.add_argument("--mongo-uri", default=None, help="local mongod (default: in-memory)")
+    parser.add_argument("--latency-ms", type=float, default=300, help="fake model latency")
+    parser.add_argument("--output", help="write every question's result to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    print(json.dumps(summarise(results, not args.record), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Shared setup for the benchmark scripts.
+
+Replaces the external services app.py talks to (Gemini, the microphone and
+speakers, MongoDB) with local stand-ins so whole sessions can be driven
+through Streamlit's AppTest without network access or audio hardware.
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter
+from unittest.mock import MagicMock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+
+# Make `import database` work and resolve ./Resources like `streamlit run` does
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens=0, output_tokens=0, stream_delay=0):
+        self.text = text
+        self.usage_metadata = types.SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens
+        )
+        self._stream_delay = stream_delay
+
+    def __iter__(self):
+        """Stream the text in a few chunks, spending the rest of the latency between them"""
+        words = self.text.split(" ")
+        chunks = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+        chunks[-1] = chunks[-1][:-1]
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self._stream_delay / max(len(chunks) - 1, 1))
+            yield types.SimpleNamespace(text=chunk)
+
+
+def prompt_text(system_instruction, contents):
+    """Everything the model is sent, as plain text: the system instruction, then each turn's parts"""
+    if not isinstance(contents, list):
+        contents = [contents]
+    parts = [system_instruction or ""]
+    for content in contents:
+        if isinstance(content, dict):
+            parts.extend(str(part) for part in content.get("parts", []))
+        else:
+            parts.append(str(content))
+    return "\n".join(parts)
+
+
+class FakeGemini:
+    """Stand-in for google.generativeai with configurable latency.
+
+    `respond` maps the prompt text (see prompt_text) to the answer text; by
+    default the model just acknowledges the question. Every call is counted in `calls`.
+    """
+
+    def __init__(self, latency_ms=300, jitter_ms=100, respond=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.respond = respond or (lambda prompt: "Thanks for your question! 🎓")
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _reply(self, prompt, stream=False):
+        with self._lock:
+            self.calls += 1
+            delay = max(0, self._random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        # When streaming, the first chunk arrives after 40% of the latency
+        time.sleep(delay * 0.4 if stream else delay)
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        text = self.respond(prompt)
+        return FakeResponse(text, len(prompt) // 4, len(text) // 4, delay * 0.6 if stream else 0)
+
+    def module(self):
+        """Build a module object exposing the parts of the genai API the app uses"""
+        fake = self
+
+        class ChatSession:
+            def __init__(self, history=None):
+                self.history = list(history or [])
+
+            def send_message(self, content, stream=False, **kwargs):
+                response = fake._reply(content, stream)
+                self.history.extend([content, response.text])
+                return response
+
+        class GenerativeModel:
+            def __init__(self, model_name="fake", system_instruction=None, **kwargs):
+                self.model_name = model_name
+                self.system_instruction = system_instruction
+
+            def start_chat(self, history=None, **kwargs):
+                return ChatSession(history)
+
+            def generate_content(self, contents, stream=False, **kwargs):
+                return fake._reply(prompt_text(self.system_instruction, contents), stream)
+
+            def count_tokens(self, contents):
+                return types.SimpleNamespace(total_tokens=len(str(contents)) // 4)
+
+        module = types.ModuleType("google.generativeai")
+        module.configure = lambda **kwargs: None
+        module.GenerativeModel = GenerativeModel
+        return module
+
+
+def install_fake_gemini(fake):
+    google = sys.modules.get("google") or types.ModuleType("google")
+    if not hasattr(google, "__path__"):
+        google.__path__ = []
+    module = fake.module()
+    google.generativeai = module
+    sys.modules["google"] = google
+    sys.modules["google.generativeai"] = module
+
+
+def install_fake_audio():
+    """Speech input/output need audio devices, which benchmark hosts lack"""
+    class Engine:
+        def getProperty(self, name):
+            return []
+
+        def setProperty(self, name, value):
+            pass
+
+        def say(self, text):
+            pass
+
+        def runAndWait(self):
+            pass
+
+        def stop(self):
+            pass
+
+    pyttsx3 = types.ModuleType("pyttsx3")
+    pyttsx3.init = lambda *args, **kwargs: Engine()
+    sys.modules["pyttsx3"] = pyttsx3
+    sys.modules["speech_recognition"] = types.ModuleType("speech_recognition")
+    sys.modules["edge_tts"] = types.ModuleType("edge_tts")
+
+
+class CountingCollection:
+    """Wraps a collection and counts every method call as one DB operation"""
+
+    def __init__(self, collection, counter, lock):
+        self._collection = collection
+        self._counter = counter
+        self._lock = lock
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def counted(*args, **kwargs):
+            with self._lock:
+                self._counter[f"{self._collection.name}.{name}"] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def secrets(mongo_uri):
+    # Every simulated session shares one browser fingerprint, so lift the
+    # rate limits that would otherwise throttle the load itself
+    return {
+        "GOOGLE_API_KEY": "benchmark",
+        "MONGO_URI": mongo_uri,
+        "RATE_LIMIT_USER_CAPACITY": 1e9,
+        "RATE_LIMIT_FINGERPRINT_CAPACITY": 1e9,
+        # Background answer precomputation would add LLM calls to the measurement
+        "WARMUP_ON_START": False,
+    }
+
+
+def _patch_mongomock_bulk_write(mongomock):
+    """pymongo 4.9+ passes `sort` to bulk update builders, which mongomock predates"""
+    builder = mongomock.collection.BulkOperationBuilder
+    for name in ("add_update", "add_replace"):
+        def without_sort(self, *args, _method=getattr(builder, name), sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        setattr(builder, name, without_sort)
+
+
+def install_database(mongo_uri=None):
+    """Import database.py against a local mongod, or in memory when no URI is given.
+
+    Returns a Counter of DB operations keyed by "collection.method".
+    """
+    import streamlit as st
+    from streamlit.runtime.secrets import Secrets
+    if mongo_uri is None:
+        import mongomock
+        import pymongo
+        # database.py opens a primary and an analytics client; like two
+        # clients of one server, they must see the same data
+        store = mongomock.store.ServerStore()
+        pymongo.MongoClient = lambda *args, **kwargs: mongomock.MongoClient(*args, _store=store, **kwargs)
+        _patch_mongomock_bulk_write(mongomock)
+    saved_secrets = st.secrets
+    st.secrets = Secrets()
+    st.secrets._secrets = secrets(mongo_uri or "mongodb://localhost")
+    try:
+        import database
+    finally:
+        st.secrets = saved_secrets
+
+    counter = Counter()
+    lock = threading.Lock()
+    for name, value in list(vars(database).items()):
+        if name.endswith("_collection"):
+            setattr(database, name, CountingCollection(value, counter, lock))
+    return counter
+
+
+def install_shared_runtime():
+    """Keep one Streamlit runtime alive for every AppTest in this process.
+
+    AppTest creates and tears down a mock runtime around each run, which
+    breaks when several sessions run at once. Real servers share one
+    runtime (and its caches) across sessions, so we do the same.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    # No browser is connected, so st.context has no headers or IP address
+    runtime.get_client.return_value = None
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+    # AppTest recompiles the script on every run, and ast.parse is not
+    # safe to call from several threads at once on some Python versions
+    from streamlit.runtime.scriptrunner import magic, script_cache
+    add_magic = magic.add_magic
+    compile_lock = threading.Lock()
+
+    def locked_add_magic(code, script_path):
+        with compile_lock:
+            return add_magic(code, script_path)
+    script_cache.magic.add_magic = locked_add_magic
+    return runtime
+
+
+def _standalone_app():
+    """Copy app.py to a directory without pages/.
+
+    With pages/ next to it AppTest runs the script through the multipage
+    router, whose page selection is not safe across concurrent sessions.
+    The copy is the same script; ./Resources still resolves from ROOT.
+    """
+    global _app_copy
+    if _app_copy is None:
+        directory = tempfile.mkdtemp(prefix="uniassist-bench-")
+        _app_copy = shutil.copy(APP_PATH, os.path.join(directory, "app.py"))
+    return _app_copy
+
+
+_app_copy = None
+
+
+def new_session(mongo_uri=None, timeout=120):
+    """Create an AppTest for app.py with benchmark secrets"""
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(_standalone_app(), default_timeout=timeout)
+    at.secrets.update(secrets(mongo_uri or "mongodb://localhost"))
+    return at
+
+
+def send_message(at, text):
+    """Type `text` into the input bar and press Send"""
+    at.text_input(key="input").input(text)
+    next(b for b in at.button if b.label.startswith("Send")).click().run()
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+
+def use_retrieval_index(directory):
+    """Point retrieval.py at an index in `directory` instead of Resources/build"""
+    import retrieval
+    retrieval.INDEX_DIR = directory
+    retrieval.VECTORS_PATH = os.path.join(directory, "vectors.npy")
+    retrieval.METADATA_PATH = os.path.join(directory, "metadata.jsonl")
+    retrieval.LOCK_PATH = os.path.join(directory, ".lock")
+    retrieval._index = None
+
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    """Nearest-rank percentiles of `values` as {"p50": ..., ...}"""
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{p}": 0 for p in points}
+    return {
+        f"p{p}": ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+        for p in points
+    }
+
+
+def deep_size(obj, seen=None):
+    """Approximate memory held by `obj` and everything it references"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def rss_bytes():
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
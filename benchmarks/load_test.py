@@ -0,0 +1,151 @@
+"""Multi-session load test for app.py.
+
+Drives N concurrent simulated students through the real script with
+Streamlit's AppTest. Gemini is replaced by a fake with configurable
+latency, and MongoDB by an in-memory stand-in (or a local mongod via
+--mongo-uri). Reports per-rerun latency percentiles, DB operations per
+message and memory per session, and compares against a saved baseline.
+
+    python benchmarks/load_test.py --sessions 20 --messages 5
+    python benchmarks/load_test.py --mongo-uri mongodb://localhost:27017 --save-baseline
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import harness
+
+QUESTIONS = [
+    "What courses do you offer?",
+    "What is the fee structure for BCA?",
+    "How long is the B.Tech program?",
+    "What subjects are taught in B.Sc first semester?",
+    "Tell me about admission process",
+]
+
+# Metrics where a larger value than the baseline is a regression
+REGRESSION_METRICS = [
+    "rerun_latency_ms.p50",
+    "rerun_latency_ms.p95",
+    "db_ops_per_message",
+    "memory_per_session_kb",
+]
+
+
+def run_session(index, args, results):
+    at = harness.new_session(args.mongo_uri)
+    latencies = []
+
+    start = time.perf_counter()
+    at.run()
+    latencies.append((time.perf_counter() - start) * 1000)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    for m in range(args.messages):
+        start = time.perf_counter()
+        harness.send_message(at, QUESTIONS[(index + m) % len(QUESTIONS)])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    results[index] = {
+        "latencies": latencies,
+        "session_state_bytes": harness.deep_size(dict(at.session_state.items())),
+    }
+
+
+def run(args):
+    fake = harness.FakeGemini(args.latency_ms, args.jitter_ms)
+    harness.install_fake_gemini(fake)
+    harness.install_fake_audio()
+    db_ops = harness.install_database(args.mongo_uri)
+    harness.install_shared_runtime()
+
+    # Warm up imports and per-process caches so they don't count as load
+    harness.new_session(args.mongo_uri).run()
+    db_ops.clear()
+    fake.calls = 0
+
+    rss_before = harness.rss_bytes()
+    results = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.sessions) as pool:
+        futures = [pool.submit(run_session, i, args, results) for i in range(args.sessions)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+    rss_after = harness.rss_bytes()
+
+    messages = args.sessions * args.messages
+    latencies = [ms for r in results.values() for ms in r["latencies"]]
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "messages": args.messages,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "database": "mongod" if args.mongo_uri else "in-memory",
+        },
+        "reruns": len(latencies),
+        "throughput_messages_per_s": round(messages / elapsed, 2),
+        "rerun_latency_ms": {k: round(v, 1) for k, v in harness.percentiles(latencies).items()},
+        "llm_calls": fake.calls,
+        "db_ops_per_message": round(sum(db_ops.values()) / max(messages, 1), 2),
+        "db_ops_by_call": dict(db_ops.most_common()),
+        "memory_per_session_kb": round(
+            sum(r["session_state_bytes"] for r in results.values()) / len(results) / 1024, 1
+        ),
+        "rss_growth_per_session_kb": round((rss_after - rss_before) / args.sessions / 1024, 1),
+    }
+
+
+def _lookup(report, dotted):
+    value = report
+    for key in dotted.split("."):
+        value = value[key]
+    return value
+
+
+def compare(report, baseline, tolerance):
+    """Return the metrics that got worse than baseline by more than `tolerance`"""
+    regressions = []
+    for metric in REGRESSION_METRICS:
+        old, new = _lookup(baseline, metric), _lookup(report, metric)
+        if old and new > old * (1 + tolerance):
+            regressions.append(f"{metric}: {old} -> {new} (+{(new / old - 1):.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=5, help="messages sent per session")
+    parser.add_argument("--latency-ms", type=float, default=300, help="mean fake Gemini latency")
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    parser.add_argument("--mongo-uri", help="local mongod to use instead of the in-memory stand-in")
+    parser.add_argument("--baseline", default=os.path.join(harness.BASELINE_DIR, "load_test.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression ratio")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Outage drill for the write spool (spool.py).
+
+Drives chat sessions through AppTest against the in-memory database,
+whose collections can be switched to fail every call (down) or to answer
+slowly (slow). Each scenario runs the same script of messages as a
+control session on a healthy database and checks that:
+- the page keeps answering and never raises while the database is out;
+- nothing is lost: once the database is back and the spool has drained,
+  the session's chats, access_count and message_count match the control;
+- replaying the drained spool files again changes nothing;
+- files left by a dead process, torn last line included, are replayed by
+  the next process's replayer.
+
+Exits with status 1 if any check fails.
+
+    python benchmarks/outage_drill.py
+    python benchmarks/outage_drill.py --messages 5 --slow-ms 1500
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import harness
+
+# Every public method of a mongomock collection that talks to the "server"
+COLLECTION_METHODS = (
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "find", "find_one", "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    "count_documents", "estimated_document_count", "aggregate", "distinct", "bulk_write", "create_index",
+)
+
+
+class DatabaseSwitch:
+    """Makes every in-memory collection call fail ("down") or sleep first ("slow")"""
+
+    def __init__(self):
+        self.mode = "up"
+        self.slow_seconds = 0
+
+    def check(self):
+        from pymongo.errors import ServerSelectionTimeoutError
+        if self.mode == "down":
+            raise ServerSelectionTimeoutError("drill: database is down")
+        if self.mode == "slow":
+            time.sleep(self.slow_seconds)
+
+    def install(self):
+        import mongomock
+        for name in COLLECTION_METHODS:
+            method = getattr(mongomock.collection.Collection, name)
+
+            def switched(collection, *args, _method=method, **kwargs):
+                self.check()
+                return _method(collection, *args, **kwargs)
+            setattr(mongomock.collection.Collection, name, switched)
+        command = mongomock.database.Database.command
+
+        def switched_command(database, *args, **kwargs):
+            self.check()
+            return command(database, *args, **kwargs)
+        mongomock.database.Database.command = switched_command
+
+
+def session_script(at, messages):
+    """Open the page and send `messages` questions; returns the answers and the time each took"""
+    at.run()
+    answers, latencies = [], []
+    for i in range(messages):
+        start = time.perf_counter()
+        harness.send_message(at, f"Drill question {i}: what is the fee for BCA?")
+        latencies.append((time.perf_counter() - start) * 1000)
+        answers.append(at.session_state["chat_history"][-1][1])
+    return answers, latencies
+
+
+def session_totals(database, user_id):
+    """What the database holds for a session: chats and the user's counters"""
+    user = database.user_collection.find_one({"user_id": user_id}) or {}
+    return {
+        "chats": database.chat_collection.count_documents({"user_id": user_id}),
+        "access_count": user.get("access_count", 0),
+        "message_count": user.get("message_count", 0),
+    }
+
+
+def session_totals_safely(database, user_id, switch):
+    mode, switch.mode = switch.mode, "up"
+    try:
+        return session_totals(database, user_id)
+    finally:
+        switch.mode = mode
+
+
+def wait_drained(spool, timeout):
+    """Seconds until the spool is closed and every file but this process's lock is gone, or None"""
+    own_lock = os.path.join(spool.directory, f"{spool.spool_id}.lock")
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        report = spool.report()
+        leftovers = set(glob.glob(os.path.join(spool.directory, "*"))) - {own_lock}
+        if not report["degraded"] and not report["pending"] and not leftovers:
+            return round(time.monotonic() - start, 2)
+        time.sleep(0.1)
+    return None
+
+
+def snapshot_files(spool, directory):
+    """Copy the spool's files aside, for replaying them a second time"""
+    for path in glob.glob(os.path.join(spool.directory, "*.jsonl")):
+        shutil.copy(path, directory)
+
+
+def run_scenario(name, mode, args, database, switch, control, failures):
+    spool = database.write_spool
+    copies = tempfile.mkdtemp(prefix=f"drill-{name}-")
+    at = harness.new_session()
+    at.run()
+    user_id = at.session_state["user_id"]
+    before = dict(spool.stats)
+
+    switch.mode, switch.slow_seconds = mode, args.slow_ms / 1000
+    answers, latencies = session_script(at, args.messages)
+    during = session_totals_safely(database, user_id, switch)
+    snapshot_files(spool, copies)
+    switch.mode = "up"
+    drain_s = wait_drained(spool, args.drain_timeout)
+    after = session_totals(database, user_id)
+
+    expected = dict(control)
+    # This session opened its page once more than the control, before the outage
+    expected["access_count"] += 1
+    result = {
+        "scenario": name,
+        "message_ms": {k: round(v, 1) for k, v in harness.percentiles(latencies, (50, 95)).items()},
+        "errors_shown": sum("error" in a.lower() for a in answers),
+        "spooled": spool.stats["spooled"] - before["spooled"],
+        "replayed": spool.stats["replayed"] - before["replayed"],
+        "during_outage": during,
+        "after_recovery": after,
+        "expected": expected,
+        "drain_s": drain_s,
+    }
+    if result["errors_shown"]:
+        failures.append(f"{name}: {result['errors_shown']} answers were errors")
+    if drain_s is None:
+        failures.append(f"{name}: spool did not drain within {args.drain_timeout}s")
+    if after != expected:
+        failures.append(f"{name}: database holds {after}, expected {expected}")
+    if not result["spooled"]:
+        failures.append(f"{name}: nothing was spooled")
+
+    # Replaying the same records again must not change anything
+    replayer = type(spool)(spool.db, copies, spool.timeout)
+    if not replayer.drain():
+        failures.append(f"{name}: second replay did not finish")
+    result["second_replay"] = {"replayed": replayer.stats["replayed"], "already_applied": replayer.stats["already_applied"]}
+    if session_totals(database, user_id) != after or replayer.stats["replayed"]:
+        failures.append(f"{name}: replaying the spool twice changed the database")
+    shutil.rmtree(copies, ignore_errors=True)
+    return result
+
+
+def run_dead_process(database, failures):
+    """Files of a process that died mid-outage, with a torn last line"""
+    from bson import ObjectId, json_util
+    spool = database.write_spool
+    dead_id = "sdeadprocess1"
+    user_id = f"drill-dead-{ObjectId()}"
+    records = [
+        {"op": "insert", "document": {"_id": ObjectId(), "user_id": user_id, "access_count": 1, "message_count": 0}},
+        {"op": "update", "filter": {"user_id": user_id}, "update": {"$inc": {"access_count": 1, "message_count": 1}}},
+        {"op": "insert", "document": {"_id": ObjectId(), "user_id": user_id, "user_message": "q", "bot_response": "a"}},
+    ]
+    collections = ["users", "users", "chat_history"]
+    os.makedirs(spool.directory, exist_ok=True)
+    with open(os.path.join(spool.directory, f"{dead_id}.000000.jsonl"), "w", encoding="utf-8") as f:
+        for seq, (record, collection) in enumerate(zip(records, collections), 1):
+            record.update(spool=dead_id, seq=seq, collection=collection)
+            f.write(json_util.dumps(record, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n")
+        f.write('{"op": "insert", "docum')
+    spool.start_replayer()
+    drain_s = wait_drained(spool, 30)
+    totals = session_totals(database, user_id)
+    expected = {"chats": 1, "access_count": 2, "message_count": 1}
+    if totals != expected:
+        failures.append(f"dead process: database holds {totals}, expected {expected}")
+    if glob.glob(os.path.join(spool.directory, f"{dead_id}.*")):
+        failures.append("dead process: its files were not removed")
+    return {"scenario": "dead process", "drain_s": drain_s, "after_recovery": totals, "expected": expected}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--messages", type=int, default=3, help="questions per session")
+    parser.add_argument("--timeout-ms", type=float, default=500, help="write timeout of the spool")
+    parser.add_argument("--slow-ms", type=float, default=1000, help="latency of every call in the slow scenario")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for the spool to drain")
+    args = parser.parse_args()
+
+    harness.install_fake_gemini(harness.FakeGemini(latency_ms=50, jitter_ms=0))
+    harness.install_fake_audio()
+    harness.install_database()
+    harness.install_shared_runtime()
+    switch = DatabaseSwitch()
+    switch.install()
+    import database
+    import spool as spool_module
+
+    directory = tempfile.mkdtemp(prefix="drill-spool-")
+    database.write_spool.directory = directory
+    database.write_spool.timeout = args.timeout_ms / 1000
+    spool_module.REPLAY_INTERVAL_SECONDS = 0.2
+    database.init_database()
+
+    # The same script on a healthy database, for what each session should leave behind
+    at = harness.new_session()
+    session_script(at, args.messages)
+    control = session_totals(database, at.session_state["user_id"])
+
+    failures = []
+    report = {"control": control, "scenarios": []}
+    try:
+        report["scenarios"].append(run_scenario("down", "down", args, database, switch, control, failures))
+        report["scenarios"].append(run_scenario("slow", "slow", args, database, switch, control, failures))
+        report["scenarios"].append(run_dead_process(database, failures))
+    finally:
+        switch.mode = "up"
+        shutil.rmtree(directory, ignore_errors=True)
+    report["spool"] = database.write_spool.report()
+    report["failures"] = failures
+    print(json.dumps(report, indent=2, default=str))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Admin Overview queries: sequential sync path vs. concurrent async path.
+
+Runs the Overview's queries (user stats, course inquiry stats, session
+stats and the chat history of the date range) one after another with
+database.py, then all at once with async_database.py, and reports latency
+percentiles of both next to the slowest single query. The async client
+needs a real server, so a mongod is required; --seed fills it with
+synthetic chats first (only point this at a scratch database).
+
+    python benchmarks/overview_bench.py --mongo-uri mongodb://localhost:27017 --seed 50000
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import harness
+
+
+def seed(database, chats, users):
+    """Insert `chats` synthetic chats spread over `users` users and the last 60 days"""
+    rng = random.Random(0)
+    now = datetime.now(timezone.utc)
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    database.user_collection.insert_many([
+        {
+            "user_id": user_id,
+            "created_at": now - timedelta(days=rng.uniform(0, 60)),
+            "last_active": now - timedelta(days=rng.uniform(0, 30)),
+            "access_count": rng.randint(1, 20),
+            "message_count": 0,
+        }
+        for user_id in user_ids
+    ])
+    courses = ["B.Tech", "B.Sc", "BCA", None]
+    for offset in range(0, chats, 10000):
+        database.chat_collection.insert_many([
+            {
+                "timestamp": now - timedelta(minutes=rng.uniform(0, 60 * 24 * 60)),
+                "user_id": rng.choice(user_ids),
+                "user_message": "What is the fee structure?",
+                "bot_response": "The fee is listed in the course catalog. " * 5,
+                "course_inquiry": rng.choice(courses),
+            }
+            for _ in range(min(10000, chats - offset))
+        ])
+
+
+def run(args):
+    harness.install_database(args.mongo_uri)
+    import database
+    import async_database
+
+    database.ensure_indexes()
+    if args.seed:
+        seed(database, args.seed, max(args.seed // 20, 1))
+
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=args.days)
+    sync_queries = {
+        "user_stats": lambda: database.get_user_stats(),
+        "course_inquiry_stats": lambda: database.get_course_inquiry_stats(),
+        "session_stats": lambda: database.get_session_stats(start_date, end_date),
+        "chat_history": lambda: database.get_chat_history(start_date=start_date, end_date=end_date),
+    }
+    async_queries = {
+        "user_stats": lambda: async_database.get_user_stats(),
+        "course_inquiry_stats": lambda: async_database.get_course_inquiry_stats(),
+        "session_stats": lambda: async_database.get_session_stats(start_date, end_date),
+        "chat_history": lambda: async_database.get_chat_history(start_date=start_date, end_date=end_date),
+    }
+
+    # Warm up connections and the server's cache for both paths
+    for query in sync_queries.values():
+        query()
+    async_database.run(async_database.gather(**{name: q() for name, q in async_queries.items()}))
+
+    sync_ms, async_ms = [], []
+    per_query_ms = {name: [] for name in sync_queries}
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for name, query in sync_queries.items():
+            query_start = time.perf_counter()
+            query()
+            per_query_ms[name].append((time.perf_counter() - query_start) * 1000)
+        sync_ms.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        async_database.run(async_database.gather(**{name: q() for name, q in async_queries.items()}))
+        async_ms.append((time.perf_counter() - start) * 1000)
+
+    def summary(values):
+        return {k: round(v, 1) for k, v in harness.percentiles(values, (50, 95)).items()}
+
+    per_query = {name: summary(values) for name, values in per_query_ms.items()}
+    return {
+        "config": {"repeat": args.repeat, "days": args.days, "chats": database.chat_collection.count_documents({})},
+        "sync_sequential_ms": summary(sync_ms),
+        "async_concurrent_ms": summary(async_ms),
+        "slowest_query_p50_ms": max(q["p50"] for q in per_query.values()),
+        "speedup_p50": round(summary(sync_ms)["p50"] / max(summary(async_ms)["p50"], 1e-9), 2),
+        "per_query_ms": per_query,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mongo-uri", required=True, help="mongod to query (the async client needs a real server)")
+    parser.add_argument("--seed", type=int, default=0, help="insert this many synthetic chats first")
+    parser.add_argument("--days", type=int, default=30, help="Overview date range")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
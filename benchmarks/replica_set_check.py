@@ -0,0 +1,151 @@
+"""Check the primary/analytics client split of database.py on a replica set.
+
+Start a local replica set first, e.g. three members of rs0:
+
+    mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0-0   (and 27018, 27019)
+    mongosh --eval 'rs.initiate({_id: "rs0", members: [{_id: 0, host: "localhost:27017"},
+        {_id: 1, host: "localhost:27018"}, {_id: 2, host: "localhost:27019"}]})'
+
+    python benchmarks/replica_set_check.py --mongo-uri "mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+
+Checks that chat-path functions run on the primary and dashboard queries
+on a secondary (by the address every command was sent to), that both
+clients negotiated the configured wire compressor, and that an analytics
+read sees a chat-path write within the staleness bound. Exits with status
+1 if any check fails. Only documents it creates are removed afterwards.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, monitoring
+
+import harness
+
+
+class AddressRecorder(monitoring.CommandListener):
+    """Server address of every command, per labelled block"""
+
+    def __init__(self):
+        self.label = None
+        self.addresses = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            if self.label and event.command_name not in ("hello", "isMaster", "endSessions"):
+                self.addresses.setdefault(self.label, set()).add(event.connection_id)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def run(self, label, function):
+        self.label = label
+        try:
+            function()
+        finally:
+            self.label = None
+        return self.addresses.get(label, set())
+
+
+def compression_counters(address, compressor):
+    """Bytes this member has decompressed with `compressor` (serverStatus)"""
+    with MongoClient(*address, directConnection=True) as member:
+        status = member.admin.command("serverStatus")
+    stats = status.get("network", {}).get("compression", {}).get(compressor, {})
+    return stats.get("decompressor", {}).get("bytesIn", 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mongo-uri", required=True, help="replica set connection string")
+    args = parser.parse_args()
+
+    recorder = AddressRecorder()
+    # Registered before database.py creates its clients, so both report to it
+    monitoring.register(recorder)
+    harness.install_database(args.mongo_uri)
+    import database
+
+    database.ensure_indexes()
+    primary = database.client.primary
+    secondaries = database.analytics_client.secondaries
+    if primary is None or not secondaries:
+        sys.exit("Not a replica set with a reachable secondary; nothing to check")
+
+    user_id = f"replica-set-check-{int(time.time())}"
+    today = datetime.now().date()
+    chat_path = {
+        "get_course_data": database.get_course_data,
+        "match_course": lambda: database.match_course("What is the fee for BCA?"),
+        "spill_turns": lambda: database.spill_turns(user_id, [{"user": "q", "bot": "a", "timestamp": datetime.now()}]),
+        "get_spilled_turns": lambda: database.get_spilled_turns(user_id),
+        "insert_chat": lambda: database.chat_collection.insert_one({
+            "timestamp": datetime.now(), "user_id": user_id, "user_message": "q", "bot_response": "a"
+        }),
+    }
+    analytics = {
+        "get_user_stats": database.get_user_stats,
+        "get_course_inquiry_stats": database.get_course_inquiry_stats,
+        "get_session_stats": lambda: database.get_session_stats(today - timedelta(days=7), today),
+        "get_chat_history": lambda: database.get_chat_history(start_date=today, end_date=today),
+        "get_chat_page": lambda: database.get_chat_page(start_date=today, end_date=today),
+        "get_top_questions": database.get_top_questions,
+        "get_usage_records": lambda: database.get_usage_records(today, today),
+        "get_latest_chat_timestamp": database.get_latest_chat_timestamp,
+    }
+
+    compressor = database.COMMON_CLIENT_OPTIONS["compressors"].split(",")[0]
+    members = [primary] + sorted(secondaries)
+    before = {member: compression_counters(member, compressor) for member in members}
+
+    failures = []
+    report = {"primary": "%s:%d" % primary, "secondaries": ["%s:%d" % s for s in sorted(secondaries)], "functions": {}}
+    try:
+        for name, function in chat_path.items():
+            addresses = recorder.run(name, function)
+            report["functions"][name] = sorted("%s:%d" % a for a in addresses)
+            if addresses != {primary}:
+                failures.append(f"{name} should only use the primary")
+        for name, function in analytics.items():
+            addresses = recorder.run(name, function)
+            report["functions"][name] = sorted("%s:%d" % a for a in addresses)
+            if not addresses or not addresses <= secondaries:
+                failures.append(f"{name} should only use secondaries")
+
+        # A chat written on the primary must reach the analytics reads in time
+        bound = database.ANALYTICS_CLIENT_OPTIONS["maxStalenessSeconds"]
+        written = database.chat_collection.insert_one({
+            "timestamp": datetime.now(), "user_id": user_id, "user_message": "lag probe", "bot_response": ""
+        })
+        start = time.monotonic()
+        while database.analytics_chat_collection.find_one({"_id": written.inserted_id}) is None:
+            if time.monotonic() - start > bound:
+                failures.append(f"analytics reads lag more than {bound}s")
+                break
+            time.sleep(0.05)
+        report["replication_lag_ms"] = round((time.monotonic() - start) * 1000, 1)
+
+        after = {member: compression_counters(member, compressor) for member in members}
+        report["compressed_bytes_in"] = {"%s:%d" % m: after[m] - before[m] for m in members}
+        if after[primary] <= before[primary]:
+            failures.append(f"chat client did not use {compressor} compression")
+        if not any(after[s] > before[s] for s in secondaries):
+            failures.append(f"analytics client did not use {compressor} compression")
+    finally:
+        database.chat_collection.delete_many({"user_id": user_id})
+        database.conversation_collection.delete_many({"user_id": user_id})
+
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
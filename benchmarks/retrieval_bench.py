@@ -0,0 +1,127 @@
+"""Retrieval index at 10k and 1M rows.
+
+Builds a throwaway index per size in a temporary directory: the real
+website passages first, then filler rows (random unit vectors, so the
+matrix has the size and layout of a real one without embedding a million
+texts). Reports embedding throughput, search latency (whole search() and
+the matrix products alone), in-place and growing appends, file size and
+the memory the mapped matrix adds to the process.
+
+    python benchmarks/retrieval_bench.py
+    python benchmarks/retrieval_bench.py --rows 10000 1000000 --queries 50
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import harness
+import retrieval
+from assistant import example_questions
+from corpus import load_corpus
+
+FILLER_CHUNK_ROWS = 65536
+
+
+def build(rows, documents):
+    """Write an index of `rows` rows: `documents` embedded, the rest filler"""
+    retrieval.build_index(documents)
+    filler = rows - len(documents)
+    rng = np.random.default_rng(0)
+    capacity = rows + retrieval.GROWTH_ROWS
+    matrix = np.lib.format.open_memmap(retrieval.VECTORS_PATH + ".tmp", mode="w+", dtype=np.float16, shape=(capacity, retrieval.DIM))
+    matrix[:len(documents)] = np.load(retrieval.VECTORS_PATH, mmap_mode="r")[:len(documents)]
+    for start in range(len(documents), rows, FILLER_CHUNK_ROWS):
+        end = min(start + FILLER_CHUNK_ROWS, rows)
+        block = rng.standard_normal((end - start, retrieval.DIM), dtype=np.float32)
+        matrix[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    matrix.flush()
+    del matrix
+    os.replace(retrieval.VECTORS_PATH + ".tmp", retrieval.VECTORS_PATH)
+    with open(retrieval.METADATA_PATH, "a", encoding="utf-8") as f:
+        for i in range(filler):
+            f.write(json.dumps({"id": f"filler:{i}", "kind": "filler", "title": "", "text": ""}) + "\n")
+    retrieval._index = None
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {k: round(v, 2) for k, v in harness.percentiles(times, (50, 95)).items()}
+
+
+def run_size(rows, args, documents):
+    directory = tempfile.mkdtemp(prefix="retrieval-bench-")
+    try:
+        harness.use_retrieval_index(directory)
+        start = time.perf_counter()
+        build(rows, documents)
+        build_s = time.perf_counter() - start
+
+        rss_before = harness.rss_bytes()
+        start = time.perf_counter()
+        index = retrieval._load()
+        load_ms = (time.perf_counter() - start) * 1000
+        queries = [example_questions[i % len(example_questions)] for i in range(args.queries)]
+        vector = retrieval.embed([queries[0]])[0].astype(np.float32)
+        scores = retrieval.score_rows(index.vectors, rows, vector)
+
+        retrieval.search(queries[0])  # fault the matrix into memory
+        rss_after = harness.rss_bytes()
+        query_iter = iter(queries * 2)
+        result = {
+            "rows": rows,
+            "file_mb": round(os.path.getsize(retrieval.VECTORS_PATH) / 1e6, 1),
+            "build_s": round(build_s, 2),
+            "open_ms": round(load_ms, 2),
+            "rss_added_mb": round((rss_after - rss_before) / 1e6, 1),
+            "search_ms": timed(lambda: retrieval.search(next(query_iter)), args.queries),
+            "matmul_ms": timed(lambda: retrieval.score_rows(index.vectors, rows, vector), args.queries),
+            "top_k_ms": timed(lambda: retrieval.top_k(scores, retrieval.TOP_K), args.queries),
+        }
+
+        counter = iter(range(10 ** 9))
+        result["append_one_ms"] = timed(
+            lambda: retrieval.append_documents([{"id": f"new:{next(counter)}", "title": "Q", "text": "What is the fee for BCA?"}]),
+            20
+        )
+        # Fill the preallocated rows so the next append has to grow the file
+        spare = len(retrieval._load().vectors) - len(retrieval._load())
+        retrieval.append_documents([{"id": f"pad:{i}", "title": "", "text": "pad"} for i in range(spare)])
+        start = time.perf_counter()
+        retrieval.append_documents([{"id": "grow", "title": "Q", "text": "Is there a hostel for first year students?"}])
+        result["append_growing_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        result["search_after_append"] = [d["id"] for d in retrieval.search("hostel for first year students", 1)]
+        return result
+    finally:
+        retrieval._index = None
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    documents = [retrieval.passage_document(p) for p in load_corpus()]
+    texts = [f"{q} {p['text']}" for q in example_questions for p in documents] or example_questions
+    start = time.perf_counter()
+    retrieval.embed(texts)
+    report = {
+        "dim": retrieval.DIM,
+        "embed_docs_per_s": round(len(texts) / (time.perf_counter() - start)),
+        "sizes": [run_size(rows, args, documents) for rows in args.rows],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
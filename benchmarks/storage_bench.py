@@ -0,0 +1,172 @@
+"""Storage size of chat_history documents under each block compressor.
+
+Builds synthetic chats as save_chat() stores them, with answers that are
+markdown with emoji made from the website passages (median about 900
+characters, a long tail up to 12,000). Reports:
+- BSON bytes per chat, which is what WiredTiger keeps in its cache, so
+  the working set per million chats;
+- an estimate of the bytes on disk, packing the BSON into 32 KB pages and
+  compressing each page with every block compressor installed here
+  (snappy is the server default, zstd what ensure_chat_storage() asks for);
+- for comparison, the same estimates with every answer compressed on its
+  own (zlib, as a bot_response_z binary) before it is stored.
+
+With --mongo-uri it also stores the chats in a scratch database
+(uniassist_storage_bench, dropped afterwards), once in a collection with
+the server's default compressor and once with zstd, each with the chat_text
+index. It then reports collStats data, storage and index sizes.
+
+    python benchmarks/storage_bench.py
+    python benchmarks/storage_bench.py --chats 200000 --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import json
+import math
+import random
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+import bson
+import pytz
+
+import harness
+
+BENCH_DATABASE = "uniassist_storage_bench"
+PAGE_BYTES = 32 * 1024
+EMOJI = ["🎓", "📚", "✅", "💡", "🏫", "📅", "💰", "👉"]
+
+
+def block_codecs():
+    """Block compressors installed here, as {name: compress(bytes) -> bytes}"""
+    codecs = {"zlib": lambda data: zlib.compress(data, 6)}
+    try:
+        import snappy
+        codecs["snappy"] = snappy.compress
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        codecs["zstd"] = zstandard.ZstdCompressor(level=6).compress
+    except ImportError:
+        pass
+    return codecs
+
+
+def answer(rng, passages):
+    """Markdown answer built from website passages"""
+    target = int(min(max(rng.lognormvariate(math.log(900), 0.8), 200), 12000))
+    lines = [f"{rng.choice(EMOJI)} **{rng.choice(passages)['title'] or 'Here is what I found'}**", ""]
+    while sum(map(len, lines)) < target:
+        sentence = rng.choice(rng.choice(passages)["text"].split(". "))
+        lines.append(f"- {rng.choice(EMOJI)} {sentence.strip()}.")
+    lines += ["", "Feel free to ask if you have more questions! 😊"]
+    return "\n".join(lines)[:target + 200]
+
+
+def synthetic_chats(count, passages, questions, seed=0):
+    rng = random.Random(seed)
+    now = datetime.now(pytz.timezone('Asia/Kolkata'))
+    users = [str(uuid.uuid4()) for _ in range(max(count // 5, 1))]
+    for _ in range(count):
+        yield {
+            "timestamp": now - timedelta(seconds=rng.random() * 180 * 24 * 3600),
+            "user_id": rng.choice(users),
+            "user_message": rng.choice(questions),
+            "bot_response": answer(rng, passages),
+            "course_inquiry": rng.choice(["B.Tech", "B.Sc", "BCA", None]),
+            "usage": {
+                "model": "gemini-1.5-flash", "cached": False, "input_tokens": rng.randint(800, 3000),
+                "output_tokens": rng.randint(50, 600), "first_token_ms": 400.0, "latency_ms": 1500.0,
+            },
+        }
+
+
+def on_disk_bytes(encoded, compress):
+    """Bytes of `encoded` documents packed into PAGE_BYTES pages, each compressed"""
+    total, page = 0, bytearray()
+    for document in encoded:
+        page += document
+        if len(page) >= PAGE_BYTES:
+            total += len(compress(bytes(page)))
+            page = bytearray()
+    return total + (len(compress(bytes(page))) if page else 0)
+
+
+def layout_report(encoded, codecs, count):
+    bson_bytes = sum(map(len, encoded))
+    return {
+        "bson_bytes_per_chat": round(bson_bytes / count),
+        "working_set_mb_per_million": round(bson_bytes / count * 1e6 / 1e6),
+        "on_disk_mb_per_million": {
+            name: round(on_disk_bytes(encoded, compress) / count * 1e6 / 1e6) for name, compress in codecs.items()
+        },
+    }
+
+
+def compressed_answer(chat):
+    """`chat` with its answer compressed on its own, for comparison"""
+    compact = {key: value for key, value in chat.items() if key != "bot_response"}
+    compact["bot_response_z"] = bson.Binary(zlib.compress(chat["bot_response"].encode("utf-8"), 6), 128)
+    return compact
+
+
+def mongo_report(database, chats):
+    """collStats of the chats stored with the default compressor and with zstd"""
+    scratch = database.client[BENCH_DATABASE]
+    scratch.create_collection("chats_default")
+    scratch.create_collection("chats_zstd", storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}})
+    report = {}
+    try:
+        for name in ("chats_default", "chats_zstd"):
+            scratch[name].create_index(database.CHAT_TEXT_INDEX, name="chat_text", weights=database.CHAT_TEXT_WEIGHTS)
+            for start in range(0, len(chats), 10000):
+                scratch[name].insert_many([dict(chat) for chat in chats[start:start + 10000]], ordered=False)
+            scratch.command("fsync")
+            stats = scratch.command("collStats", name)
+            report[name] = {
+                "data_mb": round(stats["size"] / 1e6, 1),
+                "storage_mb": round(stats["storageSize"] / 1e6, 1),
+                "text_index_mb": round(stats["indexSizes"]["chat_text"] / 1e6, 1),
+                "total_index_mb": round(stats["totalIndexSize"] / 1e6, 1),
+            }
+    finally:
+        database.client.drop_database(BENCH_DATABASE)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--chats", type=int, default=20000)
+    parser.add_argument("--mongo-uri", default=None, help="local mongod for collStats (default: estimates only)")
+    args = parser.parse_args()
+
+    harness.install_database(args.mongo_uri)
+    import database
+    from assistant import example_questions
+    from corpus import build_passages, load_corpus, load_website
+
+    passages = load_corpus() or build_passages(load_website())[0]
+    now = datetime.now(pytz.utc)
+    chats = [
+        {**chat, "inserted_at": now, "catalog_version": "0123456789ab"}
+        for chat in synthetic_chats(args.chats, passages, example_questions)
+    ]
+    codecs = block_codecs()
+    report = {
+        "chats": args.chats,
+        "answer_chars": {k: round(v) for k, v in harness.percentiles([len(c["bot_response"]) for c in chats], (50, 90, 99)).items()},
+        "block_codecs": list(codecs),
+        "wire_compressors": database.COMMON_CLIENT_OPTIONS["compressors"],
+        "stored": layout_report([bson.encode(chat) for chat in chats], codecs, args.chats),
+        "answers_compressed_per_document": layout_report(
+            [bson.encode(compressed_answer(chat)) for chat in chats], codecs, args.chats
+        ),
+    }
+    if args.mongo_uri:
+        report["collstats"] = mongo_report(database, chats)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
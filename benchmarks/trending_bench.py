@@ -0,0 +1,104 @@
+"""Trending questions (trending.py): cost per question and accuracy of the top-K.
+
+Streams questions drawn from a Zipf distribution over distinct questions
+(each asked in a few rewordings) through TrendingTracker, split over
+several simulated processes and days. Reports the time to record a
+question, to flush, and to merge a week of sketches as the Overview
+does. Compares the merged top-K with exact counts: how many of the true
+top-K it finds and by how much it overcounts them.
+
+    python benchmarks/trending_bench.py
+    python benchmarks/trending_bench.py --questions 1000000 --distinct 20000 --processes 8
+"""
+import argparse
+import json
+import time
+from collections import Counter
+
+import numpy as np
+
+import harness
+import trending
+
+REWORDINGS = ("What is {}?", "what is the {}", "How is {} ?", "{}??")
+
+
+class MemoryCollection:
+    """The replace_one/find subset of a collection that TrendingTracker and merge_top use"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def replace_one(self, filter, document, upsert=False):
+        self.documents[filter["_id"]] = document
+
+    def find(self, query=None):
+        return list(self.documents.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--questions", type=int, default=300000)
+    parser.add_argument("--distinct", type=int, default=5000, help="distinct questions before rewording")
+    parser.add_argument("--zipf", type=float, default=1.2, help="Zipf exponent of question popularity")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ranks = rng.zipf(args.zipf, args.questions * 2)
+    ranks = ranks[ranks <= args.distinct][:args.questions]
+    wordings = rng.integers(len(REWORDINGS), size=len(ranks))
+    exact = Counter(ranks.tolist())
+
+    collection = MemoryCollection()
+    trackers = [trending.TrendingTracker(collection) for _ in range(args.processes)]
+    for tracker in trackers:
+        tracker._flusher = True  # flushed below instead of by a background thread
+    days = [f"2024-01-{day + 1:02d}" for day in range(args.days)]
+    per_day = -(-len(ranks) // args.days)
+
+    record_s = 0.0
+    for i, (rank, wording) in enumerate(zip(ranks.tolist(), wordings.tolist())):
+        trending._today = lambda day=days[i // per_day]: day
+        question = REWORDINGS[wording].format(f"topic{rank} course fees")
+        start = time.perf_counter()
+        trackers[i % args.processes].record(question)
+        record_s += time.perf_counter() - start
+
+    start = time.perf_counter()
+    for tracker in trackers:
+        tracker.flush()
+    flush_ms = (time.perf_counter() - start) * 1000 / args.processes
+
+    merge_times = []
+    for _ in range(20):
+        start = time.perf_counter()
+        top = trending.merge_top(collection.find(), args.top)
+        merge_times.append((time.perf_counter() - start) * 1000)
+
+    true_top = [rank for rank, _ in exact.most_common(args.top)]
+    found = {int(row["question"].split("topic")[1].split()[0]): row["count"] for row in top}
+    overcount = [(found[rank] - exact[rank]) / exact[rank] for rank in true_top if rank in found]
+    report = {
+        "questions": len(ranks),
+        "distinct": len(exact),
+        "sketch_kb_per_process_day": round(trending.SKETCH_WIDTH * trending.SKETCH_DEPTH * 4 / 1024, 1),
+        "documents_merged": len(collection.documents),
+        "record_us": round(record_s / len(ranks) * 1e6, 2),
+        "flush_ms_per_process": round(flush_ms, 2),
+        "merge_ms": {k: round(v, 2) for k, v in harness.percentiles(merge_times, (50, 95)).items()},
+        f"top{args.top}_recall": round(len(set(true_top) & set(found)) / args.top, 3),
+        "overcount_pct": {
+            "mean": round(float(np.mean(overcount)) * 100, 3) if overcount else None,
+            "max": round(float(np.max(overcount)) * 100, 3) if overcount else None,
+        },
+        "top": [{"question": row["question"], "estimated": row["count"], "exact": exact[rank]}
+                for row, rank in zip(top, found)],
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Generate resized WebP/AVIF variants of the UI images.
+
+Run once per deploy (python build_assets.py) so the app only has to read
+small, ready-made files from Resources/build instead of decoding the
+originals.
+"""
+import os
+from assets import BUILD_DIR, IMAGE_FORMATS, IMAGE_WIDTHS, RESOURCE_DIR, render_variant, variant_path
+
+
+def build_assets():
+    """Write every configured width/format variant and report the savings"""
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    for name, widths in IMAGE_WIDTHS.items():
+        original_size = os.path.getsize(os.path.join(RESOURCE_DIR, name))
+        for width in widths:
+            for fmt in IMAGE_FORMATS:
+                data = render_variant(name, width, fmt)
+                path = variant_path(name, width, fmt)
+                with open(path, "wb") as f:
+                    f.write(data)
+                print(f"{path}: {len(data) / 1024:.1f} KB ({len(data) / original_size:.1%} of {name})")
+
+
+if __name__ == "__main__":
+    build_assets()
@@ -0,0 +1,292 @@
+"""Two-level cache shared by every Streamlit replica.
+
+L1 is a per-process LRU with a short TTL; L2 is the `cache` collection in
+MongoDB, whose TTL index drops expired entries. A miss in both is computed
+once: threads of a process wait on a per-key lock, and other replicas see a
+lease document and poll L2 for the result instead of computing it again.
+
+Keys are namespaced (`courses`, `admin_stats`, `answers`, ...) so a whole
+namespace can be invalidated at once. L2 values are stored as BSON, never
+pickled, so whoever can write to the `cache` collection cannot make a
+replica run code; values BSON cannot hold (see _encode) stay in L1.
+Hits and misses per namespace are reported to metrics.cache_stats.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+import bson
+import pytz
+from bson import Binary
+from bson.errors import InvalidDocument
+from pymongo.errors import DuplicateKeyError
+from database import cache_collection, get_course_data, write_spool
+from metrics import cache_stats
+
+# How long another replica may compute a value before we compute it ourselves
+LEASE_SECONDS = 30
+LEASE_POLL_SECONDS = 0.1
+# Larger values stay in L1 only (MongoDB documents are capped at 16 MB)
+MAX_L2_BYTES = 4 * 1024 * 1024
+
+# Part of every L2 _id, so replicas that stored values another way never read these
+L2_FORMAT = "bson1"
+# Key of the documents _encode puts in place of types BSON cannot round-trip
+TYPE_TAG = "__cache_type__"
+
+_MISSING = object()
+
+
+def _encode(value):
+    """`value` as BSON-safe data: tuples, dates and aware datetimes are tagged so _decode restores them"""
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _encode(item) for key, item in value.items()}
+        return {TYPE_TAG: "dict", "items": [[_encode(key), _encode(item)] for key, item in value.items()]}
+    if isinstance(value, tuple):
+        return {TYPE_TAG: "tuple", "items": [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value
+        return {TYPE_TAG: "datetime", "utc": value.astimezone(timezone.utc), "tz": str(value.tzinfo)}
+    if isinstance(value, date):
+        return {TYPE_TAG: "date", "iso": value.isoformat()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    kind = value.get(TYPE_TAG)
+    if kind == "dict":
+        return {_decode(key): _decode(item) for key, item in value["items"]}
+    if kind == "tuple":
+        return tuple(_decode(item) for item in value["items"])
+    if kind == "datetime":
+        return value["utc"].replace(tzinfo=timezone.utc).astimezone(pytz.timezone(value["tz"]))
+    if kind == "date":
+        return date.fromisoformat(value["iso"])
+    return {key: _decode(item) for key, item in value.items()}
+
+
+class TwoLevelCache:
+    """Cache for one namespace.
+
+    `ttl` is how long a value lives in L2, `l1_ttl` how long a process
+    trusts its own copy (bounding staleness after another replica
+    invalidates), and `max_entries` caps the L1 size.
+    """
+
+    def __init__(self, namespace, ttl, l1_ttl=None, max_entries=256):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.l1_ttl = min(ttl, l1_ttl or ttl)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # doc id -> (value, monotonic expiry)
+        self._key_locks = {}
+
+    def _doc_id(self, key):
+        encoded = json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+        return f"{self.namespace}:{L2_FORMAT}:{hashlib.sha1(encoded).hexdigest()}"
+
+    # -------------------------------
+    # L1
+    # -------------------------------
+    def _l1_get(self, doc_id):
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                return _MISSING
+            if entry[1] < time.monotonic():
+                del self._entries[doc_id]
+                return _MISSING
+            self._entries.move_to_end(doc_id)
+            return entry[0]
+
+    def _l1_set(self, doc_id, value, ttl):
+        with self._lock:
+            self._entries[doc_id] = (value, time.monotonic() + min(ttl, self.l1_ttl))
+            self._entries.move_to_end(doc_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                cache_stats.record(self.namespace, "evictions")
+
+    # -------------------------------
+    # L2
+    # -------------------------------
+    def _l2_get(self, doc_id):
+        # While chat writes are spooled the database is down or slow; stay in L1
+        if write_spool.degraded:
+            return _MISSING, 0
+        try:
+            doc = cache_collection.find_one(
+                {"_id": doc_id, "expires_at": {"$gt": datetime.now(timezone.utc)}},
+                {"value": 1, "expires_at": 1}
+            )
+            if doc is None:
+                return _MISSING, 0
+            value = _decode(bson.decode(doc["value"])["value"])
+        except Exception as e:
+            # Unreachable, or an entry this version cannot decode; recompute it
+            print(f"Error reading cache: {str(e)}")
+            return _MISSING, 0
+        remaining = (doc["expires_at"].replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+        return value, remaining
+
+    def _l2_set(self, doc_id, value, ttl):
+        if write_spool.degraded:
+            return
+        try:
+            data = bson.encode({"value": _encode(value)})
+        except (InvalidDocument, TypeError) as e:
+            print(f"Error encoding {self.namespace} cache value, keeping it in this process: {str(e)}")
+            return
+        if len(data) > MAX_L2_BYTES:
+            return
+        try:
+            cache_collection.replace_one(
+                {"_id": doc_id},
+                {
+                    "namespace": self.namespace,
+                    "value": Binary(data),
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Error writing cache: {str(e)}")
+
+    def _acquire_lease(self, doc_id):
+        """True if this process may compute `doc_id`; False while another replica is on it"""
+        lease = {
+            "_id": f"{doc_id}#lease",
+            "namespace": self.namespace,
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=LEASE_SECONDS)
+        }
+        if write_spool.degraded:
+            return True
+        try:
+            cache_collection.insert_one(lease)
+            return True
+        except DuplicateKeyError:
+            # Take over a lease whose holder died before releasing it
+            cache_collection.delete_one({"_id": lease["_id"], "expires_at": {"$lt": datetime.now(timezone.utc)}})
+            try:
+                cache_collection.insert_one(lease)
+                return True
+            except DuplicateKeyError:
+                return False
+        except Exception as e:
+            print(f"Error taking cache lease: {str(e)}")
+            return True
+
+    def _release_lease(self, doc_id):
+        if write_spool.degraded:
+            return
+        try:
+            cache_collection.delete_one({"_id": f"{doc_id}#lease"})
+        except Exception as e:
+            print(f"Error releasing cache lease: {str(e)}")
+
+    # -------------------------------
+    # Public API
+    # -------------------------------
+    def get(self, key, default=None):
+        """Cached value for `key` from L1 or L2, or `default`"""
+        doc_id = self._doc_id(key)
+        value = self._l1_get(doc_id)
+        if value is not _MISSING:
+            cache_stats.record(self.namespace, "l1_hits")
+            return value
+        value, remaining = self._l2_get(doc_id)
+        if value is not _MISSING:
+            cache_stats.record(self.namespace, "l2_hits")
+            self._l1_set(doc_id, value, remaining)
+            return value
+        cache_stats.record(self.namespace, "misses")
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Store `value` in both levels"""
+        doc_id = self._doc_id(key)
+        ttl = ttl or self.ttl
+        self._l1_set(doc_id, value, ttl)
+        self._l2_set(doc_id, value, ttl)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """Cached value for `key`, calling compute() at most once across replicas on a miss"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        doc_id = self._doc_id(key)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(doc_id, threading.Lock())
+        with key_lock:
+            # Another thread may have filled it while we waited
+            value = self._l1_get(doc_id)
+            if value is not _MISSING:
+                return value
+            leased = self._acquire_lease(doc_id)
+            deadline = time.monotonic() + LEASE_SECONDS
+            while not leased and time.monotonic() < deadline:
+                time.sleep(LEASE_POLL_SECONDS)
+                value, remaining = self._l2_get(doc_id)
+                if value is not _MISSING:
+                    self._l1_set(doc_id, value, remaining)
+                    return value
+                leased = self._acquire_lease(doc_id)
+            try:
+                value = compute()
+                cache_stats.record(self.namespace, "computes")
+                self.set(key, value, ttl)
+            finally:
+                if leased:
+                    self._release_lease(doc_id)
+                with self._lock:
+                    self._key_locks.pop(doc_id, None)
+            return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or the whole namespace when `key` is None.
+
+        Other replicas keep their L1 copy for at most `l1_ttl` seconds.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._doc_id(key), None)
+        try:
+            if key is None:
+                cache_collection.delete_many({"namespace": self.namespace})
+            else:
+                cache_collection.delete_one({"_id": self._doc_id(key)})
+        except Exception as e:
+            print(f"Error invalidating cache: {str(e)}")
+
+
+# Shared namespaces
+course_cache = TwoLevelCache("courses", ttl=3600, l1_ttl=30, max_entries=8)
+stats_cache = TwoLevelCache("admin_stats", ttl=300, l1_ttl=60, max_entries=64)
+answer_cache = TwoLevelCache("answers", ttl=7 * 24 * 3600, l1_ttl=300, max_entries=512)
+
+
+def get_cached_course_data():
+    """get_course_data() through course_cache, as (courses, catalog version)"""
+    def load():
+        courses = get_course_data()
+        encoded = json.dumps(courses, sort_keys=True, default=str).encode("utf-8")
+        return courses, hashlib.sha1(encoded).hexdigest()[:12]
+    return course_cache.get_or_compute("catalog", load)
+
+
+def answer_key(question, catalog_version):
+    """Cache key of a context-free answer: same question, same catalog"""
+    return [catalog_version, " ".join(question.lower().split())]
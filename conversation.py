@@ -0,0 +1,109 @@
+"""Bounded conversation state for a chat session.
+
+Only the newest MAX_TURNS_IN_MEMORY turns live in
+st.session_state.chat_history; older ones are spilled to the user's
+conversation buckets in MongoDB and loaded back only when the user asks
+for earlier messages or the model needs more context than memory holds.
+Every change reports the session's size to metrics.session_memory.
+"""
+import sys
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from database import spill_turns, get_spilled_turns
+from metrics import session_memory
+
+MAX_TURNS_IN_MEMORY = st.secrets.get("MAX_TURNS_IN_MEMORY", 20)
+# Previous turns sent to the model with each question
+CONTEXT_TURNS = st.secrets.get("CONTEXT_TURNS", 6)
+
+
+def init_conversation():
+    """Create the conversation keys in session state"""
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = []  # (user_msg, bot_msg, timestamp)
+    if 'earlier_turns' not in st.session_state:
+        st.session_state.earlier_turns = []  # rehydrated on request, oldest first
+    if 'spilled_turns' not in st.session_state:
+        st.session_state.spilled_turns = 0
+    if 'loaded_buckets' not in st.session_state:
+        st.session_state.loaded_buckets = 0
+
+
+def _to_turn(document):
+    return (document["user"], document["bot"], document["timestamp"])
+
+
+def _to_document(turn):
+    user, bot, timestamp = turn
+    return {"user": user, "bot": bot, "timestamp": timestamp}
+
+
+def add_turn(user_id, user_message, bot_response, timestamp):
+    """Append a turn, spilling the oldest turns once memory holds more than the cap"""
+    history = st.session_state.chat_history
+    history.append((user_message, bot_response, timestamp))
+    overflow = len(history) - MAX_TURNS_IN_MEMORY
+    if overflow > 0:
+        # New spills shift the bucket offsets, so start scrollback over
+        if st.session_state.earlier_turns:
+            hide_earlier_turns()
+        spilled = history[:overflow]
+        del history[:overflow]
+        try:
+            spill_turns(user_id, [_to_document(turn) for turn in spilled])
+            st.session_state.spilled_turns += len(spilled)
+        except Exception as e:
+            # save_chat already stored these turns; only the on-screen scrollback is lost
+            print(f"Error spilling conversation turns: {str(e)}")
+    track_memory()
+
+
+def context_turns(user_id, n=CONTEXT_TURNS):
+    """The last `n` turns, reading spilled ones back only if memory holds fewer"""
+    history = st.session_state.chat_history
+    if len(history) >= n or not st.session_state.spilled_turns:
+        return history[-n:] if n else []
+    try:
+        spilled = [_to_turn(turn) for turn in get_spilled_turns(user_id)]
+    except Exception as e:
+        print(f"Error loading conversation turns: {str(e)}")
+        spilled = []
+    return (spilled + history)[-n:]
+
+
+def has_earlier_turns():
+    """Whether spilled turns exist that are not loaded on screen"""
+    return st.session_state.spilled_turns > len(st.session_state.earlier_turns)
+
+
+def load_earlier_turns(user_id):
+    """Rehydrate the next older bucket of spilled turns for display"""
+    bucket = get_spilled_turns(user_id, skip_buckets=st.session_state.loaded_buckets)
+    if not bucket:
+        # The older buckets expired (CONVERSATION_TTL_HOURS); stop offering them
+        st.session_state.spilled_turns = len(st.session_state.earlier_turns)
+        return
+    st.session_state.earlier_turns[:0] = [_to_turn(turn) for turn in bucket]
+    st.session_state.loaded_buckets += 1
+    track_memory()
+
+
+def hide_earlier_turns():
+    """Drop rehydrated turns from memory again"""
+    st.session_state.earlier_turns = []
+    st.session_state.loaded_buckets = 0
+    track_memory()
+
+
+def _turn_bytes(turn):
+    return sys.getsizeof(turn) + sum(sys.getsizeof(part) for part in turn)
+
+
+def track_memory():
+    """Report this session's conversation size to the process-wide registry"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return
+    turns = st.session_state.earlier_turns + st.session_state.chat_history
+    nbytes = sum(_turn_bytes(turn) for turn in turns)
+    session_memory.observe(ctx.session_id, nbytes, len(turns))
@@ -0,0 +1,188 @@
+"""Turn the scraped website content in Resources/UniData.json into passages.
+
+The scrape is a flat list of page fragments ({"a": ...}, {"p": ...},
+{"h2": ...}) in page order, full of repeated navigation labels and of
+notices that appear once as a link and once as a paragraph. This pipeline
+drops navigation and other boilerplate, removes duplicate fragments by
+hashing their normalised text, and merges what is left into passages, one
+per page section, so retrieval and prompts work with a few self-contained
+chunks instead of thousands of fragments.
+
+Run once per deploy (python corpus.py) to write Resources/build/website_corpus.jsonl
+and print the size reduction.
+"""
+import hashlib
+import json
+import os
+import unicodedata
+from collections import Counter
+from assets import BUILD_DIR, RESOURCE_DIR
+
+SOURCE_PATH = os.path.join(RESOURCE_DIR, "UniData.json")
+CORPUS_PATH = os.path.join(BUILD_DIR, "website_corpus.jsonl")
+
+# Links this short are menu entries, buttons and "View All"-style labels
+NAV_LABEL_MAX_WORDS = 4
+# Sections are split into passages of at most this many characters, and
+# shorter leftovers are merged into the previous passage
+MAX_PASSAGE_CHARS = 1500
+MIN_PASSAGE_CHARS = 200
+
+# Site-wide footer text
+BOILERPLATE_PHRASES = ("copyright", "all rights reserved")
+
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+TEXT_TAGS = ("p", "a", "li", "span", "td")
+
+
+def load_website(path=SOURCE_PATH):
+    """The `website` object of UniData.json.
+
+    Only that object is decoded, so a syntax error elsewhere in the file
+    (the timetable is hand-edited) does not stop the pipeline.
+    """
+    with open(path, encoding="utf-8") as f:
+        raw = f.read()
+    start = raw.find("{", raw.index('"website"'))
+    website, _ = json.JSONDecoder().raw_decode(raw, start)
+    return website
+
+
+def normalise(text):
+    """Unicode-normalised text with whitespace (including the scrape's line breaks) collapsed"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def fragment_hash(text):
+    return hashlib.sha1(text.lower().encode("utf-8")).hexdigest()
+
+
+def clean_fragments(content, stats):
+    """(tag, text) pairs in page order without records, navigation or duplicates"""
+    fragments = []
+    for item in content:
+        if not isinstance(item, dict) or len(item) != 1:
+            # Tabular records (the alumni contact list) are personal
+            # details, not content the assistant should quote
+            stats["records_dropped"] += 1
+            continue
+        (tag, text), = item.items()
+        text = normalise(str(text))
+        if tag not in HEADING_TAGS + TEXT_TAGS or not text or any(p in text.lower() for p in BOILERPLATE_PHRASES):
+            stats["boilerplate_dropped"] += 1
+            continue
+        fragments.append((tag, text))
+
+    # Short links, or any short fragment repeated on the page, are navigation.
+    # Headings are structure and are kept even when repeated
+    counts = Counter(fragment_hash(text) for _, text in fragments)
+    seen = set()
+    kept = []
+    for tag, text in fragments:
+        short = len(text.split()) <= NAV_LABEL_MAX_WORDS
+        key = fragment_hash(text)
+        if tag not in HEADING_TAGS and short and (tag == "a" or counts[key] > 1):
+            stats["boilerplate_dropped"] += 1
+        elif key in seen and tag not in HEADING_TAGS:
+            stats["duplicates_dropped"] += 1
+        else:
+            seen.add(key)
+            kept.append((tag, text))
+    return kept
+
+
+def group_sections(fragments):
+    """[(title, [lines])] with one section per top-level heading.
+
+    Lower-level headings become "Heading: text" lines of their section.
+    """
+    sections = [[None, []]]
+    subheading = None
+    for tag, text in fragments:
+        if tag in ("h1", "h2"):
+            sections.append([text, []])
+            subheading = None
+        elif tag in HEADING_TAGS:
+            subheading = text
+        elif subheading:
+            sections[-1][1].append(f"{subheading}: {text}")
+            subheading = None
+        else:
+            sections[-1][1].append(text)
+    return [(title, lines) for title, lines in sections if lines]
+
+
+def split_passages(title, lines):
+    """Section text in chunks of at most MAX_PASSAGE_CHARS, cut between lines"""
+    passages, current = [], []
+    for line in lines:
+        if current and len("\n".join(current + [line])) > MAX_PASSAGE_CHARS:
+            passages.append(current)
+            current = []
+        current.append(line)
+    passages.append(current)
+    return [(title, "\n".join(chunk)) for chunk in passages]
+
+
+def build_passages(website):
+    """Deduplicated passages of the website content, with a report of what was removed"""
+    stats = Counter(records_dropped=0, boilerplate_dropped=0, duplicates_dropped=0)
+    fragments = clean_fragments(website.get("content", []), stats)
+
+    chunks = []
+    for title, lines in group_sections(fragments):
+        for title, text in split_passages(title or website.get("title", ""), lines):
+            if chunks and len(text) < MIN_PASSAGE_CHARS and len(chunks[-1][1]) + len(text) < MAX_PASSAGE_CHARS:
+                chunks[-1] = (chunks[-1][0], f"{chunks[-1][1]}\n{title}: {text}")
+            else:
+                chunks.append((title, text))
+
+    passages = [
+        {
+            "id": hashlib.sha1(text.encode("utf-8")).hexdigest()[:12],
+            "title": title,
+            "text": text,
+            "source": website.get("url"),
+        }
+        for title, text in chunks
+    ]
+    content = website.get("content", [])
+    input_chars = sum(len(str(value)) for item in content if isinstance(item, dict) for value in item.values())
+    page_chars = sum(len(str(value)) for item in content if isinstance(item, dict) and len(item) == 1 for value in item.values())
+    output_chars = sum(len(p["text"]) for p in passages)
+    report = {
+        "fragments": len(content),
+        **stats,
+        "fragments_kept": len(fragments),
+        "passages": len(passages),
+        "input_chars": input_chars,
+        "page_text_chars": page_chars,
+        "output_chars": output_chars,
+        "reduction": round(1 - output_chars / input_chars, 3) if input_chars else 0,
+        "page_text_reduction": round(1 - output_chars / page_chars, 3) if page_chars else 0,
+    }
+    return passages, report
+
+
+def write_corpus(passages, path=CORPUS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for passage in passages:
+            f.write(json.dumps(passage, ensure_ascii=False) + "\n")
+
+
+def load_corpus(path=CORPUS_PATH):
+    """Passages written by write_corpus(), or [] before the first build"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+if __name__ == "__main__":
+    passages, report = build_passages(load_website())
+    write_corpus(passages)
+    for name, value in report.items():
+        print(f"{name}: {value}")
+    print(f"Wrote {len(passages)} passages to {CORPUS_PATH}")
@@ -1,22 +1,125 @@
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+from pymongo import MongoClient, ReturnDocument, UpdateOne, DeleteOne
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+from datetime import datetime, timedelta, timezone
 import streamlit as st
 import bcrypt
 import uuid
 import json
+import importlib.util
 from user_agents import parse
 import pytz
+from metrics import db_command_listener
+from spool import WriteSpool
+from trending import TrendingTracker, merge_top
 
 # MongoDB connection
 MONGO_URI = st.secrets["MONGO_URI"]
-client = MongoClient(MONGO_URI)
-db = client['university_chatbot']
+DATABASE_NAME = 'university_chatbot'
+
+def _available_compressors():
+    """Wire compressors in order of preference, leaving out those whose package
+    (zstandard, python-snappy) is missing"""
+    packages = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+    return ",".join(name for name, package in packages.items() if importlib.util.find_spec(package))
+
+# Options shared by both clients. Wire compression trades a little CPU for
+# much smaller chat documents and aggregation results on the network; the
+# server picks the first compressor in the list that it supports.
+COMMON_CLIENT_OPTIONS = {
+    "connectTimeoutMS": 5000,
+    "serverSelectionTimeoutMS": 5000,
+    "compressors": st.secrets.get("MONGO_COMPRESSORS", _available_compressors()),
+    "zlibCompressionLevel": 1,
+    "retryWrites": True,
+    "retryReads": True,
+}
+
+# Chat path: every read and write of a user's turn, on the primary. Fail
+# fast so a slow database shows up as an error instead of a hung page.
+PRIMARY_CLIENT_OPTIONS = {
+    **COMMON_CLIENT_OPTIONS,
+    "appname": "uniassist-chat",
+    "maxPoolSize": st.secrets.get("MONGO_POOL_SIZE", 50),
+    "minPoolSize": 5,
+    "maxIdleTimeMS": 300000,
+    "waitQueueTimeoutMS": 2000,
+    "socketTimeoutMS": 10000,
+}
+
+# Admin dashboards, exports and other scans: a small pool on a secondary
+# when one is available, so heavy aggregations do not queue behind or slow
+# down chat writes. Results may lag the primary by up to maxStalenessSeconds
+# (90 is the smallest the drivers allow).
+ANALYTICS_CLIENT_OPTIONS = {
+    **COMMON_CLIENT_OPTIONS,
+    "appname": "uniassist-analytics",
+    "readPreference": "secondaryPreferred",
+    "maxStalenessSeconds": st.secrets.get("MONGO_ANALYTICS_MAX_STALENESS_SECONDS", 90),
+    "maxPoolSize": st.secrets.get("MONGO_ANALYTICS_POOL_SIZE", 10),
+    "waitQueueTimeoutMS": 30000,
+    "socketTimeoutMS": 120000,
+}
+
+client = MongoClient(MONGO_URI, event_listeners=[db_command_listener], **PRIMARY_CLIENT_OPTIONS)
+analytics_client = MongoClient(MONGO_URI, event_listeners=[db_command_listener], **ANALYTICS_CLIENT_OPTIONS)
+db = client[DATABASE_NAME]
+analytics_db = analytics_client[DATABASE_NAME]
 
 # Collections
 chat_collection = db['chat_history']
-course_data_collection = db['course_data']
+course_data_collection = db['course_data']  # legacy single-document catalog
+course_collection = db['courses']
 admin_collection = db['admins']
 user_collection = db['users']
+# Chats older than the retention window, moved out by retention.py
+archive_collection = db['chat_history_archive']
+# Chat turns evicted from a session's memory, in buckets of CONVERSATION_BUCKET_SIZE
+conversation_collection = db['conversations']
+# Token buckets of rate_limit.py, one per user_id and per browser fingerprint
+rate_limit_collection = db['rate_limits']
+# L2 of cache.py: namespaced entries and compute leases, dropped once expired
+cache_collection = db['cache']
+# Question sketches of trending.py, one per server process and day
+trending_collection = db['trending_questions']
+
+# Chat and heartbeat writes, spooled to local disk while the database is unavailable
+write_spool = WriteSpool(db)
+# Questions of this process's sessions, counted for the trending list
+trending_tracker = TrendingTracker(trending_collection)
+
+# Read-only handles on the analytics client, for dashboard and export queries
+analytics_chat_collection = analytics_db['chat_history']
+analytics_user_collection = analytics_db['users']
+analytics_archive_collection = analytics_db['chat_history_archive']
+analytics_trending_collection = analytics_db['trending_questions']
+
+# Retention policy (days)
+CHAT_RETENTION_DAYS = st.secrets.get("CHAT_RETENTION_DAYS", 180)
+# Archiving waits for this host's analytics export, so with several app
+# servers only the one whose snapshot the dashboards read should archive
+ARCHIVE_OLD_CHATS = st.secrets.get("ARCHIVE_OLD_CHATS", True)
+ANONYMOUS_USER_TTL_DAYS = st.secrets.get("ANONYMOUS_USER_TTL_DAYS", 30)
+# Named anew when the users it may expire changed, so that it is rebuilt once
+USER_TTL_INDEX = "anonymous_user_ttl_v2"
+BACKFILL_BATCH_SIZE = 1000
+
+# Spilled turns only back a live browser session, so they expire with it
+CONVERSATION_TTL_HOURS = st.secrets.get("CONVERSATION_TTL_HOURS", 24)
+CONVERSATION_TTL_INDEX = "conversation_ttl"
+CONVERSATION_BUCKET_SIZE = 50
+
+# Reverse proxies in front of the app that append the client address to
+# X-Forwarded-For; 0 when clients connect to Streamlit directly
+TRUSTED_PROXY_HOPS = st.secrets.get("TRUSTED_PROXY_HOPS", 0)
+
+# Chat search: results per page, relative weight of the question, and how
+# long a search may take to rank its matches before it is stopped
+SEARCH_PAGE_SIZE = 20
+SEARCH_QUESTION_WEIGHT = 3
+SEARCH_TIMEOUT_MS = st.secrets.get("SEARCH_TIMEOUT_MS", 2000)
+# Full-text index of chat_history
+CHAT_TEXT_INDEX = [("user_message", "text"), ("bot_response", "text")]
+CHAT_TEXT_WEIGHTS = {"user_message": SEARCH_QUESTION_WEIGHT, "bot_response": 1}
 
 def init_database():
     """Initialize database with default admin and course data if empty"""
@@ -28,10 +131,14 @@ def init_database():
         }
         admin_collection.insert_one(default_admin)
 
-        
+    ensure_chat_storage()
+    ensure_indexes()
+
+    # Move the old single-document catalog to one document per course
+    migrate_course_data()
 
     # Add default course data if none exists
-    if course_data_collection.count_documents({}) == 0:
+    if course_collection.count_documents({}) == 0:
         default_courses = {
             "courses": {
                 "B.Tech": {
@@ -60,7 +167,133 @@ def init_database():
                 }
             }
         }
-        course_data_collection.insert_one(default_courses)
+        _insert_courses(default_courses["courses"])
+
+def ensure_chat_storage():
+    """Create chat_history with zstd block compression (the server default is snappy).
+
+    An existing collection keeps its compressor; see
+    benchmarks/storage_bench.py for what moving it would save.
+    """
+    try:
+        if chat_collection.name not in db.list_collection_names():
+            db.create_collection(
+                chat_collection.name,
+                storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+            )
+    except CollectionInvalid:
+        pass  # Created by another process in the meantime
+    except Exception as e:
+        # Created on first insert with the server's default compressor instead
+        print(f"Error creating chat_history with zstd compression: {str(e)}")
+
+def ensure_indexes():
+    """Create the indexes used by the chat browser and per-user lookups"""
+    # Keyset pagination sorts on (timestamp, _id); each filter gets its own prefix
+    chat_collection.create_index([("timestamp", -1), ("_id", -1)])
+    chat_collection.create_index([("user_id", 1), ("timestamp", -1), ("_id", -1)])
+    chat_collection.create_index([("course_inquiry", 1), ("timestamp", -1), ("_id", -1)])
+    # The analytics export follows insert time (analytics_snapshot.py)
+    chat_collection.create_index([("inserted_at", 1), ("_id", 1)])
+    ensure_chat_text_index()
+    user_collection.create_index("user_id")
+    course_collection.create_index("name", unique=True)
+    course_collection.create_index("match_keys")
+    conversation_collection.create_index([("user_id", 1), ("_id", -1)])
+    ensure_conversation_ttl_index()
+    rate_limit_collection.create_index("updated_at", expireAfterSeconds=24 * 3600)
+    rate_limit_collection.create_index([("consumed", -1)])
+    cache_collection.create_index("expires_at", expireAfterSeconds=0)
+    cache_collection.create_index("namespace")
+    trending_collection.create_index("day")
+    trending_collection.create_index("expires_at", expireAfterSeconds=0)
+    ensure_user_ttl_index()
+
+def ensure_chat_text_index():
+    """Full-text index of the admin Search page; a match in the question counts more than one in the answer.
+
+    Created only if chat_history has no text index yet. A collection has a
+    single text index, so changing its fields or weights means dropping it
+    and building it again over every chat, during which Search fails; that
+    is a maintenance step, not something to run at start-up.
+    """
+    options = {"name": "chat_text", "weights": CHAT_TEXT_WEIGHTS, "default_language": "english"}
+    try:
+        chat_collection.create_index(CHAT_TEXT_INDEX, **options)
+    except OperationFailure as e:
+        # Built with other fields or weights; it still serves $text
+        print(f"Keeping the existing chat_text index: {str(e)}")
+
+def ensure_user_ttl_index():
+    """Expire visitors who never sent a message ANONYMOUS_USER_TTL_DAYS after their last visit.
+
+    The index is only created once every user has a message_count, so
+    users that predate the field are not taken for visitors who never
+    sent a message.
+    """
+    ttl_seconds = int(ANONYMOUS_USER_TTL_DAYS * 24 * 3600)
+    indexes = user_collection.index_information()
+    if USER_TTL_INDEX not in indexes:
+        if "anonymous_user_ttl" in indexes:
+            # Created by an earlier version whose heartbeat set message_count
+            # to 0 on users that predate it; recount those before expiring any
+            user_collection.drop_index("anonymous_user_ttl")
+            backfill_message_counts({"message_count": 0})
+        backfill_message_counts()
+    try:
+        user_collection.create_index(
+            "last_active",
+            name=USER_TTL_INDEX,
+            expireAfterSeconds=ttl_seconds,
+            partialFilterExpression={"message_count": 0}
+        )
+    except OperationFailure:
+        # The index exists with an older TTL; change it in place
+        db.command("collMod", user_collection.name, index={
+            "name": USER_TTL_INDEX,
+            "expireAfterSeconds": ttl_seconds
+        })
+
+def ensure_conversation_ttl_index():
+    """Expire spilled conversation turns CONVERSATION_TTL_HOURS after their last update"""
+    ttl_seconds = int(CONVERSATION_TTL_HOURS * 3600)
+    try:
+        conversation_collection.create_index("updated_at", name=CONVERSATION_TTL_INDEX, expireAfterSeconds=ttl_seconds)
+    except OperationFailure:
+        # The index exists with an older TTL, or under its default name
+        # (updated_at_1); change it in place
+        db.command("collMod", conversation_collection.name, index={
+            "keyPattern": {"updated_at": 1},
+            "expireAfterSeconds": ttl_seconds
+        })
+
+def backfill_message_counts(query=None):
+    """Count the chats of users matching `query` (by default, users that predate
+    message_count) into their message_count. Returns the number of users updated."""
+    query = query or {"message_count": {"$exists": False}}
+    updated = 0
+    last_id = None
+    while True:
+        users = list(
+            user_collection.find({**query, "_id": {"$gt": last_id}} if last_id else query, {"user_id": 1})
+            .sort("_id", 1)
+            .limit(BACKFILL_BATCH_SIZE)
+        )
+        if not users:
+            return updated
+        last_id = users[-1]["_id"]
+        counts = dict.fromkeys((user["user_id"] for user in users), 0)
+        for collection in (chat_collection, archive_collection):
+            for row in collection.aggregate([
+                {"$match": {"user_id": {"$in": list(counts)}}},
+                {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+            ]):
+                counts[row["_id"]] += row["count"]
+        user_collection.bulk_write([
+            UpdateOne({"user_id": user_id, **query}, {"$set": {"message_count": count}})
+            for user_id, count in counts.items()
+        ], ordered=False)
+        updated += len(users)
 
 def verify_admin(username, password):
     """Verify admin credentials and create session"""
@@ -96,179 +329,560 @@ def verify_admin_session(session_token):
     except:
         return False
 
+def get_client_ip():
+    """Client address as seen by the outermost trusted proxy.
+
+    Entries left of those the TRUSTED_PROXY_HOPS proxies appended to
+    X-Forwarded-For are whatever the client sent, so they are ignored.
+    """
+    if TRUSTED_PROXY_HOPS:
+        forwarded_for = [hop.strip() for hop in st.context.headers.get("X-Forwarded-For", "").split(",")]
+        forwarded_for = [hop for hop in forwarded_for if hop]
+        if len(forwarded_for) >= TRUSTED_PROXY_HOPS:
+            return forwarded_for[-TRUSTED_PROXY_HOPS]
+    return st.context.ip_address or ""
+
 def get_browser_fingerprint():
     """Generate a simple browser fingerprint"""
-    user_agent = st.request_header("User-Agent", "")
+    user_agent = st.context.headers.get("User-Agent", "")
     user_agent_info = parse(user_agent)
     fingerprint = {
         "browser": user_agent_info.browser.family,
         "os": user_agent_info.os.family,
         "device": user_agent_info.device.family,
-        "ip": st.request_header("X-Forwarded-For", "").split(",")[0].strip()
+        "ip": get_client_ip()
     }
     return json.dumps(fingerprint)
 
-def get_or_create_user_session():
-    """Get or create a user session with improved tracking."""
+def get_or_create_user_session(messages=0):
+    """Get or create a user session with improved tracking.
+
+    `messages` is added to the user's message_count; users whose count
+    stays 0 are removed by the anonymous user TTL index. Writes go through
+    write_spool, so a database outage does not take the page down.
+    """
     if 'user_id' not in st.session_state:
         user_id = str(uuid.uuid4())
         st.session_state.user_id = user_id
         
         # Create new user record
-        user_collection.insert_one({
+        write_spool.insert_one(user_collection, {
             'user_id': user_id,
             'created_at': datetime.now(),
             'last_active': datetime.now(),
-            'access_count': 1
+            'access_count': 1,
+            'message_count': messages
         })
     else:
         user_id = st.session_state.user_id
         
-        # Update existing user's last active time and increment access count
-        user_collection.update_one(
+        # Update existing user's last active time and increment access count.
+        # message_count is only touched by a message: an $inc of 0 would create
+        # it as 0 on users that predate it, and the TTL index would expire them
+        increments = {'access_count': 1}
+        if messages:
+            increments['message_count'] = messages
+        write_spool.update_one(
+            user_collection,
             {'user_id': user_id},
-            {
-                '$set': {'last_active': datetime.now()},
-                '$inc': {'access_count': 1}
-            }
+            {'$set': {'last_active': datetime.now()}, '$inc': increments}
         )
     
     return user_id
 
-def save_chat(user_message, bot_response):
-    """Save chat history to database with user ID and course inquiry tracking"""
+def save_chat(user_message, bot_response, usage=None, catalog_version=None):
+    """Save chat history to database with user ID and course inquiry tracking.
+
+    `usage` holds the model, token counts and latency of the answer, and
+    `catalog_version` the version of the course data it was given.
+    """
+    # Counted in memory first, so trending questions include chats spooled during an outage
+    trending_tracker.record(user_message)
     try:
-        user_id = get_or_create_user_session()
+        user_id = get_or_create_user_session(messages=1)
         
-        # Extract course information from the message
-        courses = get_course_data()
+        # Extract course information from the message; skipped while writes are
+        # spooled, since the read would only wait out the outage
         course_inquiry = None
-        for course in courses.keys():
-            if course.lower() in user_message.lower():
-                course_inquiry = course
-                break
+        if not write_spool.degraded:
+            try:
+                course_inquiry = match_course(user_message)
+            except PyMongoError as e:
+                print(f"Error matching course: {str(e)}")
         
         chat_data = {
             "timestamp": datetime.now(pytz.timezone('Asia/Kolkata')),
             "user_id": user_id,
             "user_message": user_message,
             "bot_response": bot_response,
-            "course_inquiry": course_inquiry
+            "course_inquiry": course_inquiry,
+            # Reset by write_spool when the chat is replayed after an outage
+            "inserted_at": datetime.now(timezone.utc)
         }
-        chat_collection.insert_one(chat_data)
+        if usage:
+            chat_data["usage"] = usage
+        if catalog_version:
+            chat_data["catalog_version"] = catalog_version
+        write_spool.insert_one(chat_collection, chat_data)
     except Exception as e:
         st.error("An error occurred while saving the chat. Please try again.")
         print(f"Error saving chat: {str(e)}")  # Log the error for debugging
 
-def get_chat_history(user_id=None):
-    """Get chat history, optionally filtered by user_id"""
+def _day_start(day):
+    """Midnight IST at the start of a calendar date"""
+    return pytz.timezone('Asia/Kolkata').localize(datetime.combine(day, datetime.min.time()))
+
+def _chat_filter(user_id=None, course_inquiry=None, start_date=None, end_date=None):
+    """Build a chat_history query; start_date and end_date are inclusive IST dates"""
     query = {}
     if user_id:
         query["user_id"] = user_id
-    return list(chat_collection.find(query).sort("timestamp", -1))
+    if course_inquiry:
+        query["course_inquiry"] = course_inquiry
+    if start_date or end_date:
+        query["timestamp"] = {}
+        if start_date:
+            query["timestamp"]["$gte"] = _day_start(start_date)
+        if end_date:
+            query["timestamp"]["$lt"] = _day_start(end_date + timedelta(days=1))
+    return query
 
-def get_course_data():
-    """Get course data"""
-    data = course_data_collection.find_one()
-    return data['courses'] if data else {}
-
-def update_course_data(courses):
-    """Update course data"""
-    course_data_collection.update_one(
-        {}, 
-        {"$set": {"courses": courses}}, 
+def get_chat_history(user_id=None, course_inquiry=None, start_date=None, end_date=None):
+    """Get chat history, optionally filtered by user_id, course and date range"""
+    query = _chat_filter(user_id, course_inquiry, start_date, end_date)
+    return list(analytics_chat_collection.find(query).sort("timestamp", -1))
+
+def get_chat_page(user_id=None, course_inquiry=None, start_date=None, end_date=None,
+                  after=None, page_size=50):
+    """Get one page of chats, newest first, using a (timestamp, _id) keyset cursor.
+
+    `after` is the cursor returned for the previous page. Every page is a
+    single index range scan, so page 10,000 costs the same as page 1.
+    Returns (chats, next_cursor); next_cursor is None on the last page.
+    """
+    query = _chat_filter(user_id, course_inquiry, start_date, end_date)
+    if after:
+        timestamp, chat_id = after
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": chat_id}}
+        ]
+    chats = list(
+        analytics_chat_collection.find(query)
+        .sort([("timestamp", -1), ("_id", -1)])
+        .limit(page_size + 1)
+    )
+    next_cursor = None
+    if len(chats) > page_size:
+        chats = chats[:page_size]
+        next_cursor = (chats[-1]["timestamp"], chats[-1]["_id"])
+    return chats, next_cursor
+
+def search_chats(text, course_inquiry=None, start_date=None, end_date=None, page=0, page_size=SEARCH_PAGE_SIZE):
+    """Full-text search of user_message and bot_response, best matches first.
+
+    Uses the chat_text index: words are matched by their stem, "quoted
+    phrases" must appear as written and -word excludes chats with the word.
+    Ties are broken by recency. Returns (chats, has_next); every chat has
+    its relevance in `score`. Raises ExecutionTimeout if ranking the
+    matches takes longer than SEARCH_TIMEOUT_MS.
+    """
+    query = _chat_filter(None, course_inquiry, start_date, end_date)
+    query["$text"] = {"$search": text}
+    chats = list(
+        analytics_chat_collection.find(query, {
+            "score": {"$meta": "textScore"},
+            "timestamp": 1,
+            "user_id": 1,
+            "course_inquiry": 1,
+            "user_message": 1,
+            "bot_response": 1
+        })
+        .sort([("score", {"$meta": "textScore"}), ("timestamp", -1)])
+        .skip(page * page_size)
+        .limit(page_size + 1)
+        .max_time_ms(SEARCH_TIMEOUT_MS)
+    )
+    return chats[:page_size], len(chats) > page_size
+
+def get_user_thread(user_id):
+    """Get one user's full conversation, oldest first"""
+    return list(
+        analytics_chat_collection.find({"user_id": user_id})
+        .sort([("timestamp", 1), ("_id", 1)])
+    )
+
+def approve_chat(chat_id):
+    """Mark an answer as approved for retrieval; returns the chat document"""
+    return chat_collection.find_one_and_update(
+        {"_id": chat_id},
+        {"$set": {"approved_at": datetime.now(pytz.timezone('Asia/Kolkata'))}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def get_approved_chats():
+    """Every answer approved for retrieval, oldest approval first"""
+    return list(
+        analytics_chat_collection.find(
+            {"approved_at": {"$exists": True}},
+            {"user_message": 1, "bot_response": 1, "approved_at": 1}
+        ).sort("approved_at", 1)
+    )
+
+def spill_turns(user_id, turns):
+    """Append turns to the user's newest conversation bucket, opening a new one when it is full"""
+    now = datetime.now()
+    conversation_collection.update_one(
+        {"user_id": user_id, "count": {"$lt": CONVERSATION_BUCKET_SIZE}},
+        {
+            "$push": {"turns": {"$each": turns}},
+            "$inc": {"count": len(turns)},
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"created_at": now}
+        },
         upsert=True
     )
 
-def get_user_stats():
-    """Get comprehensive user statistics."""
-    try:
-        now = datetime.now(pytz.timezone('Asia/Kolkata'))
-        today_start = datetime.combine(now.date(), datetime.min.time())
-        week_start = today_start - timedelta(days=7)
-        month_start = today_start - timedelta(days=30)
-        
+def get_spilled_turns(user_id, skip_buckets=0):
+    """Get the turns of one spilled bucket, newest bucket first; [] when there are no more"""
+    bucket = conversation_collection.find_one(
+        {"user_id": user_id},
+        {"_id": 0, "turns": 1},
+        sort=[("_id", -1)],
+        skip=skip_buckets
+    )
+    return bucket["turns"] if bucket else []
+
+def get_archived_chats(user_id=None, start_date=None, end_date=None, limit=500):
+    """Get up to `limit` archived chats, newest first, filtered like get_chat_history()"""
+    query = _chat_filter(user_id=user_id, start_date=start_date, end_date=end_date)
+    return list(
+        analytics_archive_collection.find(query)
+        .sort([("timestamp", -1), ("_id", -1)])
+        .limit(limit)
+    )
+
+def get_latest_chat_timestamp():
+    """Get the timestamp of the newest chat (an index-only lookup), or None"""
+    latest = analytics_chat_collection.find_one({}, {"timestamp": 1, "_id": 0}, sort=[("timestamp", -1)])
+    return latest["timestamp"] if latest else None
+
+def get_inquired_courses():
+    """Get the distinct course_inquiry values present in chat history"""
+    return sorted(c for c in analytics_chat_collection.distinct("course_inquiry") if c)
+
+# -------------------------------
+# Course catalog
+# -------------------------------
+# One document per course: {"name", <course fields>..., "match_keys"}, where
+# match_keys holds the lowercased name and aliases used to spot the course
+# in a message. Course fields sit at the top level so they can be projected.
+COURSE_INTERNAL_FIELDS = ("_id", "name", "match_keys")
+
+def _course_document(name, data):
+    aliases = data.get("aliases", [])
+    if isinstance(aliases, str):
+        aliases = [aliases]
+    match_keys = list(dict.fromkeys(key.lower() for key in [name, *aliases] if key))
+    return {**data, "name": name, "match_keys": match_keys}
+
+def _course_fields(document):
+    return {k: v for k, v in document.items() if k not in COURSE_INTERNAL_FIELDS}
+
+def _course_projection(fields=None):
+    if fields:
+        return {"_id": 0, "name": 1, **{field: 1 for field in fields}}
+    return {"_id": 0, "match_keys": 0}
+
+def _insert_courses(courses):
+    """Insert courses that don't exist yet; safe to run from several processes at once"""
+    if courses:
+        course_collection.bulk_write([
+            UpdateOne({"name": name}, {"$setOnInsert": _course_document(name, data)}, upsert=True)
+            for name, data in courses.items()
+        ], ordered=False)
+
+def migrate_course_data():
+    """Copy the legacy course_data blob into the courses collection, once"""
+    legacy = course_data_collection.find_one({"migrated_at": {"$exists": False}})
+    if not legacy:
+        return 0
+    courses = legacy.get("courses", {})
+    _insert_courses(courses)
+    course_data_collection.update_one({"_id": legacy["_id"]}, {"$set": {"migrated_at": datetime.now()}})
+    return len(courses)
+
+def get_course_data():
+    """Get the whole catalog as {course name: course data}"""
+    return {
+        course["name"]: _course_fields(course)
+        for course in course_collection.find({}, _course_projection()).sort("name", 1)
+    }
+
+def get_course_names():
+    """Get every course name, read from the name index"""
+    return [
+        course["name"] for course in
+        course_collection.find({}, {"_id": 0, "name": 1}).sort("name", 1)
+    ]
+
+def get_courses(names, fields=None):
+    """Get some courses as {name: data}, optionally only the given top-level fields"""
+    return {
+        course["name"]: _course_fields(course)
+        for course in course_collection.find({"name": {"$in": list(names)}}, _course_projection(fields))
+    }
+
+def find_course(name_or_alias, fields=None):
+    """Look up one course by name or alias (case-insensitive); returns (name, data) or None"""
+    course = course_collection.find_one({"match_keys": name_or_alias.strip().lower()}, _course_projection(fields))
+    return (course["name"], _course_fields(course)) if course else None
+
+def match_course(text):
+    """Name of the first course whose name or alias appears in `text`, or None"""
+    text = text.lower()
+    for course in course_collection.find({}, {"_id": 0, "name": 1, "match_keys": 1}).sort("name", 1):
+        if any(key in text for key in course["match_keys"]):
+            return course["name"]
+    return None
+
+def update_course_data(courses, remove_missing=True):
+    """Apply an edited catalog as per-course diffs.
+
+    Only courses whose fields changed are written, each with a $set/$unset
+    of just the changed top-level fields. With remove_missing, courses
+    absent from `courses` are deleted; otherwise `courses` may hold only
+    the courses being edited. Returns the number of courses written.
+    """
+    names = list(courses)
+    query = {} if remove_missing else {"name": {"$in": names}}
+    current = {course["name"]: course for course in course_collection.find(query, {"_id": 0})}
+    operations = []
+    for name, data in courses.items():
+        document = _course_document(name, data)
+        if name not in current:
+            operations.append(UpdateOne({"name": name}, {"$setOnInsert": document}, upsert=True))
+            continue
+        changed = {k: v for k, v in document.items() if current[name].get(k) != v}
+        removed = {k: "" for k in current[name] if k not in document}
+        update = {}
+        if changed:
+            update["$set"] = changed
+        if removed:
+            update["$unset"] = removed
+        if update:
+            operations.append(UpdateOne({"name": name}, update))
+    if remove_missing:
+        operations.extend(DeleteOne({"name": name}) for name in current if name not in courses)
+    if operations:
+        course_collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+# -------------------------------
+# Dashboard statistics
+# -------------------------------
+# The query builders and result shapers below are shared with
+# async_database.py, which runs the same queries concurrently.
+def _user_stats_queries():
+    """The count filters and daily-active pipeline behind get_user_stats()"""
+    now = datetime.now(pytz.timezone('Asia/Kolkata'))
+    today_start = datetime.combine(now.date(), datetime.min.time())
+    week_start = today_start - timedelta(days=7)
+    month_start = today_start - timedelta(days=30)
+    
+    counts = {
         # Total users
-        total_users = user_collection.count_documents({})
-        
+        'total_users': {},
         # Active users today
-        active_today = user_collection.count_documents({
-            'last_active': {'$gte': today_start}
-        })
-        
+        'active_today': {'last_active': {'$gte': today_start}},
         # New users today
-        new_users_today = user_collection.count_documents({
-            'created_at': {'$gte': today_start}
-        })
-        
+        'new_users_today': {'created_at': {'$gte': today_start}},
         # Active users this week
-        active_this_week = user_collection.count_documents({
-            'last_active': {'$gte': week_start}
-        })
-        
+        'active_this_week': {'last_active': {'$gte': week_start}},
         # Active users this month
-        active_this_month = user_collection.count_documents({
-            'last_active': {'$gte': month_start}
-        })
-        
+        'active_this_month': {'last_active': {'$gte': month_start}},
         # Returning users
-        returning_users = user_collection.count_documents({
-            'access_count': {'$gt': 1}
+        'returning_users': {'access_count': {'$gt': 1}}
+    }
+    
+    # Daily active users for the last 7 days
+    pipeline = [
+        {
+            '$match': {
+                'last_active': {'$gte': week_start}
+            }
+        },
+        {
+            '$group': {
+                '_id': {
+                    '$dateToString': {
+                        'format': '%Y-%m-%d',
+                        'date': '$last_active'
+                    }
+                },
+                'count': {'$sum': 1}
+            }
+        },
+        {
+            '$sort': {'_id': 1}
+        }
+    ]
+    return today_start, counts, pipeline
+
+def _user_stats_result(today_start, counts, daily_active):
+    # Ensure we have data for all 7 days
+    daily_active_users = []
+    for i in range(7):
+        date = (today_start - timedelta(days=i)).strftime('%Y-%m-%d')
+        count = next((item['count'] for item in daily_active if item['_id'] == date), 0)
+        daily_active_users.append({
+            'date': date,
+            'count': count
         })
-        
-        # Daily active users for the last 7 days
-        pipeline = [
-            {
-                '$match': {
-                    'last_active': {'$gte': week_start}
+    
+    daily_active_users.sort(key=lambda x: x['date'])
+    
+    return {**counts, 'daily_active_users': daily_active_users}
+
+def get_user_stats():
+    """Get comprehensive user statistics."""
+    try:
+        today_start, queries, pipeline = _user_stats_queries()
+        counts = {name: analytics_user_collection.count_documents(query) for name, query in queries.items()}
+        daily_active = list(analytics_user_collection.aggregate(pipeline))
+        return _user_stats_result(today_start, counts, daily_active)
+    except Exception as e:
+        print(f"Error fetching user stats: {str(e)}")
+        return {}
+
+# A user's chats belong to the same session unless they are this far apart
+SESSION_GAP_MINUTES = 30
+
+def get_session_stats(start_date=None, end_date=None, gap_minutes=SESSION_GAP_MINUTES):
+    """Get gap-based session statistics for a date range.
+
+    Sessions are computed inside MongoDB with $setWindowFields: chats are
+    ordered per user, a gap longer than `gap_minutes` starts a new session,
+    and only the per-session aggregates come back to Python.
+    """
+    pipeline = _session_stats_pipeline(start_date, end_date, gap_minutes)
+    return _session_stats_result(next(analytics_chat_collection.aggregate(pipeline, allowDiskUse=True), None))
+
+def _session_stats_pipeline(start_date=None, end_date=None, gap_minutes=SESSION_GAP_MINUTES):
+    return [
+        {'$match': _chat_filter(start_date=start_date, end_date=end_date)},
+        {'$project': {'_id': 0, 'user_id': 1, 'timestamp': 1}},
+        # Time since the same user's previous chat
+        {
+            '$setWindowFields': {
+                'partitionBy': '$user_id',
+                'sortBy': {'timestamp': 1},
+                'output': {
+                    'previous': {'$shift': {'output': '$timestamp', 'by': -1}}
                 }
-            },
-            {
-                '$group': {
-                    '_id': {
-                        '$dateToString': {
-                            'format': '%Y-%m-%d',
-                            'date': '$last_active'
-                        }
-                    },
-                    'count': {'$sum': 1}
+            }
+        },
+        {
+            '$set': {
+                'new_session': {
+                    '$cond': [
+                        {
+                            '$or': [
+                                {'$eq': ['$previous', None]},
+                                {'$gt': [
+                                    {'$subtract': ['$timestamp', '$previous']},
+                                    gap_minutes * 60 * 1000
+                                ]}
+                            ]
+                        },
+                        1,
+                        0
+                    ]
                 }
-            },
-            {
-                '$sort': {'_id': 1}
             }
-        ]
-        
-        daily_active = list(user_collection.aggregate(pipeline))
-        
-        # Ensure we have data for all 7 days
-        daily_active_users = []
-        for i in range(7):
-            date = (today_start - timedelta(days=i)).strftime('%Y-%m-%d')
-            count = next((item['count'] for item in daily_active if item['_id'] == date), 0)
-            daily_active_users.append({
-                'date': date,
-                'count': count
-            })
-        
-        daily_active_users.sort(key=lambda x: x['date'])
-        
+        },
+        # Running count of session starts numbers each user's sessions
+        {
+            '$setWindowFields': {
+                'partitionBy': '$user_id',
+                'sortBy': {'timestamp': 1},
+                'output': {
+                    'session': {
+                        '$sum': '$new_session',
+                        'window': {'documents': ['unbounded', 'current']}
+                    }
+                }
+            }
+        },
+        {
+            '$group': {
+                '_id': {'user_id': '$user_id', 'session': '$session'},
+                'start': {'$min': '$timestamp'},
+                'end': {'$max': '$timestamp'},
+                'messages': {'$sum': 1}
+            }
+        },
+        {
+            '$group': {
+                '_id': None,
+                'sessions': {'$sum': 1},
+                'avg_duration_ms': {'$avg': {'$subtract': ['$end', '$start']}},
+                'avg_messages': {'$avg': '$messages'},
+                'messages': {'$sum': '$messages'}
+            }
+        }
+    ]
+
+def _session_stats_result(result):
+    if not result:
         return {
-            'total_users': total_users,
-            'active_today': active_today,
-            'new_users_today': new_users_today,
-            'active_this_week': active_this_week,
-            'active_this_month': active_this_month,
-            'returning_users': returning_users,
-            'daily_active_users': daily_active_users
+            'sessions': 0,
+            'avg_duration_minutes': 0,
+            'avg_messages_per_session': 0,
+            'messages': 0
         }
-    except Exception as e:
-        print(f"Error fetching user stats: {str(e)}")
-        return {}
+    return {
+        'sessions': result['sessions'],
+        'avg_duration_minutes': round(result['avg_duration_ms'] / 60000, 1),
+        'avg_messages_per_session': round(result['avg_messages'], 1),
+        'messages': result['messages']
+    }
 
-def get_course_inquiry_stats():
-    """Get statistics about course inquiries"""
+def get_top_questions(limit=20, days=30):
+    """Most asked questions of the last `days` days, matched case- and space-insensitively"""
+    since = datetime.now(pytz.timezone('Asia/Kolkata')) - timedelta(days=days)
     pipeline = [
+        {'$match': {'timestamp': {'$gte': since}}},
+        {'$group': {
+            '_id': {'$toLower': {'$trim': {'input': '$user_message'}}},
+            'question': {'$first': '$user_message'},
+            'count': {'$sum': 1}
+        }},
+        {'$sort': {'count': -1}},
+        {'$limit': limit}
+    ]
+    return [
+        {'question': row['question'], 'count': row['count']}
+        for row in analytics_chat_collection.aggregate(pipeline, allowDiskUse=True)
+    ]
+
+def get_trending_questions(days=7, limit=10):
+    """Most asked questions of the last `days` IST days, estimated from trending.py's sketches"""
+    today = datetime.now(pytz.timezone('Asia/Kolkata')).date()
+    since = (today - timedelta(days=days - 1)).isoformat()
+    return merge_top(analytics_trending_collection.find({"day": {"$gte": since}}), limit)
+
+def get_usage_records(start_date=None, end_date=None):
+    """Model, token and latency figures of the chats in a date range that recorded them"""
+    query = _chat_filter(start_date=start_date, end_date=end_date)
+    query["usage"] = {"$exists": True}
+    return list(analytics_chat_collection.find(
+        query,
+        {"_id": 0, "timestamp": 1, "course_inquiry": 1, "usage": 1}
+    ))
+
+def _course_inquiry_pipeline():
+    return [
         {
             '$match': {
                 'course_inquiry': {'$ne': None}
@@ -284,9 +898,8 @@ def get_course_inquiry_stats():
             '$sort': {'count': -1}
         }
     ]
-    
-    course_stats = list(chat_collection.aggregate(pipeline))
-    
+
+def _course_inquiry_result(course_stats):
     # Convert to format suitable for pie chart
     total_inquiries = sum(stat['count'] for stat in course_stats)
     course_distribution = {
@@ -296,3 +909,8 @@ def get_course_inquiry_stats():
     }
     
     return course_distribution
+
+def get_course_inquiry_stats():
+    """Get statistics about course inquiries"""
+    course_stats = list(analytics_chat_collection.aggregate(_course_inquiry_pipeline()))
+    return _course_inquiry_result(course_stats)
@@ -0,0 +1,269 @@
+"""Process-wide performance metrics.
+
+Everything here lives in the memory of one Streamlit server process and is
+shared by all of its sessions; the admin page reads it to show how the
+process is doing.
+"""
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+import streamlit as st
+from pymongo import monitoring
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+# How many recent reruns to keep per-rerun command counts for
+RECENT_RERUNS = 500
+
+# Sessions that haven't reported their memory for this long are assumed gone
+SESSION_IDLE_SECONDS = 3600
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are bucket upper bounds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """Smallest bucket bound covering fraction `q` of observations"""
+        if not self.count:
+            return 0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return self.max if bound == math.inf else bound
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+# -------------------------------
+# Rerun tracking
+# -------------------------------
+def is_fragment_rerun():
+    """Return True when only a fragment (not the whole script) is rerunning"""
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+
+def record_rerun():
+    """Count the current rerun as full or partial in st.session_state.rerun_stats"""
+    if 'rerun_stats' not in st.session_state:
+        st.session_state.rerun_stats = {"full": 0, "partial": 0}
+    st.session_state.rerun_stats["partial" if is_fragment_rerun() else "full"] += 1
+
+
+def current_rerun():
+    """Identify the running script as (session_id, rerun number)"""
+    ctx = get_script_run_ctx(suppress_warning=True)
+    if ctx is None:
+        return ("background", 0)
+    try:
+        stats = ctx.session_state["rerun_stats"]
+        return (ctx.session_id, stats["full"] + stats["partial"])
+    except KeyError:
+        return (ctx.session_id, 0)
+
+
+def call_site():
+    """Name the innermost repo function on the stack, e.g. "database.save_chat" """
+    this_file = os.path.abspath(__file__)
+    frame = sys._getframe(1)
+    while frame:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(ROOT) and filename != this_file and "site-packages" not in filename:
+            module = os.path.splitext(os.path.relpath(filename, ROOT))[0].replace(os.sep, ".")
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "unknown"
+
+
+# -------------------------------
+# Per-session memory
+# -------------------------------
+class SessionMemory:
+    """Latest conversation-state size reported by each live session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def observe(self, session_id, nbytes, turns):
+        with self._lock:
+            self._sessions[session_id] = {"bytes": nbytes, "turns": turns, "at": time.time()}
+
+    def report(self):
+        """{"sessions", "total_bytes", "mean_bytes", "p95_bytes", "max_bytes", "max_turns"}"""
+        cutoff = time.time() - SESSION_IDLE_SECONDS
+        with self._lock:
+            for session_id in [s for s, m in self._sessions.items() if m["at"] < cutoff]:
+                del self._sessions[session_id]
+            sizes = sorted(m["bytes"] for m in self._sessions.values())
+            max_turns = max((m["turns"] for m in self._sessions.values()), default=0)
+        if not sizes:
+            return {"sessions": 0, "total_bytes": 0, "mean_bytes": 0, "p95_bytes": 0, "max_bytes": 0, "max_turns": 0}
+        return {
+            "sessions": len(sizes),
+            "total_bytes": sum(sizes),
+            "mean_bytes": sum(sizes) // len(sizes),
+            "p95_bytes": sizes[min(len(sizes) - 1, int(0.95 * len(sizes)))],
+            "max_bytes": sizes[-1],
+            "max_turns": max_turns,
+        }
+
+
+session_memory = SessionMemory()
+
+
+# -------------------------------
+# Cache hit ratios
+# -------------------------------
+class CacheStats:
+    """Outcome counts (l1_hits, l2_hits, misses, computes, evictions) per cache namespace"""
+
+    OUTCOMES = ("l1_hits", "l2_hits", "misses", "computes", "evictions")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def record(self, namespace, outcome):
+        with self._lock:
+            counts = self._counts.setdefault(namespace, dict.fromkeys(self.OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def report(self):
+        """One row per namespace with its counts and overall hit ratio"""
+        with self._lock:
+            rows = [{"namespace": ns, **counts} for ns, counts in sorted(self._counts.items())]
+        for row in rows:
+            lookups = row["l1_hits"] + row["l2_hits"] + row["misses"]
+            row["hit_ratio"] = round((row["l1_hits"] + row["l2_hits"]) / lookups, 3) if lookups else 0
+        return rows
+
+
+cache_stats = CacheStats()
+
+
+# -------------------------------
+# MongoDB command instrumentation
+# -------------------------------
+class CommandStats:
+    def __init__(self):
+        self.commands = {}
+        self.errors = 0
+        self.latency = Histogram()
+
+
+class DatabaseCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command and attributes it to a call site and rerun.
+
+    pymongo publishes `started` on the thread that issued the command, so
+    the Streamlit script context and calling function are still on hand.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.by_call_site = {}
+        self.reruns = OrderedDict()
+
+    def started(self, event):
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                call_site(), current_rerun(), event.command_name
+            )
+
+    def _finish(self, event, failed):
+        with self._lock:
+            tags = self._pending.pop((event.connection_id, event.request_id), None)
+            if tags is None:
+                return
+            site, rerun, command = tags
+            duration_ms = event.duration_micros / 1000
+
+            stats = self.by_call_site.setdefault(site, CommandStats())
+            stats.commands[command] = stats.commands.get(command, 0) + 1
+            stats.errors += failed
+            stats.latency.observe(duration_ms)
+
+            if rerun[0] != "background":
+                per_rerun = self.reruns.setdefault(rerun, {"commands": 0, "ms": 0.0, "at": time.time()})
+                per_rerun["commands"] += 1
+                per_rerun["ms"] += duration_ms
+                while len(self.reruns) > RECENT_RERUNS:
+                    self.reruns.popitem(last=False)
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+    def call_site_report(self):
+        """One row per call site with counts and latency percentiles"""
+        with self._lock:
+            return [
+                {
+                    "call_site": site,
+                    "commands": sum(stats.commands.values()),
+                    "by_command": ", ".join(f"{k}×{v}" for k, v in sorted(stats.commands.items())),
+                    "errors": stats.errors,
+                    "mean_ms": round(stats.latency.mean, 2),
+                    "p50_ms": stats.latency.percentile(0.5),
+                    "p95_ms": stats.latency.percentile(0.95),
+                    "p99_ms": stats.latency.percentile(0.99),
+                    "total_ms": round(stats.latency.total, 1),
+                }
+                for site, stats in self.by_call_site.items()
+            ]
+
+    def latency_buckets(self):
+        """Combined latency histogram over all call sites as {bucket label: count}"""
+        with self._lock:
+            counts = [0] * len(LATENCY_BUCKETS_MS)
+            for stats in self.by_call_site.values():
+                counts = [a + b for a, b in zip(counts, stats.latency.counts)]
+        labels = [f"≤{b:g} ms" if b != math.inf else "slower" for b in LATENCY_BUCKETS_MS]
+        return dict(zip(labels, counts))
+
+    def rerun_report(self):
+        """Commands and DB time of the most recent reruns, newest first"""
+        with self._lock:
+            return [
+                {"session": session[:8], "rerun": rerun, "commands": r["commands"], "db_ms": round(r["ms"], 1)}
+                for (session, rerun), r in reversed(self.reruns.items())
+            ]
+
+    def reset(self):
+        with self._lock:
+            self.by_call_site.clear()
+            self.reruns.clear()
+
+
+db_command_listener = DatabaseCommandListener()
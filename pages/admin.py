@@ -4,13 +4,38 @@ from database import (
     verify_admin,
     verify_admin_session,
     get_chat_history,
+    get_chat_page,
+    search_chats,
+    get_user_thread,
+    approve_chat,
+    get_archived_chats,
+    get_inquired_courses,
+    get_latest_chat_timestamp,
+    get_session_stats,
     get_course_data,
+    get_course_names,
+    get_courses,
     update_course_data,
     get_user_stats,
-    get_course_inquiry_stats
+    get_course_inquiry_stats,
+    get_usage_records,
+    get_trending_questions,
+    write_spool,
+    CHAT_RETENTION_DAYS
 )
+from assets import get_image
+from metrics import db_command_listener, record_rerun, session_memory, cache_stats
+from analytics_snapshot import load_chats, read_watermark, start_snapshot_job
+from retention import start_retention_job
+from rate_limit import get_top_consumers
+from cache import stats_cache, course_cache
+import async_database
+from warmup import start_warmup
+from retrieval import approve_answer
 import json
+import time
 from datetime import datetime, timedelta
+from pymongo.errors import ExecutionTimeout
 import streamlit.components.v1 as components
 import plotly.express as px
 import pytz
@@ -131,6 +156,120 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
+# Dashboard query results are shared by every admin session of every replica
+# through stats_cache. The newest chat timestamp is part of each cache key, so
+# a new chat makes the next lookup miss; the TTL bounds staleness for user activity.
+DASHBOARD_CACHE_TTL = 300  # seconds
+
+# Gemini prices in USD per million tokens, for the cost estimates
+INPUT_PRICE_PER_MILLION = st.secrets.get("GEMINI_INPUT_PRICE_PER_MILLION", 0.10)
+OUTPUT_PRICE_PER_MILLION = st.secrets.get("GEMINI_OUTPUT_PRICE_PER_MILLION", 0.40)
+
+def _now():
+    return datetime.now(pytz.timezone('Asia/Kolkata'))
+
+def load_overview(data_version, start_date, end_date, include_chats):
+    """Cached Overview queries as {name: (result, time computed)}.
+
+    Whatever is not cached runs concurrently on the async data layer, so a
+    cold Overview takes about as long as its slowest query.
+    """
+    queries = {
+        "user_stats": (
+            ["user_stats", data_version],
+            lambda: async_database.get_user_stats(),
+            lambda: get_user_stats()
+        ),
+        "course_inquiry_stats": (
+            ["course_inquiry_stats", data_version],
+            lambda: async_database.get_course_inquiry_stats(),
+            lambda: get_course_inquiry_stats()
+        ),
+        "session_stats": (
+            ["session_stats", data_version, start_date, end_date],
+            lambda: async_database.get_session_stats(start_date, end_date),
+            lambda: get_session_stats(start_date, end_date)
+        ),
+    }
+    if include_chats:
+        queries["chat_history"] = (
+            ["chat_history", data_version, start_date, end_date],
+            lambda: async_database.get_chat_history(start_date=start_date, end_date=end_date),
+            lambda: get_chat_history(start_date=start_date, end_date=end_date)
+        )
+    
+    results = {name: stats_cache.get(key) for name, (key, _, _) in queries.items()}
+    missing = [name for name, result in results.items() if result is None]
+    if missing:
+        try:
+            computed = async_database.run(async_database.gather(**{name: queries[name][1]() for name in missing}))
+        except Exception as e:
+            print(f"Error running overview queries concurrently: {str(e)}")
+            computed = {name: queries[name][2]() for name in missing}
+        as_of = _now()
+        for name in missing:
+            results[name] = (computed[name], as_of)
+            stats_cache.set(queries[name][0], results[name], DASHBOARD_CACHE_TTL)
+    return results
+
+def load_inquired_courses(data_version):
+    """Cached get_inquired_courses()"""
+    return stats_cache.get_or_compute(
+        ["inquired_courses", data_version],
+        get_inquired_courses,
+        DASHBOARD_CACHE_TTL
+    )
+
+def load_usage(data_version, start_date, end_date):
+    """Cached get_usage_records() as a flat DataFrame with an IST `date` column"""
+    records = stats_cache.get_or_compute(
+        ["usage", data_version, start_date, end_date],
+        lambda: get_usage_records(start_date, end_date),
+        DASHBOARD_CACHE_TTL
+    )
+    if not records:
+        return pd.DataFrame()
+    df = pd.json_normalize(records)
+    df.columns = [column.replace("usage.", "") for column in df.columns]
+    df['date'] = pd.to_datetime(df['timestamp'], utc=True).dt.tz_convert('Asia/Kolkata').dt.date
+    df['course_inquiry'] = df['course_inquiry'].fillna("General")
+    df['cost_usd'] = (
+        df['input_tokens'] * INPUT_PRICE_PER_MILLION + df['output_tokens'] * OUTPUT_PRICE_PER_MILLION
+    ) / 1e6
+    return df
+
+def load_trending(data_version, days):
+    """Cached get_trending_questions(); merges a fixed number of small sketches, whatever the chat volume"""
+    return stats_cache.get_or_compute(
+        ["trending_questions", data_version, days],
+        lambda: get_trending_questions(days),
+        DASHBOARD_CACHE_TTL
+    )
+
+# The Parquet snapshot is local to this machine, so its scans stay in st.cache_data
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def load_snapshot_chats(snapshot_version, start_date, end_date):
+    """Cached scan of the Parquet snapshot; snapshot_version is the last export time"""
+    return load_chats(start_date, end_date, columns=["timestamp", "user_id"])
+
+@st.cache_resource(show_spinner=False)
+def snapshot_job():
+    """Start the background Parquet export once per server process"""
+    return start_snapshot_job()
+
+@st.cache_resource(show_spinner=False)
+def retention_job():
+    """Start the background archiving of old chats once per server process"""
+    return start_retention_job()
+
+def clear_dashboard_cache():
+    """Drop every cached dashboard result so the next view hits the database"""
+    stats_cache.invalidate()
+    load_snapshot_chats.clear()
+
+def show_data_as_of(as_of):
+    st.caption(f"🕒 Data as of {as_of.strftime('%d %b %Y, %H:%M:%S')} IST")
+
 def show_login():
     st.markdown("""
         <div class="login-container">
@@ -153,6 +292,9 @@ def show_login():
     st.markdown("</div>", unsafe_allow_html=True)
 
 def show_admin_dashboard():
+    snapshot_job()
+    retention_job()
+    
     # Header with logout button
     st.markdown("""
         <div class="admin-header">
@@ -165,13 +307,13 @@ def show_admin_dashboard():
     
     # Sidebar navigation with improved styling
     with st.sidebar:
-        st.image("./Resources/rbu.jpeg", use_container_width=True)
+        st.image(get_image("rbu.jpeg"), use_container_width=True)
         
         st.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
         st.markdown('<div class="sidebar-header">🎯 Navigation</div>', unsafe_allow_html=True)
         page = st.radio(
             "Navigation Menu",
-            ["Overview", "Chat Analytics", "Course Data Management"],
+            ["Overview", "Chat Analytics", "Search", "Cost & Latency", "Course Data Management", "Performance"],
             label_visibility="collapsed"
         )
         st.markdown('</div>', unsafe_allow_html=True)
@@ -179,6 +321,9 @@ def show_admin_dashboard():
         # Admin Actions
         st.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
         st.markdown('<div class="sidebar-header">⚙️ Admin Actions</div>', unsafe_allow_html=True)
+        if st.button("🔄 Refresh Data", key="refresh_btn"):
+            clear_dashboard_cache()
+            st.rerun()
         if st.button("🚪 Logout", key="logout_btn"):
             st.session_state['admin_session_token'] = None
             st.rerun()
@@ -188,13 +333,29 @@ def show_admin_dashboard():
         show_overview()
     elif page == "Chat Analytics":
         show_chat_analytics()
+    elif page == "Search":
+        show_chat_search()
+    elif page == "Cost & Latency":
+        show_cost_latency()
+    elif page == "Performance":
+        show_performance()
     else:
         show_course_management()
 
 def show_overview():
+    # The date range inputs are drawn further down; read their values from
+    # the last run so every query can be issued at once up here
+    start_date = st.session_state.get("overview_start_date", (datetime.now() - timedelta(days=30)).date())
+    end_date = st.session_state.get("overview_end_date", datetime.now().date())
+    
+    # Chat metrics come from the Parquet snapshot once the first export is done
+    watermark = read_watermark()
+    
     # Get user statistics
-    user_stats = get_user_stats()
-    course_stats = get_course_inquiry_stats()
+    data_version = get_latest_chat_timestamp()
+    overview = load_overview(data_version, start_date, end_date, include_chats=watermark is None)
+    user_stats, stats_as_of = overview["user_stats"]
+    course_stats, course_as_of = overview["course_inquiry_stats"]
     
     # User Statistics Section
     st.markdown("""
@@ -315,6 +476,8 @@ def show_overview():
         st.plotly_chart(fig, use_container_width=True)
         st.markdown("</div></div>", unsafe_allow_html=True)
     
+    show_trending_questions(data_version)
+    
     # Date range selector for chat analytics
     st.markdown("""
         <div class="section-container">
@@ -340,16 +503,17 @@ def show_overview():
     
     st.markdown("</div></div>", unsafe_allow_html=True)
     
-    # Get chat history
-    chats = get_chat_history()
-    df = pd.DataFrame(chats)
+    if watermark:
+        filtered_df = load_snapshot_chats(watermark["exported_at"], start_date, end_date)
+        chats_as_of = watermark["exported_at"].astimezone(pytz.timezone('Asia/Kolkata'))
+    else:
+        chats, chats_as_of = overview["chat_history"]
+        filtered_df = pd.DataFrame(chats)
+        if not filtered_df.empty:
+            filtered_df['date'] = pd.to_datetime(filtered_df['timestamp']).dt.date
+    show_data_as_of(min(stats_as_of, course_as_of, chats_as_of))
     
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['timestamp']).dt.date
-        filtered_df = df[
-            (df['date'] >= start_date) & 
-            (df['date'] <= end_date)
-        ]
+    if not filtered_df.empty:
         
         # Chat Metrics
         st.markdown("""
@@ -357,10 +521,12 @@ def show_overview():
                 <div class="section-title">💬 Chat Metrics</div>
         """, unsafe_allow_html=True)
         
+        session_stats, _ = overview["session_stats"]
         metrics = [
-            (len(filtered_df['date'].unique()), "📊 Total Sessions", "#E3F2FD"),
+            (session_stats['sessions'], "📊 Total Sessions", "#E3F2FD"),
             (len(filtered_df), "💬 Total Messages", "#F3E5F5"),
-            (9, "⏱️ Average Session Time (Mins)", "#E8F5E9"),
+            (session_stats['avg_messages_per_session'], "🗨️ Messages per Session", "#FFEBEE"),
+            (session_stats['avg_duration_minutes'], "⏱️ Average Session Time (Mins)", "#E8F5E9"),
             (len(filtered_df['user_id'].unique()) if 'user_id' in filtered_df.columns else 0, "👥 Unique Chatters", "#FFF3E0")
         ]
         
@@ -368,7 +534,7 @@ def show_overview():
         col1, col2 = st.columns(2)
         
         with col1:
-            for value, label, color in metrics[:2]:
+            for value, label, color in metrics[:3]:
                 st.markdown(f"""
                     <div class="metric-card" style="background-color: {color};">
                         <div class="metric-value">{value}</div>
@@ -377,7 +543,7 @@ def show_overview():
                 """, unsafe_allow_html=True)
         
         with col2:
-            for value, label, color in metrics[2:]:
+            for value, label, color in metrics[3:]:
                 st.markdown(f"""
                     <div class="metric-card" style="background-color: {color};">
                         <div class="metric-value">{value}</div>
@@ -389,6 +555,30 @@ def show_overview():
     else:
         st.info("No chat history available")
 
+def show_trending_questions(data_version):
+    """Most asked questions this week and today, from the streaming sketches of trending.py"""
+    st.markdown("""
+        <div class="section-container">
+            <div class="section-title">🔥 Trending Questions</div>
+    """, unsafe_allow_html=True)
+    st.caption("Estimated counts of questions, reworded versions counted together; updated about once a minute.")
+    
+    col1, col2 = st.columns(2)
+    for column, label, days in ((col1, "This Week", 7), (col2, "Today", 1)):
+        with column:
+            st.markdown(f"**{label}**")
+            trending = pd.DataFrame(load_trending(data_version, days))
+            if trending.empty:
+                st.info("No questions counted yet")
+            else:
+                st.dataframe(
+                    trending.rename(columns={"question": "Question", "count": "Asked", "share": "% of Questions"}),
+                    use_container_width=True,
+                    hide_index=True
+                )
+    
+    st.markdown("</div>", unsafe_allow_html=True)
+
 def show_chat_analytics():
     st.header("Chat Analytics")
     
@@ -416,16 +606,37 @@ def show_chat_analytics():
     
     st.markdown("</div>", unsafe_allow_html=True)
     
-    # Get chat history
-    chats = get_chat_history()
-    df = pd.DataFrame(chats)
+    # Server-side filters for the conversation browser
+    col1, col2 = st.columns(2)
+    with col1:
+        user_filter = st.text_input(
+            "User ID",
+            key="analytics_user_filter",
+            placeholder="Filter by user ID"
+        ).strip()
+    with col2:
+        course_filter = st.selectbox(
+            "Course Inquiry",
+            ["All"] + load_inquired_courses(get_latest_chat_timestamp()),
+            key="analytics_course_filter"
+        )
+    filters = {
+        "user_id": user_filter or None,
+        "course_inquiry": None if course_filter == "All" else course_filter,
+        "start_date": start_date,
+        "end_date": end_date
+    }
     
-    if not df.empty:
-        df['date'] = pd.to_datetime(df['timestamp']).dt.date
-        filtered_df = df[
-            (df['date'] >= start_date) & 
-            (df['date'] <= end_date)
-        ]
+    # One keyset cursor per visited page; reset whenever the filters change
+    if st.session_state.get('chat_browser_filters') != filters:
+        st.session_state['chat_browser_filters'] = filters
+        st.session_state['chat_browser_cursors'] = [None]
+    cursors = st.session_state['chat_browser_cursors']
+    
+    chats, next_cursor = get_chat_page(after=cursors[-1], **filters)
+    
+    if chats:
+        df = pd.DataFrame(chats)
         
         # Chat history in a more modern table
         st.markdown("""
@@ -434,20 +645,56 @@ def show_chat_analytics():
         """, unsafe_allow_html=True)
         
         st.dataframe(
-            filtered_df[['timestamp', 'user_message', 'bot_response']]
-            .sort_values('timestamp', ascending=False)
-            .head(50),
+            df[['timestamp', 'user_id', 'course_inquiry', 'user_message', 'bot_response']],
             use_container_width=True
         )
         
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("⬅️ Previous", key="chat_browser_prev", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            st.markdown(f"<div style='text-align: center;'>Page {len(cursors)}</div>", unsafe_allow_html=True)
+        with col3:
+            if st.button("Next ➡️", key="chat_browser_next", disabled=next_cursor is None):
+                cursors.append(next_cursor)
+                st.rerun()
+        
+        # Drill into one user's full thread
+        thread_user = st.selectbox(
+            "View full conversation for user",
+            list(dict.fromkeys(df['user_id'])),
+            key="analytics_thread_user"
+        )
+        if st.button("💬 Show Conversation", key="show_thread"):
+            st.session_state['analytics_thread_shown'] = thread_user
+        if st.session_state.get('analytics_thread_shown') == thread_user:
+            for chat in get_user_thread(thread_user):
+                with st.chat_message("user"):
+                    st.markdown(chat['user_message'])
+                    st.caption(str(chat['timestamp']))
+                with st.chat_message("assistant"):
+                    st.markdown(chat['bot_response'])
+                    # Approved answers are retrieved as references for similar questions
+                    if chat.get('approved_at'):
+                        st.caption("✅ Approved for retrieval")
+                    elif st.button("✅ Approve Answer", key=f"approve-{chat['_id']}"):
+                        approved = approve_chat(chat['_id'])
+                        if approved:
+                            approve_answer(approved)
+                            st.rerun()
+                        else:
+                            st.warning("This chat has been moved to the archive and can no longer be approved.")
+        
         # Download button with better styling
         st.markdown("""
             <div style="margin-top: 15px;">
         """, unsafe_allow_html=True)
-        csv = filtered_df.to_csv(index=False)
+        # Only export the full filtered history when the button is clicked
         st.download_button(
             "📥 Download Chat History",
-            csv,
+            lambda: pd.DataFrame(get_chat_history(**filters)).to_csv(index=False),
             "chat_history.csv",
             "text/csv",
             key='download-csv'
@@ -456,12 +703,127 @@ def show_chat_analytics():
         
     else:
         st.info("No chat history available for the selected date range")
+    
+    show_archive_browser()
+
+def show_chat_search():
+    st.header("Search Conversations")
+    st.caption(
+        f"Searches the questions and answers of the last {CHAT_RETENTION_DAYS} days. "
+        'Put a phrase in "quotes" to match it exactly and -word to leave out chats with a word; '
+        "matches in the question rank above matches in the answer."
+    )
+    
+    text = st.text_input(
+        "Search",
+        key="search_text",
+        placeholder='e.g. hostel fees, "admission deadline" -mba'
+    ).strip()
+    col1, col2, col3 = st.columns(3)
+    today = datetime.now(pytz.timezone('Asia/Kolkata')).date()
+    with col1:
+        start_date = st.date_input("From", today - timedelta(days=CHAT_RETENTION_DAYS), key="search_start_date")
+    with col2:
+        end_date = st.date_input("To", today, key="search_end_date")
+    with col3:
+        course_filter = st.selectbox(
+            "Course Inquiry",
+            ["All"] + load_inquired_courses(get_latest_chat_timestamp()),
+            key="search_course_filter"
+        )
+    if not text:
+        st.info("Enter words to search for")
+        return
+    filters = {
+        "text": text,
+        "course_inquiry": None if course_filter == "All" else course_filter,
+        "start_date": start_date,
+        "end_date": end_date
+    }
+    
+    # Back to the first page whenever the search changes
+    if st.session_state.get('search_filters') != filters:
+        st.session_state['search_filters'] = filters
+        st.session_state['search_page'] = 0
+    page = st.session_state['search_page']
+    
+    start = time.perf_counter()
+    try:
+        chats, has_next = search_chats(page=page, **filters)
+    except ExecutionTimeout:
+        st.warning("This search matches too many conversations to rank in time. Add words, or narrow the dates or the course.")
+        return
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    if not chats:
+        st.info("No conversations match this search")
+        return
+    
+    st.caption(f"Page {page + 1} · {elapsed_ms:.0f} ms")
+    df = pd.DataFrame(chats)
+    df['score'] = df['score'].round(2)
+    st.dataframe(
+        df.reindex(columns=['score', 'timestamp', 'user_id', 'course_inquiry', 'user_message', 'bot_response']),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Previous", key="search_prev", disabled=page == 0):
+            st.session_state['search_page'] -= 1
+            st.rerun()
+    with col3:
+        if st.button("Next ➡️", key="search_next", disabled=not has_next):
+            st.session_state['search_page'] += 1
+            st.rerun()
+
+def show_archive_browser():
+    """Query chats moved out of the live collection by the retention job"""
+    with st.expander("🗄️ Archived Conversations"):
+        st.caption(f"Chats older than {CHAT_RETENTION_DAYS} days are moved to the archive and only loaded on request.")
+        archive_end = datetime.now(pytz.timezone('Asia/Kolkata')).date() - timedelta(days=CHAT_RETENTION_DAYS)
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            start_date = st.date_input("From", archive_end - timedelta(days=30), key="archive_start_date")
+        with col2:
+            end_date = st.date_input("To", archive_end, key="archive_end_date")
+        with col3:
+            user_id = st.text_input("User ID", key="archive_user_filter").strip()
+        
+        if st.button("🔎 Search Archive", key="archive_search"):
+            chats = get_archived_chats(user_id or None, start_date, end_date)
+            if chats:
+                df = pd.DataFrame(chats)
+                st.dataframe(
+                    df[['timestamp', 'user_id', 'course_inquiry', 'user_message', 'bot_response']],
+                    use_container_width=True
+                )
+                st.download_button(
+                    "📥 Download Archived Chats",
+                    df.drop(columns=['_id']).to_csv(index=False),
+                    "chat_history_archive.csv",
+                    "text/csv",
+                    key='download-archive-csv'
+                )
+            else:
+                st.info("No archived chats in this range")
 
 def show_course_management():
     st.header("Course Data Management")
     
-    # Get current course data
-    courses = get_course_data()
+    # Edit one course at a time; the full catalog is only loaded on request
+    course_names = get_course_names()
+    selected = st.selectbox(
+        "Course",
+        ["All courses"] + course_names,
+        key="course_editor_selection"
+    )
+    
+    if selected == "All courses":
+        courses = get_course_data()
+    else:
+        courses = get_courses([selected])
     
     # Display current data with better styling
     st.markdown("""
@@ -478,10 +840,13 @@ def show_course_management():
         <div style="margin-top: 20px; background-color: white; padding: 20px; border-radius: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
     """, unsafe_allow_html=True)
     
+    if selected == "All courses":
+        st.caption("Courses removed from this JSON are deleted. Add an \"aliases\" list to a course to match other spellings in chats.")
     edited_courses_str = st.text_area(
         "Edit course data (JSON format)",
         value=courses_str,
-        height=400
+        height=400,
+        key=f"course_editor_{selected}"
     )
     
     if st.button("💾 Update Course Data", key='update-course-data'):
@@ -490,13 +855,17 @@ def show_course_management():
             edited_courses = json.loads(edited_courses_str)
             
             # Validate the structure
-            if not isinstance(edited_courses, dict):
+            if not isinstance(edited_courses, dict) or not all(isinstance(v, dict) for v in edited_courses.values()):
                 st.error("❌ Invalid data structure")
                 return
             
-            # Update the database
-            update_course_data(edited_courses)
-            st.success("✅ Course data updated successfully!")
+            # Write only the courses and fields that changed
+            changed = update_course_data(edited_courses, remove_missing=selected == "All courses")
+            if changed:
+                course_cache.invalidate()
+                # Refresh the precomputed answers for the new catalog
+                start_warmup()
+            st.success(f"✅ Course data updated successfully! ({changed} course(s) changed)")
             
         except json.JSONDecodeError:
             st.error("❌ Invalid JSON format")
@@ -505,7 +874,179 @@ def show_course_management():
     
     st.markdown("</div>", unsafe_allow_html=True)
 
+USAGE_COLUMNS = ['cached', 'input_tokens', 'output_tokens', 'cost_usd', 'latency_ms']
+
+def _usage_summary(group):
+    """Token, cost and latency figures of a group of answers"""
+    calls = group[~group['cached']]
+    return pd.Series({
+        'answers': len(group),
+        'model_calls': len(calls),
+        'mean_input_tokens': round(calls['input_tokens'].mean(), 1) if len(calls) else 0,
+        'mean_output_tokens': round(calls['output_tokens'].mean(), 1) if len(calls) else 0,
+        'cost_usd': round(group['cost_usd'].sum(), 4),
+        'p50_latency_ms': round(group['latency_ms'].quantile(0.5), 1),
+        'p95_latency_ms': round(group['latency_ms'].quantile(0.95), 1),
+    })
+
+def show_cost_latency():
+    st.header("Cost & Latency")
+    st.caption(
+        "Tokens, estimated cost and response time of the assistant's answers. "
+        f"Prices: ${INPUT_PRICE_PER_MILLION} / ${OUTPUT_PRICE_PER_MILLION} per million input / output tokens. "
+        "Answers served from the answer cache use no tokens."
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input(
+            "Start Date",
+            datetime.now(pytz.timezone('Asia/Kolkata')) - timedelta(days=30),
+            key="cost_start_date"
+        )
+    with col2:
+        end_date = st.date_input(
+            "End Date",
+            datetime.now(pytz.timezone('Asia/Kolkata')),
+            key="cost_end_date"
+        )
+    
+    df = load_usage(get_latest_chat_timestamp(), start_date, end_date)
+    if df.empty:
+        st.info("No answers with token and latency data in the selected date range")
+        return
+    
+    calls = df[~df['cached']]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🤖 Model Calls", len(calls), f"{len(df) - len(calls)} cached", delta_color="off")
+    with col2:
+        st.metric("📥 Mean Input Tokens", round(calls['input_tokens'].mean()) if len(calls) else 0)
+    with col3:
+        st.metric("💰 Estimated Cost (USD)", f"{df['cost_usd'].sum():.4f}")
+    with col4:
+        st.metric("⏱️ p50 / p95 Latency (s)", f"{df['latency_ms'].quantile(0.5) / 1000:.2f} / {df['latency_ms'].quantile(0.95) / 1000:.2f}")
+    
+    st.subheader("By Day")
+    daily = df.groupby('date')[USAGE_COLUMNS].apply(_usage_summary).astype({'answers': int, 'model_calls': int}).reset_index()
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = px.box(calls, x='date', y='input_tokens', labels={'date': 'Date', 'input_tokens': 'Input Tokens'})
+        fig.update_layout(height=350, margin=dict(t=10, b=0, l=0, r=0))
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        fig = px.line(
+            daily, x='date', y=['p50_latency_ms', 'p95_latency_ms'],
+            labels={'date': 'Date', 'value': 'Latency (ms)', 'variable': ''}
+        )
+        fig.update_layout(height=350, margin=dict(t=10, b=0, l=0, r=0))
+        st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(daily, use_container_width=True, hide_index=True)
+    
+    st.subheader("By Course Inquiry")
+    by_course = df.groupby('course_inquiry')[USAGE_COLUMNS].apply(_usage_summary).astype({'answers': int, 'model_calls': int}).reset_index()
+    col1, col2 = st.columns(2)
+    with col1:
+        fig = px.box(calls, x='course_inquiry', y='input_tokens', labels={'course_inquiry': 'Course', 'input_tokens': 'Input Tokens'})
+        fig.update_layout(height=350, margin=dict(t=10, b=0, l=0, r=0))
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        fig = px.box(df, x='course_inquiry', y='latency_ms', labels={'course_inquiry': 'Course', 'latency_ms': 'Latency (ms)'})
+        fig.update_layout(height=350, margin=dict(t=10, b=0, l=0, r=0))
+        st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(by_course.sort_values('cost_usd', ascending=False), use_container_width=True, hide_index=True)
+
+def show_performance():
+    st.header("Performance")
+    
+    # Conversation state held by the chat sessions of this process
+    st.subheader("Session Memory")
+    memory = session_memory.report()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("👥 Live Sessions", memory['sessions'])
+    with col2:
+        st.metric("💾 Total (KB)", round(memory['total_bytes'] / 1024, 1))
+    with col3:
+        st.metric("📏 Mean / p95 per Session (KB)", f"{memory['mean_bytes'] / 1024:.1f} / {memory['p95_bytes'] / 1024:.1f}")
+    with col4:
+        st.metric("📈 Largest Session (KB)", round(memory['max_bytes'] / 1024, 1), f"{memory['max_turns']} turns", delta_color="off")
+    
+    st.subheader("Write Spool")
+    spool = write_spool.report()
+    if spool['degraded']:
+        st.warning("The database is unavailable or slow: chats and heartbeats of this process are being written to the local spool and will be replayed when it recovers.")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("⏳ Waiting for Replay", spool['pending'])
+    with col2:
+        st.metric("📝 Spooled", spool['spooled'])
+    with col3:
+        st.metric("🔁 Replayed", spool['replayed'])
+    with col4:
+        st.metric("♻️ Already Applied", spool['already_applied'])
+    
+    st.subheader("Cache")
+    caches = pd.DataFrame(cache_stats.report())
+    if caches.empty:
+        st.info("No cache lookups recorded yet")
+    else:
+        st.dataframe(caches, use_container_width=True, hide_index=True)
+    
+    st.subheader("Top Consumers")
+    st.caption("Clients that sent the most questions to the assistant, per user session and per browser fingerprint.")
+    consumers = pd.DataFrame(get_top_consumers())
+    if consumers.empty:
+        st.info("No questions recorded yet")
+    else:
+        st.dataframe(consumers, use_container_width=True, hide_index=True)
+    
+    st.subheader("Database Commands")
+    st.caption("Database commands issued by this server process since it started, attributed to the function in database.py (or other module) that issued them.")
+    
+    call_sites = pd.DataFrame(db_command_listener.call_site_report())
+    if call_sites.empty:
+        st.info("No database commands recorded yet")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    reruns = pd.DataFrame(db_command_listener.rerun_report())
+    with col1:
+        st.metric("🗄️ DB Commands", int(call_sites['commands'].sum()))
+    with col2:
+        st.metric("⏱️ Total DB Time (ms)", round(call_sites['total_ms'].sum(), 1))
+    with col3:
+        st.metric("🔁 Commands per Rerun", round(reruns['commands'].mean(), 1) if not reruns.empty else 0)
+    
+    st.subheader("By Call Site")
+    st.dataframe(
+        call_sites.sort_values('total_ms', ascending=False),
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Command Latency")
+        buckets = db_command_listener.latency_buckets()
+        fig = px.bar(
+            x=list(buckets.keys()),
+            y=list(buckets.values()),
+            labels={'x': 'Latency', 'y': 'Commands'}
+        )
+        fig.update_layout(height=350, margin=dict(t=10, b=0, l=0, r=0))
+        st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        st.subheader("Recent Reruns")
+        st.dataframe(reruns, use_container_width=True, hide_index=True, height=350)
+    
+    if st.button("🧹 Reset Counters", key="reset_db_metrics"):
+        db_command_listener.reset()
+        st.rerun()
+
 def admin_page():
+    record_rerun()
+    
     # Check for existing session
     if 'admin_session_token' not in st.session_state:
         st.session_state['admin_session_token'] = None
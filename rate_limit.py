@@ -0,0 +1,160 @@
+"""Token-bucket admission control for questions sent to Gemini.
+
+Every question takes one token from two buckets: one for the session's
+user_id and one for its browser fingerprint (browser, OS, device and IP),
+which still applies when a client opens new sessions. A question refused
+by the second bucket gives its token back to the first. Buckets live in the
+rate_limits collection and are refilled and drawn in a single atomic
+pipeline update, so all server processes share them.
+
+Each process also remembers the tokens it last saw per bucket. Other
+processes can only take tokens away, so when that remembered count,
+refilled for the time since, is below one the request is refused without
+a round trip to MongoDB.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+import streamlit as st
+from pymongo import ReturnDocument
+from database import rate_limit_collection, write_spool
+
+# Burst size and refill rate of each bucket
+USER_CAPACITY = st.secrets.get("RATE_LIMIT_USER_CAPACITY", 10)
+USER_REFILL_PER_MINUTE = st.secrets.get("RATE_LIMIT_USER_PER_MINUTE", 6)
+FINGERPRINT_CAPACITY = st.secrets.get("RATE_LIMIT_FINGERPRINT_CAPACITY", 30)
+FINGERPRINT_REFILL_PER_MINUTE = st.secrets.get("RATE_LIMIT_FINGERPRINT_PER_MINUTE", 20)
+
+# Most recently used buckets remembered for the local pre-check
+LOCAL_BUCKETS = 10000
+
+_local_lock = threading.Lock()
+_local_tokens = OrderedDict()  # bucket key -> [tokens, time.time() when seen, refusals not yet stored]
+
+
+def _fingerprint_key(fingerprint):
+    return "fp:" + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:16]
+
+
+def _refilled(tokens, seen_at, capacity, rate_per_second):
+    return min(capacity, tokens + (time.time() - seen_at) * rate_per_second)
+
+
+def _local_check(key, capacity, rate_per_second):
+    """Seconds until a token can be available, judging by what this process last saw; 0 if unknown"""
+    with _local_lock:
+        seen = _local_tokens.get(key)
+        if seen is None:
+            return 0
+        tokens = _refilled(seen[0], seen[1], capacity, rate_per_second)
+        if tokens >= 1:
+            return 0
+        # Stored with the next shared update of this bucket
+        seen[2] += 1
+    return (1 - tokens) / rate_per_second
+
+
+def _take_token(key, capacity, rate_per_second, label):
+    """Refill and draw from one shared bucket in one update; returns the bucket after it"""
+    with _local_lock:
+        refused_locally = _local_tokens[key][2] if key in _local_tokens else 0
+    now = datetime.now(timezone.utc)
+    elapsed_seconds = {"$divide": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, 1000]}
+    bucket = rate_limit_collection.find_one_and_update(
+        {"_id": key},
+        [
+            {"$set": {
+                "tokens": {"$min": [
+                    capacity,
+                    {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed_seconds, rate_per_second]}]}
+                ]},
+                "updated_at": now,
+                "label": label,
+            }},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {
+                "tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "consumed": {"$add": [{"$ifNull": ["$consumed", 0]}, {"$cond": ["$allowed", 1, 0]}]},
+                "throttled": {"$add": [
+                    {"$ifNull": ["$throttled", 0]}, refused_locally, {"$cond": ["$allowed", 0, 1]}
+                ]},
+            }},
+        ],
+        projection={"tokens": 1, "allowed": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    with _local_lock:
+        pending = _local_tokens[key][2] - refused_locally if key in _local_tokens else 0
+        _local_tokens[key] = [bucket["tokens"], time.time(), pending]
+        _local_tokens.move_to_end(key)
+        if len(_local_tokens) > LOCAL_BUCKETS:
+            _local_tokens.popitem(last=False)
+    return bucket
+
+
+def _refund_token(key, capacity):
+    """Give back a token drawn by _take_token for a question another bucket refused"""
+    rate_limit_collection.update_one({"_id": key}, [{"$set": {
+        "tokens": {"$min": [capacity, {"$add": ["$tokens", 1]}]},
+        "consumed": {"$subtract": ["$consumed", 1]},
+    }}])
+    with _local_lock:
+        if key in _local_tokens:
+            _local_tokens[key][0] = min(capacity, _local_tokens[key][0] + 1)
+
+
+def check_rate_limit(user_id, fingerprint):
+    """Take a token for this question. Returns (allowed, seconds to wait when not allowed).
+
+    If MongoDB is unavailable (or chat writes are being spooled) the
+    request is allowed.
+    """
+    buckets = [
+        (f"user:{user_id}", USER_CAPACITY, USER_REFILL_PER_MINUTE / 60, user_id),
+        (_fingerprint_key(fingerprint), FINGERPRINT_CAPACITY, FINGERPRINT_REFILL_PER_MINUTE / 60, fingerprint),
+    ]
+    for key, capacity, rate, _ in buckets:
+        wait = _local_check(key, capacity, rate)
+        if wait:
+            return False, wait
+    if write_spool.degraded:
+        return True, 0
+    try:
+        taken = []
+        for key, capacity, rate, label in buckets:
+            bucket = _take_token(key, capacity, rate, label)
+            if not bucket["allowed"]:
+                # The question is refused, so the buckets it already drew from keep their token
+                for taken_key, taken_capacity in taken:
+                    _refund_token(taken_key, taken_capacity)
+                return False, (1 - bucket["tokens"]) / rate
+            taken.append((key, capacity))
+    except Exception as e:
+        print(f"Error checking rate limit: {str(e)}")
+    return True, 0
+
+
+def get_top_consumers(limit=20):
+    """Buckets that admitted the most questions (over the last day of activity)"""
+    rows = []
+    for bucket in rate_limit_collection.find({}, {"allowed": 0}).sort("consumed", -1).limit(limit):
+        kind, label = "User", bucket.get("label", "")
+        if bucket["_id"].startswith("fp:"):
+            kind = "Fingerprint"
+            try:
+                label = ", ".join(f"{k}: {v}" for k, v in json.loads(label).items() if v)
+            except ValueError:
+                pass
+        rows.append({
+            "type": kind,
+            "client": label,
+            "questions": bucket.get("consumed", 0),
+            "throttled": bucket.get("throttled", 0),
+            "tokens_left": round(bucket.get("tokens", 0), 1),
+            "last_seen": bucket.get("updated_at"),
+        })
+    return rows
@@ -0,0 +1,110 @@
+"""Retention for the live chat_history and users collections.
+
+Chats older than CHAT_RETENTION_DAYS are moved to chat_history_archive,
+a zstd-compressed collection that the admin page only queries on demand,
+so the live collection (and every dashboard scan over it) stays small.
+Anonymous users who never sent a message are expired by a TTL index on
+users (see database.ensure_user_ttl_index); this job backfills the
+message_count that index relies on for users created since by a server
+still running an earlier version.
+
+Archiving deletes from the shared database but waits for the analytics
+export, whose watermark lives on the local disk. Only the host that
+exports the snapshot (the one serving the admin dashboards) may archive;
+set ARCHIVE_OLD_CHATS = false in the secrets of every other app server.
+
+Run standalone with `python retention.py`, or let the admin page start it
+as a background thread via start_retention_job().
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pymongo.errors import BulkWriteError, CollectionInvalid
+from database import (
+    db,
+    chat_collection,
+    archive_collection,
+    CHAT_RETENTION_DAYS,
+    ARCHIVE_OLD_CHATS,
+    backfill_message_counts
+)
+from analytics_snapshot import read_watermark, EXPORT_LOOKBACK
+
+ARCHIVE_BATCH_SIZE = 1000
+RETENTION_INTERVAL = 6 * 3600  # seconds between background runs
+
+DUPLICATE_KEY = 11000
+
+
+def ensure_archive_collection():
+    """Create chat_history_archive with zstd block compression and its query indexes"""
+    if archive_collection.name not in db.list_collection_names():
+        try:
+            db.create_collection(
+                archive_collection.name,
+                storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+            )
+        except CollectionInvalid:
+            pass  # Created by another process in the meantime
+    archive_collection.create_index([("timestamp", -1), ("_id", -1)])
+    archive_collection.create_index([("user_id", 1), ("timestamp", -1), ("_id", -1)])
+
+
+def archive_old_chats(days=CHAT_RETENTION_DAYS):
+    """Move chats older than `days` to the archive. Returns the number of chats moved.
+
+    Each batch is copied before it is deleted, and a re-run skips chats
+    that are already archived, so an interrupted run loses nothing.
+    Chats the analytics snapshot has not exported yet are never archived,
+    so nothing is archived before the first export on this host.
+    """
+    watermark = read_watermark()
+    if not watermark or "inserted_at" not in watermark:
+        # No export yet, or one that has not caught up with inserted_at
+        return 0
+    ensure_archive_collection()
+    cutoff = min(
+        datetime.now(timezone.utc) - timedelta(days=days),
+        watermark["inserted_at"] - EXPORT_LOOKBACK
+    )
+
+    moved = 0
+    while True:
+        chats = list(
+            chat_collection.find({"timestamp": {"$lt": cutoff}})
+            .sort([("timestamp", 1), ("_id", 1)])
+            .limit(ARCHIVE_BATCH_SIZE)
+        )
+        if not chats:
+            return moved
+        try:
+            archive_collection.insert_many(chats, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+                raise
+        chat_collection.delete_many({"_id": {"$in": [chat["_id"] for chat in chats]}})
+        moved += len(chats)
+
+
+def run_retention_job(interval=RETENTION_INTERVAL):
+    """Apply the retention policy every `interval` seconds"""
+    while True:
+        try:
+            backfill_message_counts()
+            moved = archive_old_chats() if ARCHIVE_OLD_CHATS else 0
+            if moved:
+                print(f"Archived {moved} chats older than {CHAT_RETENTION_DAYS} days")
+        except Exception as e:
+            print(f"Error applying retention policy: {str(e)}")
+        time.sleep(interval)
+
+
+def start_retention_job():
+    """Start run_retention_job() in a daemon thread"""
+    thread = threading.Thread(target=run_retention_job, daemon=True, name="retention")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    run_retention_job()
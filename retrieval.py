@@ -0,0 +1,300 @@
+"""Semantic lookup over the website corpus and approved answers.
+
+Documents are embedded locally with a hashing embedding (no model download
+or network) and stored as rows of a float16 matrix in a .npy file, with
+one JSON line per row in a sidecar file. Every Streamlit process maps the
+matrix read-only, so the OS page cache holds one copy for all of them, and
+a lookup scores every row with matrix products over large blocks.
+
+New documents (answers an admin approves) are appended in place: the file
+is preallocated in chunks and the sidecar decides how many rows are live,
+so readers pick up appended rows without reloading the matrix.
+
+Run `python retrieval.py` after `python corpus.py` to rebuild the index
+from the corpus and every approved answer in MongoDB.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+import numpy as np
+import streamlit as st
+from assets import BUILD_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialised within a process
+    fcntl = None
+
+INDEX_DIR = os.path.join(BUILD_DIR, "retrieval")
+VECTORS_PATH = os.path.join(INDEX_DIR, "vectors.npy")
+METADATA_PATH = os.path.join(INDEX_DIR, "metadata.jsonl")
+LOCK_PATH = os.path.join(INDEX_DIR, ".lock")
+
+# Embedding width; 1M rows take 1 GB as float16
+DIM = 512
+# Rows the matrix grows by when an append does not fit
+GROWTH_ROWS = 4096
+# Rows converted to float32 and scored per matrix product
+SCORE_BLOCK_ROWS = 16384
+
+TOP_K = st.secrets.get("RETRIEVAL_TOP_K", 3)
+# A short question shares only a few features with a long passage, so
+# relevant passages score well below 1; unrelated ones score near 0
+MIN_SCORE = st.secrets.get("RETRIEVAL_MIN_SCORE", 0.05)
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it me my "
+    "of on or the there this to was what when where which who why will with you your".split()
+)
+
+_lock = threading.Lock()
+_write_thread_lock = threading.Lock()
+_index = None
+
+
+# -------------------------------
+# Embedding
+# -------------------------------
+def _features(text):
+    words = [w for w in re.findall(r"\w+", text.lower()) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def embed(texts):
+    """Unit-length float16 vectors of `texts` (words and word pairs hashed into DIM signed buckets)"""
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        features = _features(text)
+        if not features:
+            continue
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little") for f in features],
+            dtype=np.uint64
+        )
+        signs = np.where(hashes >> np.uint64(63), 1.0, -1.0)
+        np.add.at(vectors[row], (hashes % np.uint64(DIM)).astype(np.intp), signs)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float16)
+
+
+def _document_text(document):
+    return f"{document.get('title', '')}\n{document['text']}"
+
+
+# -------------------------------
+# Index files
+# -------------------------------
+class _Index:
+    """One process's read-only view of the index files.
+
+    Sidecar lines are located by their byte offsets and only parsed for
+    the rows a search returns, so opening a large index stays cheap.
+    """
+
+    def __init__(self, identity):
+        self.identity = identity
+        self.vectors = np.load(VECTORS_PATH, mmap_mode="r")
+        self.starts = np.zeros(0, dtype=np.int64)
+        self.size = 0
+        self._ids = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def refresh(self):
+        """Pick up sidecar lines appended since the last call"""
+        with open(METADATA_PATH, "rb") as f:
+            f.seek(self.size)
+            data = f.read()
+        # A line still being written has no newline yet
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n")) + self.size + 1
+        if len(ends):
+            starts = np.concatenate([[self.size], ends[:-1]])
+            self.starts = np.concatenate([self.starts, starts])
+            self.size = int(ends[-1])
+        return self
+
+    def documents(self, rows):
+        """Sidecar documents of the given row numbers"""
+        documents = []
+        with open(METADATA_PATH, "rb") as f:
+            for row in rows:
+                f.seek(self.starts[row])
+                documents.append(json.loads(f.readline()))
+        return documents
+
+    def ids(self):
+        """Ids of every indexed document (parsed once, then only new rows)"""
+        if self._ids is None:
+            self._ids = (set(), 0)
+        ids, parsed = self._ids
+        if parsed < len(self):
+            with open(METADATA_PATH, "rb") as f:
+                f.seek(self.starts[parsed])
+                for _ in range(len(self) - parsed):
+                    ids.add(json.loads(f.readline())["id"])
+            self._ids = (ids, len(self))
+        return ids
+
+
+def _load():
+    """The current index, reopened when either file was replaced; None if never built"""
+    global _index
+    try:
+        identity = (os.stat(VECTORS_PATH).st_ino, os.stat(METADATA_PATH).st_ino)
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if _index is None or _index.identity != identity:
+            _index = _Index(identity)
+        return _index.refresh()
+
+
+@contextmanager
+def _write_lock():
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    with _write_thread_lock, open(LOCK_PATH, "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_matrix(path, vectors, capacity):
+    matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=(capacity, DIM))
+    matrix[:len(vectors)] = vectors
+    matrix.flush()
+    del matrix
+
+
+def _build(documents):
+    vectors = embed([_document_text(d) for d in documents])
+    _write_matrix(VECTORS_PATH + ".tmp", vectors, len(documents) + GROWTH_ROWS)
+    with open(METADATA_PATH + ".tmp", "w", encoding="utf-8") as f:
+        for document in documents:
+            f.write(json.dumps(document, ensure_ascii=False) + "\n")
+    os.replace(VECTORS_PATH + ".tmp", VECTORS_PATH)
+    os.replace(METADATA_PATH + ".tmp", METADATA_PATH)
+    return len(documents)
+
+
+def build_index(documents):
+    """Replace the index with `documents` ({"id", "title", "text", ...} dicts)"""
+    with _write_lock():
+        return _build(documents)
+
+
+def append_documents(documents):
+    """Add documents whose id is not indexed yet; returns how many were added"""
+    with _write_lock():
+        index = _load()
+        if index is None:
+            return _build(documents)
+        indexed = index.ids()
+        documents = [d for d in documents if d["id"] not in indexed]
+        if not documents:
+            return 0
+        rows = len(index)
+        vectors = embed([_document_text(d) for d in documents])
+        if rows + len(vectors) > len(index.vectors):
+            # Grow into a new file; readers keep their old mapping until they reopen
+            capacity = max(2 * len(index.vectors), rows + len(vectors) + GROWTH_ROWS)
+            grown = np.concatenate([index.vectors[:rows], vectors])
+            _write_matrix(VECTORS_PATH + ".tmp", grown, capacity)
+            os.replace(VECTORS_PATH + ".tmp", VECTORS_PATH)
+        else:
+            matrix = np.load(VECTORS_PATH, mmap_mode="r+")
+            matrix[rows:rows + len(vectors)] = vectors
+            matrix.flush()
+            del matrix
+        # Rows become visible to readers once their sidecar lines exist
+        with open(METADATA_PATH, "a", encoding="utf-8") as f:
+            for document in documents:
+                f.write(json.dumps(document, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    return len(documents)
+
+
+# -------------------------------
+# Lookup
+# -------------------------------
+def score_rows(vectors, rows, query):
+    """Cosine similarity of `query` (float32) with the first `rows` rows of `vectors`.
+
+    float16 products have no BLAS kernel, so rows are upcast one block at
+    a time into a reused buffer and scored with a float32 matrix product.
+    """
+    scores = np.empty(rows, dtype=np.float32)
+    block = np.empty((min(SCORE_BLOCK_ROWS, rows), vectors.shape[1]), dtype=np.float32)
+    for start in range(0, rows, SCORE_BLOCK_ROWS):
+        end = min(start + SCORE_BLOCK_ROWS, rows)
+        np.copyto(block[:end - start], vectors[start:end])
+        np.dot(block[:end - start], query, out=scores[start:end])
+    return scores
+
+
+def top_k(scores, k):
+    """Indices of the `k` highest scores, best first"""
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+def search(query, k=TOP_K, min_score=MIN_SCORE):
+    """Up to `k` indexed documents most similar to `query`, each with its `score`"""
+    index = _load()
+    if index is None or not len(index):
+        return []
+    rows = min(len(index), len(index.vectors))
+    scores = score_rows(index.vectors, rows, embed([query])[0].astype(np.float32))
+    best = [i for i in top_k(scores, k) if scores[i] >= min_score]
+    return [
+        {**document, "score": round(float(scores[i]), 3)}
+        for i, document in zip(best, index.documents(best))
+    ]
+
+
+def retrieve(query, k=TOP_K):
+    """search() for the chat prompt; an unavailable index means no passages"""
+    try:
+        return search(query, k)
+    except Exception as e:
+        print(f"Error searching retrieval index: {str(e)}")
+        return []
+
+
+# -------------------------------
+# Documents
+# -------------------------------
+def answer_document(chat):
+    """Index document for an approved chat_history answer"""
+    return {
+        "id": f"chat:{chat['_id']}",
+        "kind": "answer",
+        "title": chat["user_message"],
+        "text": f"Q: {chat['user_message']}\nA: {chat['bot_response']}",
+    }
+
+
+def passage_document(passage):
+    return {**passage, "id": f"web:{passage['id']}", "kind": "website"}
+
+
+def approve_answer(chat):
+    """Make an approved answer available to retrieval right away"""
+    return append_documents([answer_document(chat)])
+
+
+if __name__ == "__main__":
+    from corpus import load_corpus
+    from database import get_approved_chats
+    documents = [passage_document(p) for p in load_corpus()]
+    documents += [answer_document(chat) for chat in get_approved_chats()]
+    print(f"Indexed {build_index(documents)} documents in {INDEX_DIR}")
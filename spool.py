@@ -0,0 +1,284 @@
+"""Local write-ahead spool for chat-path writes while MongoDB is slow or down.
+
+Saving a chat and the user heartbeat of every rerun go through WriteSpool.
+A write that fails with a connection error or timeout, or that takes
+longer than WRITE_TIMEOUT_SECONDS, opens the spool: the failed write and
+every later one of this process are appended to a local JSONL file
+(fsynced, one record per line) instead of waiting on the database. A
+background thread replays the file in order once the database answers
+again, and closes the spool when it has drained.
+
+Replays are idempotent, so a file can be replayed again after a crash
+half-way through, and a write that timed out here but still reached the
+server does not count twice:
+- inserts carry an _id made here; a duplicate key means already applied;
+- updates record their (spool, seq) on the document as spool_seq and are
+  only replayed onto documents whose spool_seq is from another spool or
+  older. One field per document, whichever process wrote last: a user's
+  writes all come from the process serving its session.
+
+A replayed insert whose document has an inserted_at gets the time of the
+replay there, so readers that follow insert time (the analytics export)
+see it as new rather than as a write from before the outage.
+
+Each process spools to its own files, holding a lock file while it lives.
+Files left behind by a process that died are replayed by the next
+replayer that finds them.
+"""
+import fcntl
+import glob
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+import pymongo
+import streamlit as st
+from bson import ObjectId, json_util
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, PyMongoError
+
+SPOOL_DIR = st.secrets.get("SPOOL_DIR", "./logs/spool")
+# Client-side timeout of each write; a write slower than this opens the spool
+WRITE_TIMEOUT_SECONDS = st.secrets.get("SPOOL_WRITE_TIMEOUT_SECONDS", 2.0)
+REPLAY_INTERVAL_SECONDS = 5
+
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+
+def _is_outage(error):
+    """Errors that mean the database could not take the write right now"""
+    return isinstance(error, ConnectionFailure) or error.timeout
+
+
+class WriteSpool:
+    """Writes of one process to `db`, spooled under `directory` while the database is unavailable"""
+
+    def __init__(self, db, directory=SPOOL_DIR, timeout=WRITE_TIMEOUT_SECONDS):
+        self.db = db
+        self.directory = directory
+        self.timeout = timeout
+        self.spool_id = "s" + uuid.uuid4().hex[:12]
+        self.degraded = False
+        self.stats = {"direct": 0, "spooled": 0, "replayed": 0, "already_applied": 0, "dropped": 0}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._batch = 0
+        self._file = None
+        self._pending = 0  # records in the current file
+        self._unreplayed = 0  # records in all of this process's files
+        self._lock_file = None
+        self._replayer = None
+
+    # -------------------------------
+    # Writes
+    # -------------------------------
+    def insert_one(self, collection, document):
+        """Insert `document` (given an _id here if it has none). Returns the _id."""
+        document.setdefault("_id", ObjectId())
+        self._write(collection, {"op": "insert", "document": document}, lambda seq: collection.insert_one(document))
+        return document["_id"]
+
+    def update_one(self, collection, filter, update):
+        """Update the first document matching `filter`; $set/$inc/... operators only"""
+        def direct(seq):
+            collection.update_one(filter, _marked(update, self.spool_id, seq))
+        self._write(collection, {"op": "update", "filter": filter, "update": update}, direct)
+
+    def _write(self, collection, record, direct):
+        """Run direct(seq) against the database, or spool `record`. True if it was written directly."""
+        with self._lock:
+            self._seq += 1
+            record.update(spool=self.spool_id, seq=self._seq, collection=collection.name)
+            if self.degraded:
+                self._append(record)
+                return False
+        start = time.monotonic()
+        try:
+            with pymongo.timeout(self.timeout):
+                direct(record["seq"])
+        except PyMongoError as e:
+            if not _is_outage(e):
+                raise
+            print(f"Error writing to {collection.name}, spooling it: {str(e)}")
+            with self._lock:
+                self.degraded = True
+                self._append(record)
+            return False
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self.stats["direct"] += 1
+            if elapsed > self.timeout and not self.degraded:
+                print(f"Slow write to {collection.name} ({elapsed:.1f}s), spooling until the database recovers")
+                self.degraded = True
+                self._start_replayer()
+        return True
+
+    def _append(self, record):
+        """Append `record` to this process's current spool file and fsync it (holding self._lock)"""
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            if self._lock_file is None:
+                self._lock_file = open(self._path(self.spool_id, "lock"), "a")
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._file = open(self._path(self.spool_id, f"{self._batch:06d}.jsonl"), "a", encoding="utf-8")
+        self._file.write(json_util.dumps(record, json_options=JSON_OPTIONS) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending += 1
+        self._unreplayed += 1
+        self.stats["spooled"] += 1
+        self._start_replayer()
+
+    # -------------------------------
+    # Replay
+    # -------------------------------
+    def _path(self, spool_id, suffix):
+        return os.path.join(self.directory, f"{spool_id}.{suffix}")
+
+    def _batches(self, spool_id):
+        return sorted(glob.glob(self._path(spool_id, "*.jsonl")))
+
+    def _apply(self, record):
+        """Apply one spooled record. True if it changed the database."""
+        collection = self.db[record["collection"]]
+        if record["op"] == "insert":
+            document = record["document"]
+            if "inserted_at" in document:
+                document["inserted_at"] = datetime.now(timezone.utc)
+            try:
+                collection.insert_one(document)
+                return True
+            except DuplicateKeyError:
+                return False
+        result = collection.update_one(
+            {"$and": [
+                record["filter"],
+                {"$or": [{"spool_seq.spool": {"$ne": record["spool"]}}, {"spool_seq.seq": {"$lt": record["seq"]}}]}
+            ]},
+            _marked(record["update"], record["spool"], record["seq"])
+        )
+        return result.modified_count > 0
+
+    def _replay_file(self, path):
+        """Replay every record of `path`. Returns the number of records, or None if the database failed part way."""
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+        for line in lines:
+            try:
+                record = json_util.loads(line, json_options=JSON_OPTIONS)
+            except ValueError:
+                continue  # torn last line of a process that died mid-append; never acknowledged
+            try:
+                with pymongo.timeout(self.timeout):
+                    applied = self._apply(record)
+            except PyMongoError as e:
+                if _is_outage(e):
+                    return None
+                print(f"Error replaying spooled write {record['spool']}:{record['seq']}, dropping it: {str(e)}")
+                self.stats["dropped"] += 1
+                continue
+            self.stats["replayed" if applied else "already_applied"] += 1
+        return len(lines)
+
+    def _orphans(self):
+        """Spool ids of other processes that left files here (alive or not)"""
+        spool_ids = {os.path.basename(p).split(".")[0] for p in glob.glob(self._path("*", "jsonl"))}
+        spool_ids.discard(self.spool_id)
+        return sorted(spool_ids)
+
+    def _replay_orphan(self, spool_id):
+        """Replay and remove the files of a dead process. False if the database failed part way."""
+        path = self._path(spool_id, "lock")
+        with open(path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True  # its process is alive, or another replayer has it
+            # Another replayer may have finished and removed the lock file since we
+            # opened it; then ours is an unlinked file (or a new one) that guards nothing
+            try:
+                if os.stat(path).st_ino != os.fstat(lock.fileno()).st_ino:
+                    return True
+            except FileNotFoundError:
+                return True
+            for batch in self._batches(spool_id):
+                if self._replay_file(batch) is None:
+                    return False
+                os.remove(batch)
+            os.remove(path)
+        return True
+
+    def _healthy(self):
+        """True if the database answers a ping within the write timeout"""
+        start = time.monotonic()
+        try:
+            with pymongo.timeout(self.timeout):
+                self.db.command("ping")
+        except PyMongoError:
+            return False
+        return time.monotonic() - start <= self.timeout
+
+    def drain(self):
+        """Replay everything spooled, in order. True once the spool is empty and closed."""
+        for spool_id in self._orphans():
+            if not self._replay_orphan(spool_id):
+                return False
+        while True:
+            with self._lock:
+                # Later writes start a new file, so this batch can be replayed without the lock
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                    self._batch += 1
+                    self._pending = 0
+                batches = self._batches(self.spool_id)
+            for path in batches:
+                replayed = self._replay_file(path)
+                if replayed is None:
+                    return False
+                os.remove(path)
+                with self._lock:
+                    self._unreplayed -= replayed
+            if batches:
+                continue
+            if self.degraded and not self._healthy():
+                return False
+            with self._lock:
+                if self._pending:
+                    continue
+                self.degraded = False
+                self._replayer = None
+                return True
+
+    def _run_replayer(self):
+        while True:
+            time.sleep(REPLAY_INTERVAL_SECONDS)
+            try:
+                if self.drain():
+                    print("Write spool drained")
+                    return
+            except Exception as e:
+                print(f"Error replaying write spool: {str(e)}")
+
+    def _start_replayer(self):
+        """Start the replay thread unless it is running (holding self._lock)"""
+        if self._replayer is None:
+            self._replayer = threading.Thread(target=self._run_replayer, daemon=True, name="write-spool-replayer")
+            self._replayer.start()
+
+    def start_replayer(self):
+        """Replay files left behind by earlier processes, if there are any"""
+        if os.path.isdir(self.directory) and self._orphans():
+            with self._lock:
+                self._start_replayer()
+
+    def report(self):
+        with self._lock:
+            return {**self.stats, "degraded": self.degraded, "pending": self._unreplayed}
+
+
+def _marked(update, spool_id, seq):
+    """`update` also recording (spool_id, seq) as the document's latest spoolable write"""
+    marked = dict(update)
+    marked["$set"] = {**update.get("$set", {}), "spool_seq": {"spool": spool_id, "seq": seq}}
+    return marked
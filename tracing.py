@@ -0,0 +1,204 @@
+"""Span-based latency tracing for the chat pipeline.
+
+Each request gets a Trace made of named spans (queue_wait, retrieval,
+model, persistence, ...). Finished traces are appended as JSON lines to a
+rotating file, and per-stage latencies are kept in memory so a Prometheus
+scrape of /metrics gets p50/p95/p99 for every stage.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from metrics import session_memory, cache_stats
+
+TRACE_DIR = "./logs"
+TRACE_FILE = os.path.join(TRACE_DIR, "traces.jsonl")
+TRACE_FILE_MAX_BYTES = 5 * 1024 * 1024
+TRACE_FILE_BACKUPS = 5
+
+# Percentiles are computed over this many most recent spans per stage
+STAGE_WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+
+_trace_logger = None
+_logger_lock = threading.Lock()
+
+
+def _get_trace_logger():
+    global _trace_logger
+    with _logger_lock:
+        if _trace_logger is None:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            handler = RotatingFileHandler(
+                TRACE_FILE, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("uniassist.traces")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _trace_logger = logger
+    return _trace_logger
+
+
+class StageStats:
+    """Recent durations, total count and sum (seconds) of every stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = {}
+        self._count = {}
+        self._sum = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self._recent.setdefault(stage, deque(maxlen=STAGE_WINDOW)).append(seconds)
+            self._count[stage] = self._count.get(stage, 0) + 1
+            self._sum[stage] = self._sum.get(stage, 0.0) + seconds
+
+    def summary(self):
+        """{stage: {"count", "sum", "quantiles": {q: seconds}}}"""
+        with self._lock:
+            result = {}
+            for stage, recent in self._recent.items():
+                ordered = sorted(recent)
+                result[stage] = {
+                    "count": self._count[stage],
+                    "sum": self._sum[stage],
+                    "quantiles": {
+                        q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES
+                    }
+                }
+            return result
+
+
+stage_stats = StageStats()
+
+
+class Trace:
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.spans = []
+        self.status = "ok"
+        self._start = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block as one stage of this trace"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, start)
+
+    def record(self, stage, seconds, start=None):
+        """Record a stage measured elsewhere (e.g. time to first token)"""
+        offset = (start or time.perf_counter() - seconds) - self._start
+        self.spans.append({"stage": stage, "start_ms": round(offset * 1000, 2), "ms": round(seconds * 1000, 2)})
+        stage_stats.observe(stage, seconds)
+
+    def elapsed_ms(self):
+        """Milliseconds since the trace started"""
+        return round((time.perf_counter() - self._start) * 1000, 2)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "status": self.status,
+            "total_ms": self.elapsed_ms(),
+            "attributes": self.attributes,
+            "spans": self.spans,
+        }
+
+
+@contextmanager
+def trace_request(name, **attributes):
+    """Trace one request; the whole block is recorded as the `total` stage"""
+    trace = Trace(name, **attributes)
+    try:
+        yield trace
+    except Exception:
+        trace.status = "error"
+        raise
+    finally:
+        stage_stats.observe("total", time.perf_counter() - trace._start)
+        try:
+            _get_trace_logger().info(json.dumps(trace.to_dict(), default=str))
+        except OSError as e:
+            print(f"Error writing trace: {str(e)}")
+
+
+# -------------------------------
+# Prometheus endpoint
+# -------------------------------
+def prometheus_text():
+    """Render stage latencies, session memory and cache counters in the Prometheus text format"""
+    lines = [
+        "# HELP uniassist_stage_latency_seconds Latency of each chat pipeline stage.",
+        "# TYPE uniassist_stage_latency_seconds summary",
+    ]
+    for stage, stats in sorted(stage_stats.summary().items()):
+        for q, value in stats["quantiles"].items():
+            lines.append(f'uniassist_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+        lines.append(f'uniassist_stage_latency_seconds_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+        lines.append(f'uniassist_stage_latency_seconds_count{{stage="{stage}"}} {stats["count"]}')
+    memory = session_memory.report()
+    lines += [
+        "# HELP uniassist_sessions Chat sessions that reported their memory in the last hour.",
+        "# TYPE uniassist_sessions gauge",
+        f"uniassist_sessions {memory['sessions']}",
+        "# HELP uniassist_session_memory_bytes Conversation state held in memory by chat sessions.",
+        "# TYPE uniassist_session_memory_bytes gauge",
+        f'uniassist_session_memory_bytes{{stat="total"}} {memory["total_bytes"]}',
+        f'uniassist_session_memory_bytes{{stat="p95"}} {memory["p95_bytes"]}',
+        f'uniassist_session_memory_bytes{{stat="max"}} {memory["max_bytes"]}',
+        "# HELP uniassist_cache_lookups_total Cache lookups and fills by namespace and outcome.",
+        "# TYPE uniassist_cache_lookups_total counter",
+    ]
+    for row in cache_stats.report():
+        for outcome in cache_stats.OUTCOMES:
+            lines.append(f'uniassist_cache_lookups_total{{namespace="{row["namespace"]}",outcome="{outcome}"}} {row[outcome]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics on `host`:`port` from a daemon thread; returns None if the port is taken.
+
+    Only local scrapers can reach it by default; pass host="0.0.0.0" to
+    expose it on every interface.
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        print(f"Metrics endpoint not started on {host}:{port}: {str(e)}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-endpoint").start()
+    return server
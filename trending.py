@@ -0,0 +1,205 @@
+"""Trending questions: a streaming top-K of what students ask.
+
+Every server process counts the questions its sessions send in one
+count-min sketch per IST day, next to a heap of the questions with the
+highest estimated counts (the heavy hitters). Recording a question costs
+SKETCH_DEPTH counter increments and a heap update, however many chats
+there are.
+
+A background thread saves each process's sketches to the
+trending_questions collection every FLUSH_SECONDS, one document per
+process and day. Sketches add up, so the admin Overview merges the
+documents of the days it shows and ranks the union of their heavy
+hitters by the merged counts. That costs the same at a thousand chats a
+week as at a million.
+
+Counts are estimates. A sketch never undercounts, and overcounts a
+question by more than e / SKETCH_WIDTH (about 0.13%) of the questions
+it has seen with probability at most e ** -SKETCH_DEPTH (about 2%).
+"""
+import atexit
+import hashlib
+import heapq
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytz
+from bson import Binary
+from retrieval import STOPWORDS
+
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+# Candidates kept per process and day; the Overview shows the top few of their union
+HEAVY_HITTERS = 50
+FLUSH_SECONDS = 60
+# Saved sketches expire after this many days
+RETAIN_DAYS = 8
+MAX_QUESTION_CHARS = 300
+
+_ROWS = np.arange(SKETCH_DEPTH)
+
+
+def normalise_question(text):
+    """Lower-cased words of `text` without stopwords or punctuation, so rewordings count together"""
+    return " ".join(w for w in re.findall(r"\w+(?:[.+#]\w+)*", text.lower()) if w not in STOPWORDS)
+
+
+def _columns(key):
+    """The sketch column of `key` in each row"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * SKETCH_DEPTH).digest()
+    return np.frombuffer(digest, dtype=np.uint32) % SKETCH_WIDTH
+
+
+def _today():
+    return datetime.now(pytz.timezone('Asia/Kolkata')).date().isoformat()
+
+
+class DaySketch:
+    """Count-min sketch and heavy hitters of one day's questions"""
+
+    def __init__(self, day):
+        self.day = day
+        self.counts = np.zeros((SKETCH_DEPTH, SKETCH_WIDTH), dtype=np.uint32)
+        self.total = 0
+        self.estimates = {}  # heavy hitter key -> estimated count
+        self.questions = {}  # heavy hitter key -> question as first asked
+        self._heap = []  # (estimate, key); entries older than self.estimates are skipped
+
+    def add(self, key, question):
+        columns = _columns(key)
+        self.counts[_ROWS, columns] += 1
+        self.total += 1
+        estimate = int(self.counts[_ROWS, columns].min())
+        if key not in self.estimates:
+            if len(self.estimates) >= HEAVY_HITTERS:
+                if estimate <= self._smallest():
+                    return
+                _, evicted = heapq.heappop(self._heap)
+                del self.estimates[evicted], self.questions[evicted]
+            self.questions[key] = question
+        self.estimates[key] = estimate
+        heapq.heappush(self._heap, (estimate, key))
+        if len(self._heap) > 4 * HEAVY_HITTERS:
+            self._heap = [(e, k) for k, e in self.estimates.items()]
+            heapq.heapify(self._heap)
+
+    def _smallest(self):
+        """Smallest heavy hitter estimate, dropping stale heap entries on the way"""
+        while self.estimates.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0]
+
+    def to_document(self, process_id):
+        now = datetime.now(timezone.utc)
+        return {
+            "_id": f"{self.day}:{process_id}",
+            "day": self.day,
+            "process": process_id,
+            "width": SKETCH_WIDTH,
+            "depth": SKETCH_DEPTH,
+            "total": self.total,
+            "counts": Binary(self.counts.tobytes()),
+            "heavy_hitters": [
+                {"key": key, "question": self.questions[key], "count": count}
+                for key, count in self.estimates.items()
+            ],
+            "updated_at": now,
+            "expires_at": now + timedelta(days=RETAIN_DAYS)
+        }
+
+
+class TrendingTracker:
+    """This process's day sketches, saved to `collection` every FLUSH_SECONDS"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.process_id = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._days = {}
+        self._dirty = set()
+        self._flusher = None
+
+    def record(self, question):
+        key = normalise_question(question)
+        if not key:
+            return
+        day = _today()
+        with self._lock:
+            sketch = self._days.get(day)
+            if sketch is None:
+                sketch = self._days[day] = DaySketch(day)
+            sketch.add(key, question.strip()[:MAX_QUESTION_CHARS])
+            self._dirty.add(day)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, daemon=True, name="trending-flush")
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def flush(self):
+        """Save the sketches that changed since the last flush"""
+        today = _today()
+        with self._lock:
+            documents = [self._days[day].to_document(self.process_id) for day in self._dirty]
+            self._dirty.clear()
+            # Earlier days get no more questions once they are saved
+            for day in [d for d in self._days if d != today]:
+                del self._days[day]
+        for i, document in enumerate(documents):
+            try:
+                self.collection.replace_one({"_id": document["_id"]}, document, upsert=True)
+            except Exception as e:
+                print(f"Error saving trending questions: {str(e)}")
+                with self._lock:
+                    for unsaved in documents[i:]:
+                        self._days.setdefault(unsaved["day"], _restore(unsaved))
+                        self._dirty.add(unsaved["day"])
+                return
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(FLUSH_SECONDS)
+            self.flush()
+
+
+def _restore(document):
+    """DaySketch of a saved document, to save it again later"""
+    sketch = DaySketch(document["day"])
+    sketch.counts = _counts(document).copy()
+    sketch.total = document["total"]
+    for hitter in document["heavy_hitters"]:
+        sketch.estimates[hitter["key"]] = hitter["count"]
+        sketch.questions[hitter["key"]] = hitter["question"]
+    sketch._heap = [(e, k) for k, e in sketch.estimates.items()]
+    heapq.heapify(sketch._heap)
+    return sketch
+
+
+def _counts(document):
+    return np.frombuffer(document["counts"], dtype=np.uint32).reshape(document["depth"], document["width"])
+
+
+def merge_top(documents, limit=10):
+    """Top `limit` questions of saved sketches (any processes and days).
+
+    Returns [{"question", "count", "share"}]; share is the percentage of
+    all questions counted in `documents`.
+    """
+    counts, questions, total = None, {}, 0
+    for document in documents:
+        if (document["depth"], document["width"]) != (SKETCH_DEPTH, SKETCH_WIDTH):
+            continue  # saved before the sketch size changed
+        day_counts = _counts(document).astype(np.uint64)
+        counts = day_counts if counts is None else counts + day_counts
+        total += document["total"]
+        for hitter in document["heavy_hitters"]:
+            questions.setdefault(hitter["key"], hitter["question"])
+    if counts is None:
+        return []
+    ranked = sorted(((int(counts[_ROWS, _columns(key)].min()), key) for key in questions), reverse=True)
+    return [
+        {"question": questions[key], "count": count, "share": round(count / total * 100, 1)}
+        for count, key in ranked[:limit]
+    ]
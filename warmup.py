@@ -0,0 +1,97 @@
+"""Precompute answers for the sidebar examples and the most asked questions.
+
+Answers are stored in cache.answer_cache under the current catalog
+version, so a course-data change makes every old answer unreachable and
+the next warm-up fills in answers that match the new catalog. Replicas
+warming at the same time share the work through the cache's leases.
+
+Run standalone with `python warmup.py`, or call start_warmup() to run it
+in a background thread (the admin page does so after editing courses).
+"""
+import threading
+import streamlit as st
+import google.generativeai as genai
+from assistant import build_request, example_questions
+from cache import answer_cache, answer_key, get_cached_course_data
+from database import get_top_questions
+from retrieval import retrieve
+
+WARMUP_TOP_QUESTIONS = st.secrets.get("WARMUP_TOP_QUESTIONS", 20)
+# Precomputed answers outlive ordinary cached answers; the catalog version retires them
+PRECOMPUTED_ANSWER_TTL = 30 * 24 * 3600
+
+_state_lock = threading.Lock()
+_state = {"running": False, "pending": False}
+
+
+def questions_to_warm(top_n=WARMUP_TOP_QUESTIONS):
+    """Example questions followed by the most asked ones, without duplicates"""
+    try:
+        mined = [row["question"] for row in get_top_questions(top_n)]
+    except Exception as e:
+        print(f"Error mining top questions: {str(e)}")
+        mined = []
+    questions = {}
+    for question in example_questions + mined:
+        questions.setdefault(" ".join(question.lower().split()), question)
+    return list(questions.values())
+
+
+def generate_answer(courses, question):
+    """Answer `question` as the opening message of a conversation"""
+    model, contents = build_request(courses, [], question, retrieve(question))
+    return model.generate_content(contents).text
+
+
+def warm_answers(top_n=WARMUP_TOP_QUESTIONS):
+    """Make sure every warm-up question has an answer for the current catalog.
+
+    Returns the number of answers available afterwards.
+    """
+    courses, catalog_version = get_cached_course_data()
+    warmed = 0
+    for question in questions_to_warm(top_n):
+        try:
+            answer_cache.get_or_compute(
+                answer_key(question, catalog_version),
+                lambda: generate_answer(courses, question),
+                PRECOMPUTED_ANSWER_TTL
+            )
+            warmed += 1
+        except Exception as e:
+            print(f"Error precomputing answer for {question!r}: {str(e)}")
+    return warmed
+
+
+def _run_warmups():
+    while True:
+        with _state_lock:
+            if not _state["pending"]:
+                _state["running"] = False
+                return
+            _state["pending"] = False
+        try:
+            warm_answers()
+        except Exception as e:
+            print(f"Error warming answers: {str(e)}")
+
+
+def start_warmup():
+    """Run warm_answers() in a daemon thread.
+
+    A request made while a warm-up is running (say, after a second catalog
+    edit) runs once more when it finishes instead of starting a new thread.
+    """
+    with _state_lock:
+        _state["pending"] = True
+        if _state["running"]:
+            return None
+        _state["running"] = True
+    thread = threading.Thread(target=_run_warmups, daemon=True, name="answer-warmup")
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
+    print(f"Precomputed {warm_answers()} answers")